@@ -0,0 +1,231 @@
+'''
+  A memory-mapped archive of many recorded games with random access to any turn of any game.
+
+  Layout (little-endian):
+    header    - 18 bytes: magic b"SGA1", version, keyframe interval K, number of games, file offset of the index
+    games     - one block per game: winner, number of turns, the byte lengths of the two player specs and the specs
+                (5 bytes plus the specs), then a keyframe every K turns
+                (29 bytes: the 25 heights and the squares of workers A, B, Y, Z, at turns K, 2K, ...), then the packed
+                TurnDeltas, 2 bytes per turn
+    index     - 8 bytes per game: the file offset of its block
+  Opening an archive maps the file and reads the 18-byte header, nothing else. Seeking to game G, turn T reads one
+  index entry, restores the keyframe at or before T and applies at most K - 1 deltas.
+
+  python archive.py build out.sga records.sgr [more.sgr ...] [--keyframe-interval K]
+  python archive.py show out.sga GAME TURN
+'''
+import argparse
+import mmap
+import struct
+from game import Game
+from geometry import NUM_SQUARES, square_index, square_location
+from record import GameRecord, RecordFormatError, read_records, encode_player_type, TURN, WINNER_CODES, WINNER_COLORS
+from save import GameSave, TurnDelta, WORKER_IDS
+
+MAGIC = b"SGA1"
+VERSION = 3  # 1 had 16-byte player types, 2 had 64-byte ones
+HEADER = struct.Struct("<4sBBIQ")
+GAME_HEADER = struct.Struct("<BHBB")  # followed by the two player specs
+KEYFRAME = struct.Struct(f"<{NUM_SQUARES}s4B")
+INDEX_ENTRY = struct.Struct("<Q")
+DEFAULT_KEYFRAME_INTERVAL = 8
+
+
+def _new_game():
+  return Game("random", "random", False, verbose=False, shared=False)
+
+_initial_save = None
+
+def _get_initial_save():
+  '''The GameSave of the starting position, built once'''
+  global _initial_save
+  if _initial_save is None:
+    _initial_save = _new_game().save()
+  return _initial_save
+
+def _pack_keyframe(game_save):
+  heights, worker_locations, _ = game_save.get_overall_game_state()
+  squares = dict(worker_locations)
+  return KEYFRAME.pack(heights, *(square_index(squares[worker_id]) for worker_id in WORKER_IDS))
+
+
+class ArchiveWriter:
+  '''Builds an archive one game at a time: add() replays each record once to take its keyframes'''
+
+  def __init__(self, path, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+    if not 1 <= keyframe_interval <= 255:
+      raise ValueError("the keyframe interval must be between 1 and 255 turns")
+    self._file = open(path, "wb")
+    self._keyframe_interval = keyframe_interval
+    self._offsets = []  # file offset of every game block written so far
+    self._file.write(HEADER.pack(MAGIC, VERSION, keyframe_interval, 0, 0))  # patched in close()
+
+  def add(self, record):
+    '''Append one GameRecord. The block is built in full first, so a record that fails (too long a spec...) leaves no trace.'''
+    p1_spec, p2_spec = encode_player_type(record.p1_type), encode_player_type(record.p2_type)
+    block = bytearray(GAME_HEADER.pack(WINNER_CODES[record.winner], len(record), len(p1_spec), len(p2_spec)) + p1_spec + p2_spec)
+    game = _new_game()
+    turns = bytearray()
+    for delta in record.deltas():
+      game.apply_delta(delta)
+      turns += TURN.pack(delta.pack())
+      if game.turn_index % self._keyframe_interval == 0:
+        block += _pack_keyframe(game.save())
+    self._offsets.append(self._file.tell())
+    self._file.write(block + turns)
+
+  def __len__(self):
+    '''The number of games added so far'''
+    return len(self._offsets)
+
+  def close(self):
+    '''Write the index and fill in the header'''
+    index_offset = self._file.tell()
+    for offset in self._offsets:
+      self._file.write(INDEX_ENTRY.pack(offset))
+    self._file.seek(0)
+    self._file.write(HEADER.pack(MAGIC, VERSION, self._keyframe_interval, len(self._offsets), index_offset))
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+def build_archive(path, records, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+  '''Write an archive of the GameRecords, in order'''
+  with ArchiveWriter(path, keyframe_interval) as writer:
+    for record in records:
+      writer.add(record)
+
+
+class GameArchive:
+  '''
+    A read-only view of an archive file through mmap. Everything is decoded on demand straight from the mapping,
+    so opening is O(1) whatever the archive's size, and only the pages actually touched get read from disk.
+  '''
+
+  def __init__(self, path):
+    with open(path, "rb") as file:
+      self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(self._data) < HEADER.size:
+      raise RecordFormatError("too short to be a game archive")
+    magic, version, self._keyframe_interval, self._num_games, self._index_offset = HEADER.unpack_from(self._data)
+    if magic != MAGIC or version != VERSION:
+      raise RecordFormatError(f"not a version {VERSION} game archive")
+
+  def _get_keyframe_interval(self):
+    return self._keyframe_interval
+  keyframe_interval = property(_get_keyframe_interval)
+
+  def __len__(self):
+    '''The number of games'''
+    return self._num_games
+
+  def _game_block(self, game_number):
+    '''(offset of the keyframes, winner code, number of turns, p1 spec, p2 spec) of one game'''
+    if not 0 <= game_number < self._num_games:
+      raise IndexError(f"game {game_number} is not in this {self._num_games}-game archive")
+    (offset,) = INDEX_ENTRY.unpack_from(self._data, self._index_offset + game_number * INDEX_ENTRY.size)
+    winner, num_turns, p1_size, p2_size = GAME_HEADER.unpack_from(self._data, offset)
+    p1_start = offset + GAME_HEADER.size
+    p2_start = p1_start + p1_size
+    keyframes_start = p2_start + p2_size
+    return (keyframes_start, winner, num_turns, self._data[p1_start:p2_start].decode(),
+            self._data[p2_start:keyframes_start].decode())
+
+  def _turns_offset(self, offset, num_turns):
+    return offset + num_turns // self._keyframe_interval * KEYFRAME.size
+
+  def info(self, game_number):
+    '''
+      Output:
+        tuple(str, str, str, int) - the white and blue player types, the winner's color (None if unfinished), the number of turns
+    '''
+    _, winner, num_turns, p1_type, p2_type = self._game_block(game_number)
+    return p1_type, p2_type, WINNER_COLORS[winner], num_turns
+
+  def record(self, game_number):
+    '''One game as a GameRecord (copies its turns out of the mapping)'''
+    offset, winner, num_turns, p1_type, p2_type = self._game_block(game_number)
+    start = self._turns_offset(offset, num_turns)
+    return GameRecord(p1_type, p2_type, WINNER_COLORS[winner], self._data[start:start + num_turns * TURN.size])
+
+  def delta(self, game_number, turn_index):
+    '''The TurnDelta of the turn played at turn_index in one game'''
+    offset, _, num_turns, _, _ = self._game_block(game_number)
+    if not 0 <= turn_index < num_turns:
+      raise IndexError(f"turn {turn_index} is not in this {num_turns}-turn game")
+    (code,) = TURN.unpack_from(self._data, self._turns_offset(offset, num_turns) + turn_index * TURN.size)
+    return TurnDelta.unpack(code)
+
+  def keyframe(self, game_number, turn_index):
+    '''The GameSave of the last keyframe at or before turn_index, or None when that is the initial position'''
+    offset, _, num_turns, _, _ = self._game_block(game_number)
+    number = min(turn_index, num_turns) // self._keyframe_interval
+    if number == 0:
+      return None
+    heights, *squares = KEYFRAME.unpack_from(self._data, offset + (number - 1) * KEYFRAME.size)
+    return GameSave(heights, {worker_id: square_location(square) for worker_id, square in zip(WORKER_IDS, squares)},
+                    number * self._keyframe_interval)
+
+  def position(self, game_number, turn_index, game=None):
+    '''
+      The position at the start of turn_index of one game: the nearest keyframe plus fewer than K deltas
+      Input:
+        game - Game, restored in place if given (saves building Players/Workers when seeking a lot), else a new headless one
+      Output:
+        Game
+    '''
+    offset, _, num_turns, _, _ = self._game_block(game_number)
+    if not 0 <= turn_index <= num_turns:
+      raise IndexError(f"turn {turn_index} is not in this {num_turns}-turn game")
+    keyframe = self.keyframe(game_number, turn_index)
+    if game is None:
+      game = _new_game()
+      if keyframe is not None:
+        game.restore(keyframe)
+    else:
+      game.restore(keyframe if keyframe is not None else _get_initial_save())
+    turns_offset = self._turns_offset(offset, num_turns)
+    for index in range(game.turn_index, turn_index):
+      (code,) = TURN.unpack_from(self._data, turns_offset + index * TURN.size)
+      game.apply_delta(TurnDelta.unpack(code))
+    return game
+
+  def close(self):
+    self._data.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Build or query a memory-mapped game archive.")
+  commands = parser.add_subparsers(dest="command", required=True)
+  build = commands.add_parser("build", help="archive the games of one or more record files")
+  build.add_argument("archive")
+  build.add_argument("records", nargs="+")
+  build.add_argument("--keyframe-interval", type=int, default=DEFAULT_KEYFRAME_INTERVAL)
+  show = commands.add_parser("show", help="print the board of one game at one turn")
+  show.add_argument("archive")
+  show.add_argument("game", type=int)
+  show.add_argument("turn", type=int)
+  options = parser.parse_args()
+
+  if options.command == "build":
+    with ArchiveWriter(options.archive, options.keyframe_interval) as writer:
+      for path in options.records:
+        for record in read_records(path):
+          writer.add(record)
+    print(f"{len(writer)} games archived")
+  else:
+    with GameArchive(options.archive) as archive:
+      p1_type, p2_type, winner, num_turns = archive.info(options.game)
+      print(f"game {options.game}: {p1_type} vs {p2_type}, {num_turns} turns, winner {winner}")
+      print(archive.position(options.game, options.turn))
@@ -0,0 +1,193 @@
+'''
+  A vectorized engine that steps N games at once with NumPy, for training data and large tournaments.
+  Boards are an (N, 5, 5) array of heights plus an (N, 4, 2) array of worker (row, col), workers in A, B, Y, Z order.
+  Legal-move masks, win/lose checks and the HeuristicPlayer move-score components are computed for all boards
+  in one go, and the heuristic/random policies step every ongoing board at once.
+'''
+import numpy as np
+from evaluation import DEFAULT_WEIGHTS
+from geometry import BOARD_SIZE, NUM_SQUARES, DIRECTION_DELTAS, CENTER_WEIGHTS, DISTANCES, NEIGHBOR_SQUARES, SQUARE_LOCATIONS
+from save import GameSave, WORKER_IDS
+
+START_LOCATIONS = ((3, 1), (1, 3), (1, 1), (3, 3))  # A, B, Y, Z, as placed by Player.initialize_workers
+DELTAS = np.array(list(DIRECTION_DELTAS.values()), dtype=np.int8)  # (8, 2), in Worker.WORKER_MOVES order
+CENTER_GRID = np.array(CENTER_WEIGHTS, dtype=np.int8).reshape(BOARD_SIZE, BOARD_SIZE)
+# the geometry tables, indexed by (row, col) instead of square
+NEIGHBOR_GRID = np.array([[SQUARE_LOCATIONS[n] if n >= 0 else SQUARE_LOCATIONS[square] for n in NEIGHBOR_SQUARES[square]]
+                          for square in range(NUM_SQUARES)], dtype=np.int8).reshape(BOARD_SIZE, BOARD_SIZE, 8, 2)  # off-board -> itself
+IN_BOUNDS_GRID = np.array([[n >= 0 for n in NEIGHBOR_SQUARES[square]] for square in range(NUM_SQUARES)]).reshape(BOARD_SIZE, BOARD_SIZE, 8)
+DISTANCE_GRID = np.array(DISTANCES, dtype=np.int8).reshape((BOARD_SIZE,) * 4)  # [row_a, col_a, row_b, col_b]
+POLICIES = ("heuristic", "random")
+
+
+class BatchGame:
+  '''
+    N independent games stepped together. Decided games stay frozen while the others keep playing.
+    NOTE: HeuristicPlayer treats a running max score of 0 as "no score yet"; that sequential quirk of a 0-score
+    position is not reproduced here, candidates are simply ranked by score with ties broken uniformly at random.
+  '''
+
+  def __init__(self, num_games, seed=None):
+    self._num_games = num_games
+    self._rng = np.random.default_rng(seed)
+    self.reset()
+
+  def reset(self):
+    '''Put every board back to the starting position'''
+    n = self._num_games
+    self.heights = np.zeros((n, BOARD_SIZE, BOARD_SIZE), dtype=np.int8)
+    self.workers = np.tile(np.array(START_LOCATIONS, dtype=np.int8), (n, 1, 1))  # (N, 4, 2)
+    self.turns = np.zeros(n, dtype=np.int32)  # number of turns played, its parity is the side to move
+    self.winners = np.full(n, -1, dtype=np.int8)  # -1 while the game is on, else 0 (white) or 1 (blue)
+
+  def _get_ongoing(self):
+    '''Boolean (N,) mask of the games that are still on'''
+    return self.winners < 0
+  ongoing = property(_get_ongoing)
+
+  def _get_side_to_move(self):
+    '''(N,) array of 0 (white) / 1 (blue)'''
+    return self.turns % 2
+  side_to_move = property(_get_side_to_move)
+
+  def _heights_at(self, locations):
+    '''Heights under an (N, ..., 2) array of in-bounds locations'''
+    index = np.arange(self._num_games).reshape((-1,) + (1,) * (locations.ndim - 2))
+    return self.heights[index, locations[..., 0], locations[..., 1]]
+
+  def _targets(self, origins):
+    '''
+      The squares one step away in all 8 directions, looked up in the geometry tables
+      Input:
+        origins - (N, W, 2) locations
+      Output:
+        tuple((N, W, 8, 2) locations (off-board ones replaced by the origin), (N, W, 8) in-bounds mask)
+    '''
+    return NEIGHBOR_GRID[origins[..., 0], origins[..., 1]], IN_BOUNDS_GRID[origins[..., 0], origins[..., 1]]
+
+  def _occupancy(self, workers):
+    '''(N, 5, 5) mask of the squares holding one of workers (N, K, 2)'''
+    occupancy = np.zeros((len(workers), BOARD_SIZE, BOARD_SIZE), dtype=bool)
+    occupancy[np.arange(len(workers))[:, None], workers[..., 0], workers[..., 1]] = True
+    return occupancy
+
+  def all_legal_move_masks(self):
+    '''(N, 4, 8) legal move mask of every worker, A, B, Y, Z: free, on the board and at most one level up'''
+    targets, in_bounds = self._targets(self.workers)
+    climbable = self._heights_at(targets) <= self._heights_at(self.workers)[:, :, None] + 1
+    occupied = self._occupancy(self.workers)[np.arange(self._num_games)[:, None, None], targets[..., 0], targets[..., 1]]
+    return in_bounds & climbable & ~occupied
+
+  def _side_workers(self, array, side):
+    '''Select the two entries of the given side (N,) from an (N, 4, ...) array'''
+    index = side[:, None] * 2 + np.arange(2)[None, :]
+    return np.take_along_axis(array, index.reshape(index.shape + (1,) * (array.ndim - 2)), axis=1)
+
+  def legal_move_mask(self):
+    '''(N, 2, 8) legal move mask of the two workers of the side to move'''
+    return self._side_workers(self.all_legal_move_masks(), self.side_to_move)
+
+  def update_winners(self, all_legal_move_masks=None):
+    '''
+      Decide the games that are over, exactly like Game.run_one_step does at the start of a turn
+      Input:
+        all_legal_move_masks - the current all_legal_move_masks(), if the caller already has them
+    '''
+    if all_legal_move_masks is None:
+      all_legal_move_masks = self.all_legal_move_masks()
+    on_level_3 = self._heights_at(self.workers) == 3  # (N, 4)
+    can_move = all_legal_move_masks.any(axis=-1)  # (N, 4)
+    wins = on_level_3.reshape(-1, 2, 2).any(axis=-1)  # (N, 2) per side
+    loses = ~wins & ~can_move.reshape(-1, 2, 2).any(axis=-1)
+    current = self.side_to_move
+    rows = np.arange(self._num_games)
+    current_wins, current_loses = wins[rows, current], loses[rows, current]
+    opponent_wins, opponent_loses = wins[rows, 1 - current], loses[rows, 1 - current]
+    decided_for_current = current_wins | opponent_loses
+    decided_for_opponent = ~decided_for_current & (current_loses | opponent_wins)
+    newly_decided = self.ongoing & (decided_for_current | decided_for_opponent)
+    self.winners[newly_decided] = np.where(decided_for_current, current, 1 - current)[newly_decided]
+
+  def move_score_components(self):
+    '''
+      The (height, center, distance) components the side to move would have after each candidate move,
+      the vectorized form of Player.calculate_move_score_components
+      Output:
+        (N, 2, 8, 3) int array, indexed by (board, worker of the side, direction, component)
+    '''
+    side = self.side_to_move
+    own = self._side_workers(self.workers, side)  # (N, 2, 2)
+    opponents = self._side_workers(self.workers, 1 - side)  # (N, 2, 2)
+    targets, _ = self._targets(own)  # (N, 2, 8, 2)
+    partner = own[:, ::-1, None, :]  # the side's other worker, which stays put: (N, 2, 1, 2)
+
+    height = self._heights_at(targets).astype(np.int32) + self._heights_at(partner)
+    center = CENTER_GRID[targets[..., 0], targets[..., 1]].astype(np.int32) + CENTER_GRID[partner[..., 0], partner[..., 1]]
+    # Chebyshev distance from each opponent worker to the moved worker and to the partner: (N, 2, 8, opponents)
+    opponent_rows, opponent_cols = opponents[:, None, None, :, 0], opponents[:, None, None, :, 1]
+    to_moved = DISTANCE_GRID[targets[..., 0, None], targets[..., 1, None], opponent_rows, opponent_cols]
+    to_partner = DISTANCE_GRID[partner[..., 0, None], partner[..., 1, None], opponent_rows, opponent_cols]
+    distance = 8 - np.minimum(to_moved, to_partner).sum(axis=-1, dtype=np.int32)
+    return np.stack([height, center, distance.astype(np.int32)], axis=-1)
+
+  def _random_choice(self, mask):
+    '''Index of a uniformly random True entry of each row of an (N, K) mask (0 for empty rows)'''
+    return np.argmax(self._rng.random(mask.shape) * mask, axis=1)
+
+  def _choose_moves(self, policies, move_mask, weights):
+    '''(N,) flat index (worker * 8 + direction) of the move each board's side to move picks'''
+    flat_mask = move_mask.reshape(self._num_games, -1)
+    random_moves = self._random_choice(flat_mask)
+    if "heuristic" not in policies:
+      return random_moves
+    side_weights = np.array(weights, dtype=np.float64)[self.side_to_move]  # (N, 3)
+    scores = (self.move_score_components() * side_weights[:, None, None, :]).sum(axis=-1).reshape(self._num_games, -1)
+    scores = np.where(flat_mask, scores, -np.inf)
+    heuristic_moves = self._random_choice(flat_mask & (scores == scores.max(axis=1, keepdims=True)))
+    uses_heuristic = np.array([policy == "heuristic" for policy in policies])[self.side_to_move]
+    return np.where(uses_heuristic, heuristic_moves, random_moves)
+
+  def step(self, policies=("heuristic", "random"), weights=(DEFAULT_WEIGHTS, DEFAULT_WEIGHTS)):
+    '''
+      Play one turn on every ongoing board: decide finished games first, then move and build
+      Input:
+        policies - (white policy, blue policy), each "heuristic" or "random" (builds are random for both, like the players)
+        weights - (white weights, blue weights), the (height, center, distance) weights of each heuristic policy
+    '''
+    all_legal_move_masks = self.all_legal_move_masks()
+    self.update_winners(all_legal_move_masks)
+    active = np.flatnonzero(self.ongoing)
+    if not len(active):
+      return
+    side = self.side_to_move
+    moves = self._choose_moves(policies, self._side_workers(all_legal_move_masks, side), weights)[active]
+    worker_index = side[active] * 2 + moves // 8
+    new_locations = self.workers[active, worker_index] + DELTAS[moves % 8]
+    self.workers[active, worker_index] = new_locations
+
+    # builds: around the new square, on the board, not on a worker and not on a dome
+    targets, in_bounds = self._targets(new_locations[:, None, :])
+    rows = np.arange(len(active))[:, None, None]
+    occupied = self._occupancy(self.workers[active])[rows, targets[..., 0], targets[..., 1]]
+    build_mask = in_bounds & ~occupied & (self.heights[active[:, None, None], targets[..., 0], targets[..., 1]] < 4)
+    build_locations = targets[rows[:, 0, 0], 0, self._random_choice(build_mask[:, 0, :])]
+    self.heights[active, build_locations[:, 0], build_locations[:, 1]] += 1
+    self.turns[active] += 1
+
+  def play(self, policies=("heuristic", "random"), max_turns=500, weights=(DEFAULT_WEIGHTS, DEFAULT_WEIGHTS)):
+    '''
+      Step until every game is decided (see step for policies and weights)
+      Output:
+        tuple((N,) winners, (N,) game lengths in turns)
+    '''
+    for _ in range(max_turns):
+      if not self.ongoing.any():
+        break
+      self.step(policies, weights)
+    self.update_winners()
+    return self.winners.copy(), self.turns.copy()
+
+  def game_save(self, index):
+    '''The position of one board as a GameSave, so a Game can restore() it'''
+    worker_locations = {worker_id: tuple(int(x) for x in self.workers[index, i]) for i, worker_id in enumerate(WORKER_IDS)}
+    return GameSave(self.heights[index].flatten().tolist(), worker_locations, int(self.turns[index]))
@@ -0,0 +1,229 @@
+'''
+  Benchmarks of the engine hot paths on fixed-seed scenarios: the opening position, crowded late-game boards and
+  long undo histories. Reports ops/sec and percentile latencies per function plus full games/sec, and the memory
+  allocated per turn (tracemalloc), and saves them as JSON so a later run can be compared against it to catch regressions.
+
+  python benchmark.py [--output results.json] [--compare baseline.json] [--threshold 0.15] [--quick]
+'''
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from game import Game
+from save import GameHistory
+from simulate import play_headless_game
+
+SEED = 327
+
+
+def _percentile(sorted_samples, fraction):
+  return sorted_samples[min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))]
+
+def _summarize(samples, calls_per_sample):
+  '''ops/sec and p50/p90/p99 latency (microseconds per call) from a list of per-sample durations in seconds'''
+  per_call = sorted(sample / calls_per_sample for sample in samples)
+  total_time = sum(samples)
+  return {
+    "ops_per_sec": len(samples) * calls_per_sample / total_time if total_time > 0 else float("inf"),
+    "p50_us": _percentile(per_call, 0.50) * 1e6,
+    "p90_us": _percentile(per_call, 0.90) * 1e6,
+    "p99_us": _percentile(per_call, 0.99) * 1e6,
+    "calls": len(samples) * calls_per_sample,
+  }
+
+def measure(func, samples, calls_per_sample=100):
+  '''Time func() in groups of calls_per_sample calls (so sub-microsecond calls don't drown in timer overhead)'''
+  durations = []
+  for _ in range(samples):
+    start = time.perf_counter()
+    for _ in range(calls_per_sample):
+      func()
+    durations.append(time.perf_counter() - start)
+  return _summarize(durations, calls_per_sample)
+
+def measure_each(func, samples, setup=None, teardown=None):
+  '''Time func() one call at a time, with untimed setup()/teardown() around every call (for calls that mutate the game)'''
+  durations = []
+  for _ in range(samples):
+    if setup:
+      setup()
+    start = time.perf_counter()
+    func()
+    durations.append(time.perf_counter() - start)
+    if teardown:
+      teardown()
+  return _summarize(durations, 1)
+
+
+def _new_game(p1_type="heuristic", p2_type="heuristic"):
+  return Game(p1_type, p2_type, False, verbose=False, shared=False)
+
+def opening_position():
+  '''The starting position'''
+  return _new_game()
+
+def late_game_position(min_total_height=30):
+  '''A crowded board: a seeded random vs random game played until the board holds min_total_height levels'''
+  attempt = 0
+  while True:
+    random.seed(f"{SEED}-late-{attempt}")
+    setup_game = _new_game("random", "random")
+    while not setup_game.run_one_step():
+      if sum(setup_game.board.heights) >= min_total_height:
+        game = _new_game()  # heuristic players, so make_decision can be benchmarked on the position
+        game.restore(setup_game.save())
+        return game
+    attempt += 1
+
+def long_history_game():
+  '''A full seeded random vs random game (40-odd turns) recorded into an undo history with snapshots'''
+  random.seed(f"{SEED}-history")
+  game = _new_game("random", "random")
+  history = GameHistory(snapshot_interval=8)
+  game.attach_history(history)
+  while not game.run_one_step():
+    pass
+  return game, history
+
+
+def bench_position(name, game, results, samples):
+  '''The per-function benchmarks on one position'''
+  player = game.get_current_player()
+  worker = player.get_worker(next(iter(player.worker_ids)))
+  location = worker.location
+  neighbor = (location[0] + (1 if location[0] < 4 else -1), location[1])
+  snapshot = game.save()
+
+  results[f"{name}.check_new_location_validity"] = measure(
+    lambda: game.check_new_location_validity(location, neighbor, "move"), samples)
+  results[f"{name}.find_legal_moves"] = measure(lambda: worker.find_legal_moves("move"), samples)
+  results[f"{name}.check_game_ongoing"] = measure(player.check_game_ongoing, samples)
+  results[f"{name}.game_save"] = measure(game.save, samples)
+  legal_moves = player.check_game_ongoing()
+  random.seed(SEED)
+  results[f"{name}.heuristic_make_decision"] = measure_each(
+    lambda: player.make_decision(legal_moves), samples, teardown=lambda: game.restore(snapshot))
+  game.restore(snapshot)
+
+def bench_history(game, history, results, samples):
+  '''Undo/redo/seek over a long recorded history'''
+  length = len(history)
+  results["history.undo_redo"] = measure(lambda: (history.undo(game), history.redo(game)), samples)
+  random.seed(SEED)
+  turns = [random.randrange(length + 1) for _ in range(samples)]
+  results["history.seek"] = measure_each(lambda: history.seek(game, turns.pop()), samples)
+  history.seek(game, length)
+
+def bench_full_games(results, num_games):
+  '''Whole headless games, heuristic vs random, start to finish'''
+  durations = []
+  for index in range(num_games):
+    random.seed(f"{SEED}-{index}")
+    start = time.perf_counter()
+    play_headless_game("heuristic", "random")
+    durations.append(time.perf_counter() - start)
+  results["full_game.heuristic_vs_random"] = _summarize(durations, 1)
+  results["full_game.heuristic_vs_random"]["games_per_sec"] = results["full_game.heuristic_vs_random"].pop("ops_per_sec")
+
+def measure_allocations(p1_type, p2_type, num_games):
+  '''
+    Memory churn of run_one_step under tracemalloc: the peak bytes allocated on top of what was live before the turn,
+    averaged over every turn of num_games seeded headless games (lower means less garbage per turn)
+  '''
+  turns = transient_bytes = 0
+  tracemalloc.start()
+  for index in range(num_games):
+    random.seed(f"{SEED}-{index}")
+    game = _new_game(p1_type, p2_type)
+    while True:
+      tracemalloc.reset_peak()
+      live_before = tracemalloc.get_traced_memory()[0]
+      winner = game.run_one_step()
+      transient_bytes += tracemalloc.get_traced_memory()[1] - live_before
+      turns += 1
+      if winner:
+        break
+  tracemalloc.stop()
+  return {"bytes_per_turn": transient_bytes / turns, "turns": turns}
+
+
+def run_benchmarks(quick=False):
+  '''Run every scenario, return the JSON-able report'''
+  samples = 50 if quick else 300
+  results = {}
+  bench_position("opening", opening_position(), results, samples)
+  bench_position("late_game", late_game_position(), results, samples)
+  game, history = long_history_game()
+  bench_history(game, history, results, samples)
+  bench_full_games(results, 50 if quick else 300)
+  allocations = {f"{p1_type}_vs_{p2_type}": measure_allocations(p1_type, p2_type, 10 if quick else 50)
+                 for p1_type, p2_type in (("heuristic", "random"), ("random", "random"))}
+  return {
+    "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+             "platform": platform.platform(), "seed": SEED, "quick": quick},
+    "results": results,
+    "allocations": allocations,
+  }
+
+def _throughput(result):
+  return result.get("ops_per_sec", result.get("games_per_sec"))
+
+def compare(report, baseline, threshold):
+  '''
+    Compare throughputs against a baseline report
+    Output:
+      tuple(list[str], bool) - one line per benchmark, and whether anything slowed down by more than threshold (a fraction)
+  '''
+  lines, regressed = [], False
+  for name, result in report["results"].items():
+    if name not in baseline["results"]:
+      continue
+    ratio = _throughput(result) / _throughput(baseline["results"][name])
+    flag = ""
+    if ratio < 1 - threshold:
+      flag, regressed = "  <-- REGRESSION", True
+    lines.append(f"{name:45s} {ratio:6.2f}x{flag}")
+  for name, result in report.get("allocations", {}).items():
+    if name not in baseline.get("allocations", {}):
+      continue
+    ratio = result["bytes_per_turn"] / baseline["allocations"][name]["bytes_per_turn"]
+    flag = ""
+    if ratio > 1 + threshold:
+      flag, regressed = "  <-- REGRESSION", True
+    lines.append(f"{'allocations.' + name:45s} {ratio:6.2f}x bytes/turn{flag}")
+  return lines, regressed
+
+def format_report(report):
+  '''One line per benchmark: throughput and latency percentiles'''
+  lines = []
+  for name, result in report["results"].items():
+    unit = "games/sec" if "games_per_sec" in result else "ops/sec"
+    lines.append(f"{name:45s} {_throughput(result):12.0f} {unit:9s}  p50 {result['p50_us']:9.1f}us  "
+                 f"p90 {result['p90_us']:9.1f}us  p99 {result['p99_us']:9.1f}us")
+  for name, result in report.get("allocations", {}).items():
+    lines.append(f"{'allocations.' + name:45s} {result['bytes_per_turn']:12.0f} bytes/turn allocated (tracemalloc peak)")
+  return "\n".join(lines)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Benchmark the engine hot paths.")
+  parser.add_argument("--output", help="write the results to this JSON file")
+  parser.add_argument("--compare", help="a previous JSON result to compare against")
+  parser.add_argument("--threshold", type=float, default=0.15, help="slowdown fraction that counts as a regression")
+  parser.add_argument("--quick", action="store_true", help="fewer samples, for a smoke run")
+  options = parser.parse_args()
+
+  report = run_benchmarks(options.quick)
+  print(format_report(report))
+  if options.output:
+    with open(options.output, "w") as file:
+      json.dump(report, file, indent=2)
+  if options.compare:
+    with open(options.compare) as file:
+      lines, regressed = compare(report, json.load(file), options.threshold)
+    print("\n".join(lines))
+    if regressed:
+      sys.exit(1)
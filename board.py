@@ -0,0 +1,114 @@
+'''
+  The compact board engine behind Game.
+  Squares are indexed 0-24 as row * 5 + col, so every set of squares fits in one int bitmask.
+  The neighbor masks are precomputed in geometry.py, which turns move/build generation into a few bitwise operations.
+'''
+from geometry import BOARD_SIZE, NUM_SQUARES, NEIGHBOR_MASKS, DIRECTION_BITS, DIRECTION_SETS
+
+DOME_LEVEL = 4  # a square at this level is capped and can't be built on anymore
+FULL_MASK = (1 << NUM_SQUARES) - 1
+
+
+class Board:
+  '''
+    Heights and worker occupancy of the 5x5 board, stored as bitmasks.
+    _level_masks[k] holds the squares whose height is at least k, so "too high to climb" and "domed" are single lookups.
+    _heights mirrors the masks as a flat list for O(1) height reads.
+  '''
+
+  def __init__(self):
+    self._heights = [0] * NUM_SQUARES
+    self._level_masks = [FULL_MASK] + [0] * DOME_LEVEL  # index 0..DOME_LEVEL
+    self._worker_mask = 0
+
+  @classmethod
+  def from_heights(cls, heights):
+    '''A board with the given 25 heights and no workers on it'''
+    board = cls()
+    for square, height in enumerate(heights):
+      for _ in range(height):
+        board.build(square)
+    return board
+
+  def copy(self):
+    '''Return an independent copy of this board (a handful of ints, no nested lists)'''
+    board = Board.__new__(Board)
+    board._heights = self._heights[:]
+    board._level_masks = self._level_masks[:]
+    board._worker_mask = self._worker_mask
+    return board
+
+  def height(self, square):
+    '''The building level at the square: 0-3, or DOME_LEVEL for a dome'''
+    return self._heights[square]
+
+  def _get_heights(self):
+    '''The getter method that returns the heights of all 25 squares, read-only'''
+    return tuple(self._heights)
+  heights = property(_get_heights)
+
+  def _get_worker_mask(self):
+    '''The getter method that returns the bitmask of squares occupied by workers'''
+    return self._worker_mask
+  worker_mask = property(_get_worker_mask)
+
+  def place_worker(self, square):
+    '''Mark the square as occupied by a worker'''
+    self._worker_mask |= 1 << square
+
+  def remove_worker(self, square):
+    '''Mark the square as no longer occupied by a worker'''
+    self._worker_mask &= ~(1 << square)
+
+  def build(self, square):
+    '''Raise the building at the square by one level'''
+    level = self._heights[square] + 1
+    self._heights[square] = level
+    self._level_masks[level] |= 1 << square
+
+  def unbuild(self, square):
+    '''Lower the building at the square by one level (the inverse of build, used when undoing)'''
+    level = self._heights[square]
+    self._heights[square] = level - 1
+    self._level_masks[level] &= ~(1 << square)
+
+  def legal_move_mask(self, square):
+    '''
+      The squares a worker standing on square can move into.
+      Output:
+        int - bitmask of neighboring squares that are free and at most one level higher
+    '''
+    blocked = self._worker_mask
+    climb_limit = self._heights[square] + 2  # anything this tall or taller is out of reach
+    if climb_limit <= DOME_LEVEL:
+      blocked |= self._level_masks[climb_limit]
+    return NEIGHBOR_MASKS[square] & ~blocked
+
+  def legal_build_mask(self, square):
+    '''
+      The squares a worker standing on square can build on.
+      Output:
+        int - bitmask of neighboring squares that are free and not domed
+    '''
+    return NEIGHBOR_MASKS[square] & ~(self._worker_mask | self._level_masks[DOME_LEVEL])
+
+  def legal_build_mask_after_move(self, from_square, to_square):
+    '''
+      The squares a worker could build on after moving from from_square to to_square, without actually moving it.
+      Output:
+        int - bitmask of squares around to_square that are free (from_square counts as free) and not domed
+    '''
+    occupied = (self._worker_mask & ~(1 << from_square)) | 1 << to_square
+    return NEIGHBOR_MASKS[to_square] & ~(occupied | self._level_masks[DOME_LEVEL])
+
+  def mask_to_directions(self, square, mask):
+    '''
+      Translate a bitmask of neighbors of square into direction strings, in DIRECTIONS order
+      Output:
+        tuple(str) - the directions that lead from square into a square of mask (a shared tuple, nothing gets built)
+    '''
+    return DIRECTION_SETS[DIRECTION_BITS[square][mask & NEIGHBOR_MASKS[square]]]
+
+  def to_rows(self):
+    '''The heights as a 5x5 list of lists (row, col), the representation Game used to store directly'''
+    return [self._heights[row * BOARD_SIZE:(row + 1) * BOARD_SIZE] for row in range(BOARD_SIZE)]
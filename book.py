@@ -0,0 +1,157 @@
+'''
+  An opening book: the best turn of the positions near the fixed starting position, found offline by deep search
+  and keyed by canonical hash (see symmetry.py), so an AI player in book answers with one dict lookup instead of a
+  search, and mirror images of a position share one entry.
+
+  File layout (little-endian): magic b"SOB1", version, search depth, number of entries, then one 14-byte entry
+  per position, sorted by hash: canonical hash (8 bytes), turn code in the canonical orientation (2 bytes),
+  score (4 bytes, signed).
+
+  python book.py [--output opening_book.bin] [--plies 4] [--breadth 3] [--depth 4]
+'''
+import argparse
+import os
+import struct
+import time
+from collections import deque
+from game import Game
+from geometry import square_index
+from position import Position
+from search import AlphaBetaSearch
+
+MAGIC = b"SOB1"
+VERSION = 2  # 1 keyed the entries by plain Zobrist hash
+HEADER = struct.Struct("<4sBBI")
+ENTRY = struct.Struct("<QHi")
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+
+class BookFormatError(Exception):
+  '''Raised when a file isn't a valid opening book'''
+  pass
+
+
+class OpeningBook:
+  '''Book moves by position hash. Lookups check the move is legal, so a hash collision can't play an illegal turn.'''
+
+  def __init__(self, entries=None, depth=0):
+    self._entries = entries if entries is not None else {}  # canonical hash -> (canonical turn code, score)
+    self._depth = depth  # the search depth the moves were found at
+    self.hits = 0
+    self.misses = 0
+
+  def _get_depth(self):
+    return self._depth
+  depth = property(_get_depth)
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, key):
+    return key in self._entries
+
+  def add(self, position, action, score):
+    '''Store the book turn (a TurnDelta) of a Position, for it and its mirror images'''
+    self._entries[position.canonical_hash] = (position.canonical_code(action), score)
+
+  def lookup(self, game):
+    '''
+      The book turn of the game's current position
+      Output:
+        tuple(TurnDelta, int) - the turn and its search score, or None if the position isn't in book
+    '''
+    position = Position.from_game(game)
+    entry = self._entries.get(position.canonical_hash)
+    action = position.action_from_canonical(entry[0]) if entry is not None else None
+    if action is None or not is_legal_turn(game, action):
+      self.misses += 1
+      return None
+    self.hits += 1
+    return action, entry[1]
+
+  def save(self, path):
+    with open(path, "wb") as file:
+      file.write(HEADER.pack(MAGIC, VERSION, self._depth, len(self._entries)))
+      for key in sorted(self._entries):
+        file.write(ENTRY.pack(key, *self._entries[key]))
+
+  @classmethod
+  def load(cls, path):
+    with open(path, "rb") as file:
+      data = file.read()
+    if len(data) < HEADER.size:
+      raise BookFormatError("too short to be an opening book")
+    magic, version, depth, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or len(data) != HEADER.size + count * ENTRY.size:
+      raise BookFormatError(f"not a version {VERSION} opening book")
+    return cls({key: (move, score) for key, move, score in ENTRY.iter_unpack(data[HEADER.size:])}, depth)
+
+
+def is_legal_turn(game, action):
+  '''Whether the TurnDelta is a legal turn for the player to move'''
+  if action.worker_id not in game.get_current_player().worker_ids \
+      or game.get_worker_location(action.worker_id) != action.from_location:
+    return False
+  board = game.board
+  from_square, to_square = square_index(action.from_location), square_index(action.to_location)
+  return bool(board.legal_move_mask(from_square) >> to_square & 1
+              and board.legal_build_mask_after_move(from_square, to_square) >> square_index(action.build_location) & 1)
+
+
+_default_book = None
+
+def load_default_book():
+  '''The book shipped next to this module (loaded once), or None if there isn't one'''
+  global _default_book
+  if _default_book is None and os.path.exists(DEFAULT_BOOK_PATH):
+    _default_book = OpeningBook.load(DEFAULT_BOOK_PATH)
+  return _default_book
+
+
+def build_book(plies=4, breadth=3, depth=4, verbose=False):
+  '''
+    Walk the opening tree breadth-first from the starting position and search every position to a fixed depth
+    (no time limit, so the book is reproducible). Each position expands into its book turn plus the next
+    breadth - 1 turns by static evaluation, the replies a reasonable opponent is likely to play, for plies turns.
+    Transpositions and mirror images are searched once.
+    Output:
+      OpeningBook
+  '''
+  book = OpeningBook(depth=depth)
+  search = AlphaBetaSearch(max_depth=depth, time_budget_ms=float("inf"))  # one table for the whole tree
+  queue = deque([(Position.from_game(Game("random", "random", False, verbose=False, shared=False)), 0)])
+  while queue:
+    position, ply = queue.popleft()
+    if position.canonical_hash in book or position.winner() is not None:
+      continue
+    action, stats = search.search(position)
+    book.add(position, action, stats.score)
+    if verbose:
+      print(f"ply {ply}, {len(book)} positions: {action} {stats}")
+    if ply + 1 >= plies:
+      continue
+    alternatives = []
+    seen = {position.apply(action).canonical_hash}  # mirror images of a listed turn lead to the same position
+    for candidate in position.legal_actions():
+      child = position.apply(candidate)
+      if child.canonical_hash not in seen:  # the opponent is to move after it, hence the minus
+        seen.add(child.canonical_hash)
+        alternatives.append((-search.evaluate(child), len(alternatives), candidate))
+    alternatives.sort(key=lambda alternative: (-alternative[0], alternative[1]))
+    for child_action in [action] + [candidate for _, _, candidate in alternatives[:breadth - 1]]:
+      queue.append((position.apply(child_action), ply + 1))
+  return book
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Build the opening book by searching the opening tree.")
+  parser.add_argument("--output", default=DEFAULT_BOOK_PATH)
+  parser.add_argument("--plies", type=int, default=4, help="how many turns deep the book goes")
+  parser.add_argument("--breadth", type=int, default=3, help="turns expanded per position: the book turn and the best alternatives")
+  parser.add_argument("--depth", type=int, default=4, help="search depth per position, in plies")
+  options = parser.parse_args()
+
+  start = time.perf_counter()
+  book = build_book(options.plies, options.breadth, options.depth, verbose=True)
+  book.save(options.output)
+  print(f"{len(book)} positions written to {options.output} in {time.perf_counter() - start:.0f}s")
@@ -0,0 +1,354 @@
+'''
+  An exact endgame solver and the persistent table of the results it proved.
+  The solver proves that the side to move wins or loses within N plies (an AND-OR search over full turns on
+  Positions), for the late positions where a worker stands next to a level 2 or 3 square. Proven results are kept in an
+  EndgameTable keyed by canonical hash (see symmetry.py), so mirror images share an entry; the table file is
+  memory-mapped, so a lookup reads one or two 12-byte slots and a won ending resolves without any search. MinimaxPlayer and MCTSPlayer ask the solver before they search.
+
+  Table file layout (little-endian): magic b"SET1", version, the solver depth, number of entries, number of slots
+  (a power of two), then the slots of an open-addressing hash table (linear probing, key 0 marks an empty slot):
+  canonical hash (8 bytes), result (1 byte, signed: 1 the side to move wins, -1 it loses), plies to the end (1 byte),
+  the winning (or longest-resisting) turn's code in the canonical orientation (2 bytes, 0xFFFF for none).
+  The table is opt-in: none is shipped, and until `python endgame.py build` writes endgame_table.bin next to this
+  module, the players' solvers prove everything themselves.
+
+  python endgame.py build [--output endgame_table.bin] [--games 100] [--depth 5] [--seed 0]
+  python endgame.py show [--table endgame_table.bin]
+'''
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+from book import is_legal_turn
+from game import Game
+from geometry import square_index
+from position import Position
+
+MAGIC = b"SET1"
+VERSION = 2  # 1 keyed the results by plain Zobrist hash
+HEADER = struct.Struct("<4sBBIQ")
+SLOT = struct.Struct("<QbBH")
+WIN, UNKNOWN, LOSS = 1, 0, -1  # from the point of view of the side to move
+NO_ACTION = 0xFFFF
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endgame_table.bin")
+DEFAULT_DEPTH = 3
+DEFAULT_MAX_NODES = 5000
+DEFAULT_CACHE_SIZE = 100000  # results a solver keeps in memory between solves before it starts over
+CHECK_EVERY = 256  # nodes between two clock reads
+
+
+class TableFormatError(Exception):
+  '''Raised when a file isn't a valid endgame table'''
+  pass
+
+
+class EndgameTable:
+  '''
+    Proven results by canonical position hash: the mapped table file (read-only) plus the results merged in since it
+    was loaded, which save() writes into a new file. Only building a table merges results; the default table every
+    player's solver reads stays read-only.
+  '''
+
+  def __init__(self, path=None):
+    self._file = None
+    self._map = None
+    self._depth = 0
+    self._disk_count = 0
+    self._capacity = 0
+    self._new = {}  # canonical hash -> (result, plies, canonical turn code), not on disk yet
+    self.hits = 0
+    self.misses = 0
+    if path is not None and os.path.exists(path):
+      self._open(path)
+
+  def _open(self, path):
+    self._file = open(path, "rb")
+    self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(self._map) < HEADER.size:
+      raise TableFormatError("too short to be an endgame table")
+    magic, version, self._depth, self._disk_count, self._capacity = HEADER.unpack_from(self._map)
+    if magic != MAGIC or version != VERSION or self._capacity & (self._capacity - 1) \
+        or len(self._map) != HEADER.size + self._capacity * SLOT.size:
+      raise TableFormatError(f"not a version {VERSION} endgame table")
+
+  def _get_depth(self):
+    '''The solver depth the results on disk were proven with'''
+    return self._depth
+  depth = property(_get_depth)
+
+  def __len__(self):
+    return self._disk_count + sum(1 for key in self._new if self._probe(key) is None)
+
+  def _probe(self, key):
+    '''The entry of key in the mapped file, or None'''
+    if not self._capacity:
+      return None
+    mask = self._capacity - 1
+    slot = key & mask
+    while True:
+      slot_key, result, plies, action = SLOT.unpack_from(self._map, HEADER.size + slot * SLOT.size)
+      if slot_key == key:
+        return result, plies, action
+      if slot_key == 0:
+        return None
+      slot = (slot + 1) & mask
+
+  def get(self, key):
+    '''
+      The proven result of the position with canonical hash key
+      Output:
+        tuple(int, int, int) - (WIN or LOSS for the side to move, plies to the end, canonical turn code or NO_ACTION),
+                               or None if it isn't in the table
+    '''
+    entry = self._new.get(key)
+    return entry if entry is not None else self._probe(key)
+
+  def merge(self, results):
+    '''Add proven results, {canonical hash: (result, plies, canonical turn code)}, kept in memory until save()'''
+    for key, entry in results.items():
+      if key:  # 0 marks the empty slots on disk
+        self._new[key] = entry
+
+  def lookup(self, game):
+    '''
+      The proven result of the game's current position, with its turn checked for legality (so a hash collision
+      can't play an illegal turn)
+      Output:
+        tuple(int, int, TurnDelta) - (WIN or LOSS, plies to the end, the turn or None), or None if not in the table
+    '''
+    position = Position.from_game(game)
+    entry = self.get(position.canonical_hash)
+    if entry is None:
+      self.misses += 1
+      return None
+    result, plies, code = entry
+    action = position.action_from_canonical(code) if code != NO_ACTION else None
+    if code != NO_ACTION and (action is None or not is_legal_turn(game, action)):
+      self.misses += 1
+      return None
+    self.hits += 1
+    return result, plies, action
+
+  def entries(self):
+    '''Every (canonical hash, result, plies, turn code), the in-memory results overriding the file's'''
+    if self._capacity:
+      for offset in range(HEADER.size, len(self._map), SLOT.size):
+        key, result, plies, action = SLOT.unpack_from(self._map, offset)
+        if key and key not in self._new:
+          yield key, result, plies, action
+    for key, (result, plies, action) in self._new.items():
+      yield key, result, plies, action
+
+  def save(self, path, depth=None):
+    '''Write the file's and the new results into path (replaced atomically), then map the new file'''
+    entries = list(self.entries())
+    capacity = 1
+    while capacity < 2 * len(entries) + 1:  # at most half full, so probes stay short
+      capacity *= 2
+    slots = bytearray(capacity * SLOT.size)
+    for key, result, plies, action in entries:
+      slot = key & (capacity - 1)
+      while SLOT.unpack_from(slots, slot * SLOT.size)[0]:
+        slot = (slot + 1) & (capacity - 1)
+      SLOT.pack_into(slots, slot * SLOT.size, key, result, plies, action)
+    depth = depth if depth is not None else self._depth
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+      file.write(HEADER.pack(MAGIC, VERSION, depth, len(entries), capacity))
+      file.write(slots)
+    self.close()
+    os.replace(temporary_path, path)
+    self._new = {}
+    self._open(path)
+
+  def close(self):
+    if self._map is not None:
+      self._map.close()
+      self._file.close()
+      self._map = self._file = None
+      self._capacity = self._disk_count = 0
+
+
+class SolverBudgetExceeded(Exception):
+  '''Raised inside the solver when the node budget or the time runs out, unwinds back to solve()'''
+  pass
+
+
+class EndgameSolver:
+  '''
+    Proves wins and losses within max_depth plies by iterative deepening over an AND-OR search: the side to move
+    wins if one of its turns leaves the opponent lost, and loses if every turn leaves the opponent won.
+    The table is only read: results proven here, and positions searched without a proof (with the depth they were
+    searched to), stay in this solver's own memory, which starts over once it holds more than cache_size of them.
+    A solver isn't thread-safe, so every player gets its own, all of them reading the same table.
+    Input:
+      table - EndgameTable, or None to work without one
+      max_depth - int, the deepest proof looked for, in plies
+      max_nodes - int, the positions one solve() may visit before giving up
+      cache_size - int, the results kept in memory from one solve() to the next
+  '''
+
+  def __init__(self, table=None, max_depth=DEFAULT_DEPTH, max_nodes=DEFAULT_MAX_NODES, cache_size=DEFAULT_CACHE_SIZE):
+    self._table = table
+    self._max_depth = max_depth
+    self._max_nodes = max_nodes
+    self._cache_size = cache_size
+    self._proven = {}  # canonical hash -> (result, plies, canonical turn code), not in the table
+    self._unproven = {}  # canonical hash -> the depth searched without a proof
+    self._nodes = 0
+    self._deadline = None
+    self.solved = 0  # proofs found by solve(), not counting the table's
+
+  def _get_table(self):
+    return self._table
+  table = property(_get_table)
+
+  def flush(self):
+    '''Merge the results proven so far into the table (to build one, see build_table) and forget them here'''
+    if self._table is None:
+      raise ValueError("this solver has no table to merge into")
+    self._table.merge(self._proven)
+    self._proven = {}
+
+  def solve(self, position, deadline=None):
+    '''
+      Input:
+        position - Position
+        deadline - float, the time.perf_counter() at which to give up, or None for the node budget only
+      Output:
+        tuple(int, int, TurnDelta) - (WIN, LOSS or UNKNOWN for the side to move, plies to the end, the turn to play)
+    '''
+    if len(self._proven) + len(self._unproven) > self._cache_size:
+      self._proven.clear()
+      self._unproven.clear()
+    self._nodes = 0
+    self._deadline = deadline
+    try:
+      for depth in range(1, self._max_depth + 1):
+        result, plies, action = self._solve(position, depth)
+        if result != UNKNOWN:
+          self.solved += 1
+          return result, plies, action
+    except SolverBudgetExceeded:
+      pass
+    return UNKNOWN, 0, None
+
+  def _solve(self, position, depth):
+    key = position.canonical_hash
+    entry = self._proven.get(key)
+    if entry is None and self._table is not None:
+      entry = self._table.get(key)
+    if entry is not None:
+      return entry[0], entry[1], position.action_from_canonical(entry[2]) if entry[2] != NO_ACTION else None
+    if self._unproven.get(key, -1) >= depth:
+      return UNKNOWN, 0, None
+    self._nodes += 1
+    if self._nodes > self._max_nodes or (self._deadline is not None and self._nodes % CHECK_EVERY == 0
+                                         and time.perf_counter() > self._deadline):
+      raise SolverBudgetExceeded()
+
+    winner = position.winner()
+    if winner is not None:
+      return (WIN if winner == position.side else LOSS), 0, None
+    if depth == 0:
+      return UNKNOWN, 0, None
+    actions = position.legal_actions()
+    if position.has_winning_move():  # the first turn onto level 3, no need to look at the rest
+      for action in actions:
+        if position.heights[square_index(action.to_location)] == 3:
+          return WIN, 1, action  # not stored: finding it again is cheaper than probing the table
+    all_lost, longest, longest_action = True, 0, None
+    for action in actions:
+      result, plies, _ = self._solve(position.apply(action), depth - 1)
+      if result == LOSS:
+        self._proven[key] = (WIN, plies + 1, position.canonical_code(action))
+        return WIN, plies + 1, action
+      if result == UNKNOWN:
+        all_lost = False
+      elif all_lost and plies + 1 > longest:
+        longest, longest_action = plies + 1, action
+    if all_lost:
+      self._proven[key] = (LOSS, longest, position.canonical_code(longest_action) if longest_action is not None else NO_ACTION)
+      return LOSS, longest, longest_action
+    self._unproven[key] = depth
+    return UNKNOWN, 0, None
+
+  def winning_turn(self, game, deadline=None):
+    '''
+      The turn that wins the game's current position by force, from the table or, for an endgame position, a proof
+      found now (before the deadline, see solve). None if the win isn't proven (or the position is lost), the caller
+      searches as usual then.
+    '''
+    entry = self._table.lookup(game) if self._table is not None else None
+    if entry is not None:
+      return entry[2] if entry[0] == WIN else None
+    position = Position.from_game(game)
+    if not position.is_endgame():
+      return None
+    result, _, action = self.solve(position, deadline)
+    return action if result == WIN else None
+
+
+_default_table = None
+
+def load_default_table():
+  '''The table built next to this module (mapped once), or None if there isn't one'''
+  global _default_table
+  if _default_table is None and os.path.exists(DEFAULT_TABLE_PATH):
+    _default_table = EndgameTable(DEFAULT_TABLE_PATH)
+  return _default_table
+
+def load_default_solver():
+  '''A new solver for one player, over the default table if one was built'''
+  return EndgameSolver(load_default_table())
+
+
+def build_table(path, games=100, depth=5, seed=0, verbose=False):
+  '''
+    Play heuristic self-play games and solve every endgame position along the way, then save the table
+    (merged with what path already holds)
+    Output:
+      EndgameTable
+  '''
+  table = EndgameTable(path)
+  solver = EndgameSolver(table, max_depth=depth, max_nodes=10 * DEFAULT_MAX_NODES)
+  for game_index in range(games):
+    random.seed(f"{seed}-{game_index}")
+    game = Game("heuristic", "heuristic", False, verbose=False, shared=False)
+    while not game.run_one_step():
+      position = Position.from_game(game)
+      if position.is_endgame() and position.winner() is None:
+        solver.solve(position)
+        solver.flush()
+    if verbose and game_index % 50 == 49:
+      print(f"{game_index + 1} games, {len(table)} proven positions")
+  table.save(path, depth)
+  return table
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Build or inspect the endgame table.")
+  subcommands = parser.add_subparsers(dest="command", required=True)
+  build_parser = subcommands.add_parser("build", help="solve the endgames of self-play games into the table")
+  build_parser.add_argument("--output", default=DEFAULT_TABLE_PATH)
+  build_parser.add_argument("--games", type=int, default=100)
+  build_parser.add_argument("--depth", type=int, default=5, help="the deepest proof, in plies")
+  build_parser.add_argument("--seed", type=int, default=0)
+  show_parser = subcommands.add_parser("show", help="count the table's results")
+  show_parser.add_argument("--table", default=DEFAULT_TABLE_PATH)
+  options = parser.parse_args()
+
+  if options.command == "build":
+    start = time.perf_counter()
+    table = build_table(options.output, options.games, options.depth, options.seed, verbose=True)
+    print(f"{len(table)} proven positions written to {options.output} in {time.perf_counter() - start:.0f}s")
+  else:
+    table = EndgameTable(options.table)
+    counts = {}
+    for _, result, plies, _ in table.entries():
+      counts[result, plies] = counts.get((result, plies), 0) + 1
+    print(f"{len(table)} positions, proven with depth {table.depth}")
+    for (result, plies), count in sorted(counts.items()):
+      print(f"{'win' if result == WIN else 'loss'} in {plies}: {count}")
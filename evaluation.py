@@ -0,0 +1,85 @@
+'''
+  Incremental bookkeeping of the (height, center, distance) move-score components of both players.
+  Game notifies the evaluator whenever a worker moves, so reading the components is O(1), and the
+  components of a hypothetical move can be computed without moving (and restoring) the worker.
+'''
+import math
+from geometry import CENTER_WEIGHTS, DISTANCES
+
+WORKER_SIDES = {'A': 0, 'B': 0, 'Y': 1, 'Z': 1}  # worker id -> index of its player (0 white, 1 blue)
+SIDE_WORKERS = (('A', 'B'), ('Y', 'Z'))
+PARTNERS = {'A': 'B', 'B': 'A', 'Y': 'Z', 'Z': 'Y'}  # worker id -> the other worker of the same player
+DEFAULT_WEIGHTS = (3, 2, 1)  # the weights of the height, center and distance components in a move score
+
+
+def parse_weights(option):
+  '''The (height, center, distance) weights of a player spec option such as "4,2,0.5", or None if it isn't one'''
+  try:
+    weights = tuple(float(weight) for weight in option.split(","))
+  except ValueError:
+    return None
+  return weights if len(weights) == 3 and all(math.isfinite(weight) for weight in weights) else None
+
+def format_weights(weights):
+  '''The spec option of a weight set, the inverse of parse_weights: heuristic:{format_weights(weights)}'''
+  return ",".join(f"{weight:g}" for weight in weights)
+
+
+class IncrementalEvaluator:
+  '''
+    Keeps each player's height and center sums, and the worker squares, up to date as workers move.
+    (Workers can't be built on, so the height under a worker only changes when the worker moves.)
+  '''
+
+  def __init__(self, board):
+    self._board = board
+    self._squares = {}  # worker id -> square
+    self._height = [0, 0]  # per side
+    self._center = [0, 0]  # per side
+    self.evaluations = 0  # move-score computations so far, read by the instrumentation
+
+  def on_worker_moved(self, worker_id, old_square, new_square):
+    '''
+      Game calls this after a worker moved (old_square is None when the worker is first placed)
+      NOTE: the board must already be up to date, the new height is read from it.
+    '''
+    side = WORKER_SIDES[worker_id]
+    if old_square is not None:
+      self._height[side] -= self._board.height(old_square)
+      self._center[side] -= CENTER_WEIGHTS[old_square]
+    self._height[side] += self._board.height(new_square)
+    self._center[side] += CENTER_WEIGHTS[new_square]
+    self._squares[worker_id] = new_square
+
+  def _distance_score(self, side, own_square_a, own_square_b):
+    '''8 minus the sum, over the opponent's workers, of the distance to the closer of the two own squares'''
+    distance_score = 0
+    for opponent_worker_id in SIDE_WORKERS[1 - side]:
+      distances = DISTANCES[self._squares[opponent_worker_id]]
+      distance_score += min(distances[own_square_a], distances[own_square_b])
+    return 8 - distance_score
+
+  def components(self, side):
+    '''
+      The current move-score components of a player
+      Input:
+        side - int, 0 for white, 1 for blue
+      Output:
+        tuple(int, int, int) - (height_score, center_score, distance_score)
+    '''
+    self.evaluations += 1
+    worker_a, worker_b = SIDE_WORKERS[side]
+    return self._height[side], self._center[side], self._distance_score(side, self._squares[worker_a], self._squares[worker_b])
+
+  def components_after_move(self, worker_id, new_square):
+    '''
+      The components the worker's player would have if the worker stood on new_square instead, nothing gets moved
+      Output:
+        tuple(int, int, int) - (height_score, center_score, distance_score)
+    '''
+    self.evaluations += 1
+    side = WORKER_SIDES[worker_id]
+    old_square = self._squares[worker_id]
+    height_score = self._height[side] - self._board.height(old_square) + self._board.height(new_square)
+    center_score = self._center[side] - CENTER_WEIGHTS[old_square] + CENTER_WEIGHTS[new_square]
+    return height_score, center_score, self._distance_score(side, new_square, self._squares[PARTNERS[worker_id]])
@@ -1,4 +1,9 @@
-from save import GameSave
+from save import GameSave, TurnDelta
+from board import Board
+from geometry import BOARD_SIZE, square_index
+from evaluation import IncrementalEvaluator
+from zobrist import HEIGHT_KEYS, WORKER_KEYS, SIDE_KEY, compute_hash
+from instrumentation import search_work
 
 class Game:
   '''
@@ -8,26 +13,31 @@ class Game:
   '''
 
   #--------------------------------------------SINGLETON PORTION START --------------------------------------------#
-  '''Singleton is applied for the ease of access here, rather than reducing duplicates, so might not seem as necessary.'''
+  '''Singleton is applied for the ease of access here, rather than reducing duplicates, so might not seem as necessary.
+  It's now only a backward-compatible shim: every Player and Worker holds a reference to its own Game (the game context),
+  so shared=False games are fully independent and many of them can run side by side in one process.'''
 
   _instance = None  # the singleton game instance
 
   # NOTE: self works here, no need to @classmethod it. cls by convention.
-  def __new__(cls, p1_type, p2_type, enable_score):  
+  def __new__(cls, p1_type, p2_type, enable_score, verbose=True, shared=True):  
       '''With the current singleton logic, every time the object initialization is called, the object gets reset.
-      This is valid since __new__ can be only accessed like __init__ and nowhere else. Again, for the ease of reference.'''
+      This is valid since __new__ can be only accessed like __init__ and nowhere else. Again, for the ease of reference.
+      verbose=False runs the game headless: players stop printing their moves.
+      shared=False skips the singleton and returns a brand new, independent game.'''
+      if not shared:
+          game = super(Game, cls).__new__(cls)
+          game._setup(p1_type, p2_type, enable_score, verbose)
+          return game
+
       # Sets up the singleton if not yet. The setup below only need to run once.
       if not cls._instance:
           cls._instance = super(Game, cls).__new__(cls)  # avoids self-looping when setting up an instance of self class.
-          # Sets up player agents with correct types. Only need to init once since same agents throughout.
-          cls._instance._players = [
-              cls._instance._create_player_agent(p1_type, "white"),
-              cls._instance._create_player_agent(p2_type, "blue"),]
-          # Have other variables here
-          cls._instance._enable_score = enable_score
-
-      # Sets up (or resets) the initial game state
-      cls._instance._initialize_gameboard()
+          cls._instance._setup(p1_type, p2_type, enable_score, verbose)
+      else:
+          cls._instance._verbose = verbose  # can change between resets, e.g. a headless batch after an interactive game
+          # Sets up (or resets) the initial game state
+          cls._instance._initialize_gameboard()
 
       return cls._instance
 
@@ -38,15 +48,28 @@ class Game:
       # at the beginning. Again, singleton is only used for ease of reference here, not duplication reduction.
       return cls._instance
   #--------------------------------------------SINGLETON PORTION END--------------------------------------------#
-  
+
+  def _setup(self, p1_type, p2_type, enable_score, verbose):
+    '''One-time setup of a fresh game object, then the initial game state'''
+    # Sets up player agents with correct types. Only need to init once since same agents throughout.
+    self._players = [
+        self._create_player_agent(p1_type, "white"),
+        self._create_player_agent(p2_type, "blue"),]
+    # Have other variables here
+    self._enable_score = enable_score
+    self._verbose = verbose
+    self._initialize_gameboard()
+
 
   def _initialize_gameboard(self):
     '''
       NOTE: define the coordinate system of the board as: 
       order- (row, col), (0, 0) top-left, (5, 5) bottom-right
     '''
-    # represent the gameboard and building levels as a 2D array of integers such that 0-3 represents the levels, and -1 represents a dome
-    self._game_state = [[0 for j in range(5)] for i in range(5)]  # initialize to initial board state
+    # represent the gameboard and building levels as a bitboard (see board.py) such that 0-3 represents the levels, and 4 represents a dome
+    self._board = Board()  # initialize to initial board state, heights + worker occupancy
+    self._hash = 0  # the Zobrist hash of the position (see zobrist.py), kept up to date by every move, build and turn
+    self._evaluator = IncrementalEvaluator(self._board)  # the players' move-score components, kept up to date by every move
     # represent the worker placements as a dictionary of tuples s.t. the key is worker's letter, and the value is the worker's location
     self._worker_locations = {}  # a dictionary of tuples, a READ-ONLY update board of locations.
 
@@ -57,33 +80,151 @@ class Game:
     # NOTE: interpret _turn_index as _num_turn. Going to adjust the logic accordingly!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
     self._turn_index = 0  # starts with player 1
 
+    self._history = None  # a GameHistory the turns get recorded into, attached by the caretaker (undo/redo)
+    self._recorder = None  # a GameRecordWriter the turns get streamed into (see record.py)
+    self._instrumentation = None  # an Instrumentation timing every turn's phases (see instrumentation.py)
+    self._output = print  # where the players' decisions get printed (verbose games only), one line per call
+    self._pondering = False  # whether an AI opponent searches while a human player decides
+    self._last_build_location = None  # where the current turn built, for the turn's delta
+
   def save(self):
     """
     Saves the current state inside a Memento game_save.
     """
-    return GameSave(self._game_state, self._worker_locations, self._players, self._enable_score, self._turn_index)
+    if self._instrumentation is not None and self._instrumentation.turn_profile:
+      self._instrumentation.turn_profile.count("saves")
+    return GameSave(self._board.heights, self._worker_locations, self._turn_index)
 
   def restore(self, game_save):
     """
     Restores the Originator's (Game's) state from a Memento object game_save.
     """
-    game_state, worker_locations, players, enable_score, turn_index = game_save.get_overall_game_state()
-    self._game_state = game_state  
-    self._worker_locations = worker_locations  
-    self._players = players
-    self._enable_score = enable_score
+    heights, worker_locations, turn_index = game_save.get_overall_game_state()
+    self._board = Board.from_heights(heights)
+    self._evaluator = IncrementalEvaluator(self._board)
+    self._worker_locations = {}  # emptied so the workers get placed on the fresh board, not moved from their old squares
+    for worker_id, location in worker_locations:
+      self._find_worker(worker_id).move(location)  # the existing workers, no Player objects get rebuilt
     self._turn_index = turn_index  
+    self._hash = compute_hash(heights, self._worker_locations, turn_index)
+
+  def enable_pondering(self):
+    '''Let an AI player search on a human opponent's turn (see MinimaxPlayer), so it answers sooner or deeper'''
+    self._pondering = True
+
+  def attach_history(self, history):
+    '''Record every turn played from now on into history (a GameHistory), or stop recording if None'''
+    self._history = history
+
+  def attach_instrumentation(self, instrumentation):
+    '''Time and count the phases of every turn played from now on into instrumentation (an Instrumentation), or stop if None'''
+    self._instrumentation = instrumentation
+
+  def _get_turn_profile(self):
+    '''The getter method that returns the TurnProfile of the turn being played if the game is instrumented, else None'''
+    return self._instrumentation.turn_profile if self._instrumentation is not None else None
+  turn_profile = property(_get_turn_profile)
+
+  def attach_output(self, output):
+    '''Send the lines the players print (their decisions, search stats) to output, a callable taking one string'''
+    self._output = output
+
+  def output(self, line):
+    '''Print one line of the game's transcript, to stdout unless attach_output redirected it'''
+    self._output(line)
+
+  def attach_recorder(self, recorder):
+    '''Stream every turn played from now on into recorder (a GameRecordWriter with an open record), or stop if None'''
+    self._recorder = recorder
+
+  def apply_delta(self, delta):
+    '''Replay a recorded turn (a TurnDelta): move the worker, build, and pass the turn'''
+    self._find_worker(delta.worker_id).move(delta.to_location)
+    self._build(square_index(delta.build_location))
+    self._next_turn()
+
+  def revert_delta(self, delta):
+    '''Take back a recorded turn (a TurnDelta), the exact inverse of apply_delta'''
+    self._turn_index -= 1
+    self._hash ^= SIDE_KEY
+    square = square_index(delta.build_location)
+    level = self._board.height(square)
+    self._board.unbuild(square)
+    self._hash ^= HEIGHT_KEYS[square][level] ^ HEIGHT_KEYS[square][level - 1]
+    self._find_worker(delta.worker_id).move(delta.from_location)
+
+  def _find_worker(self, worker_id):
+    '''The Worker object with the given id, whichever player owns it'''
+    for player in self._players:
+      worker = player.get_worker(worker_id)
+      if worker:
+        return worker
 
   def _get_game_state(self):
-      '''The getter method that returns the _game_state object'''
-      return self._game_state
+      '''The getter method that returns the building levels as a 5x5 list of lists. A fresh copy, so read-only.'''
+      return self._board.to_rows()
   game_state = property(_get_game_state)  # for ease of publically-accessing notation
 
+  def get_level(self, location):
+    '''
+      A simple getter that returns the building level at a location on the board
+      Input:
+        location - tuple(int, int), the (row_id, col_id) to look at
+      Output:
+        int - 0-3 for the levels, 4 for a dome
+    '''
+    return self._board.height(square_index(location))
+
+  def add_building_level(self, location):
+    '''
+      The setter method that builds one level on a location. Mirrors update_worker_location for buildings.
+      Input:
+        location - tuple(int, int), the (row_id, col_id) being built on
+    '''
+    self._build(square_index(location))
+    self._last_build_location = location
+
+  def _build(self, square):
+    '''Raise the square by one level on the board and in the hash'''
+    level = self._board.height(square)
+    self._board.build(square)
+    self._hash ^= HEIGHT_KEYS[square][level] ^ HEIGHT_KEYS[square][level + 1]
+
   def _get_enable_score(self):
       '''The getter method that returns the _enable_score bool'''
       return self._enable_score
   enable_score = property(_get_enable_score)  # for ease of publically-accessing notation
 
+  def _get_board(self):
+      '''The getter method that returns the Board. Read it, change it only through the workers.'''
+      return self._board
+  board = property(_get_board)  # for ease of publically-accessing notation
+
+  def _get_zobrist_hash(self):
+      '''The getter method that returns the 64-bit Zobrist hash of the current position (heights, workers, side to move)'''
+      return self._hash
+  zobrist_hash = property(_get_zobrist_hash)  # for ease of publically-accessing notation
+
+  def _get_evaluator(self):
+      '''The getter method that returns the IncrementalEvaluator of the players' move-score components'''
+      return self._evaluator
+  evaluator = property(_get_evaluator)  # for ease of publically-accessing notation
+
+  def _get_players(self):
+      '''The getter method that returns the [white, blue] players'''
+      return self._players
+  players = property(_get_players)  # for ease of publically-accessing notation
+
+  def _get_verbose(self):
+      '''The getter method that returns the _verbose bool'''
+      return self._verbose
+  verbose = property(_get_verbose)  # for ease of publically-accessing notation
+
+  def _get_turn_index(self):
+      '''The getter method that returns the _turn_index int, i.e. the number of turns played so far'''
+      return self._turn_index
+  turn_index = property(_get_turn_index)  # for ease of publically-accessing notation
+
   def update_worker_location(self, worker_id, new_location):
     '''
       The setter method that notifies the game to update worker location. This way we avoid exposing _workers and _locations
@@ -92,16 +233,53 @@ class Game:
         new_location - tuple(int, int), the new location of the worker on the board
     '''
     # print(worker_id, new_location)
+    old_location = self._worker_locations.get(worker_id)
+    new_square = square_index(new_location)
+    worker_keys = WORKER_KEYS[worker_id]
+    if old_location is not None:
+      old_square = square_index(old_location)
+      self._board.remove_worker(old_square)
+      self._hash ^= worker_keys[old_square]
+    else:
+      old_square = None
+    self._board.place_worker(new_square)
+    self._hash ^= worker_keys[new_square]
+    self._evaluator.on_worker_moved(worker_id, old_square, new_square)
     self._worker_locations[worker_id] = new_location
 
   def _create_player_agent(self, type, color):
-    from player import HumanPlayer, RandomPlayer, HeuristicPlayer  # using lazy import to avoid interdependency
+    from player import HumanPlayer, RandomPlayer, HeuristicPlayer, MinimaxPlayer, MCTSPlayer, RemotePlayer, ValuePlayer  # using lazy import to avoid interdependency
+    from evaluation import parse_weights
+    type, _, option = type.partition(":")  # e.g. "minimax:200" carries a per-move time budget in ms, "minimax:d3" a fixed depth
     if type == "human":
-      return HumanPlayer(color)
-    elif type == "heuristic":
-      return HeuristicPlayer(color)
+      return HumanPlayer(color, self)
+    elif type == "remote":  # a human on the other end of a server connection (see server.py)
+      return RemotePlayer(color, self)
+    elif type == "heuristic":  # "heuristic:4,2,0.5" carries its own (height, center, distance) weights
+      return HeuristicPlayer(color, self, weights=parse_weights(option)) if option else HeuristicPlayer(color, self)
     elif type == "random":
-      return RandomPlayer(color)
+      return RandomPlayer(color, self)
+    elif type == "minimax":
+      from book import load_default_book
+      from endgame import load_default_solver
+      book, endgame = load_default_book(), load_default_solver()
+      if option.startswith("d"):  # "minimax:d3" searches exactly 3 plies with no time limit, so its games are reproducible
+        return MinimaxPlayer(color, self, time_budget_ms=float("inf"), max_depth=int(option[1:]), book=book, endgame=endgame)
+      return MinimaxPlayer(color, self, time_budget_ms=int(option), book=book, endgame=endgame) if option \
+        else MinimaxPlayer(color, self, book=book, endgame=endgame)
+    elif type == "mcts":  # "mcts:500,root,4,heuristic": a time budget (or i2000 iterations), a parallel mode and its workers, a playout policy
+      from book import load_default_book
+      from endgame import load_default_solver
+      from mcts import parse_options
+      options = parse_options(option)
+      if options is None:
+        raise ValueError(f"not an mcts player spec: {type}:{option}")
+      return MCTSPlayer(color, self, book=load_default_book(), endgame=load_default_solver(), **options)
+    elif type == "value":  # "value" plays by the trained network, "value:linear" by the batched heuristic
+      import valuenet  # lazy: NumPy is only needed for this player
+      from book import load_default_book
+      evaluator = valuenet.LinearEvaluator.from_heuristic() if option == "linear" else valuenet.load_default_model()
+      return ValuePlayer(color, self, evaluator, book=load_default_book())
 
   def check_new_location_validity(self, old_location, new_location, action):
     '''
@@ -114,34 +292,40 @@ class Game:
         bool - True if location is valid for the action, False otherwise
     '''
  
-    board_size = 5
-    # height of current location
-    level = self._game_state[old_location[0]][old_location[1]]
     row, col = new_location[0], new_location[1]
 
     # check if new location is outside of bounds
-    if row < 0 or row >= board_size or col < 0 or col >= board_size:
+    if row < 0 or row >= BOARD_SIZE or col < 0 or col >= BOARD_SIZE:
       return False
 
-    # check if new location is occupied by a worker
-    if (row, col) in self._worker_locations.values():
-      return False
+    # occupancy, climbing (move) and dome (build) checks are all folded into the board's legal mask
+    old_square = square_index(old_location)
+    legal_mask = self._board.legal_move_mask(old_square) if action == "move" else self._board.legal_build_mask(old_square)
+    return bool(legal_mask >> square_index(new_location) & 1)
 
-    # level mismatch only for movement, bounded by level + 1
-    if action == "move" and self._game_state[row][col] > level + 1:
-      return False
-    
-    # also can't build on dome
-    if action == "build" and self._game_state[row][col] == 4:
-      return False
+  def has_legal_move(self, location):
+    '''Whether a worker standing on location can move anywhere at all'''
+    return self._board.legal_move_mask(square_index(location)) != 0
 
-    return True
+  def find_legal_directions(self, location, action):
+    '''
+      Find every direction a worker standing on location can legally move into or build on
+      Input:
+        location - tuple(int, int), the location (row_id, col_id) the worker is currently at
+        action - str, 'build' for building on and 'move' for moving into
+      Output:
+        tuple(str) - the legal directions, in Worker.WORKER_MOVES order (a shared tuple, read-only)
+    '''
+    square = square_index(location)
+    legal_mask = self._board.legal_move_mask(square) if action == "move" else self._board.legal_build_mask(square)
+    return self._board.mask_to_directions(square, legal_mask)
 
 
   def __str__(self):
     '''the board representation used for CLI'''
     # Update the board into a print state by fusing in workers
-    board_to_print = [[str(self._game_state[i][j]) + ' ' for j in range(5)] for i in range(5)]
+    game_state = self._board.to_rows()
+    board_to_print = [[str(game_state[i][j]) + ' ' for j in range(5)] for i in range(5)]
     for worker_id, location in self._worker_locations.items():
       board_to_print[location[0]][location[1]] = board_to_print[location[0]][location[1]][0] + worker_id  # update the space with worker id at correct locations
     # Print the board
@@ -164,30 +348,113 @@ class Game:
 
   def _next_turn(self):
     self._turn_index += 1
+    self._hash ^= SIDE_KEY  # the side to move flips
     # self._turn_index %= 2
 
   def run_one_step(self):
     '''Run one step of the game by telling the current player to take action'''
 
     actual_turn_index = self._turn_index % 2  # even => 0, odd => 1. Remember that _turn_index is interpreted as _num_turns
+    profile = self._instrumentation.begin_turn() if self._instrumentation is not None else None  # None unless profiling
 
     # Check for results first (have each player inspect whether they win or lose)
+    # Only the current player's legal moves get listed, the opponent just needs a yes/no on having any.
     result_current_player = self._players[actual_turn_index].check_game_ongoing()
-    result_opponent = self._players[abs(actual_turn_index-1)].check_game_ongoing()
+    result_opponent = self._players[abs(actual_turn_index-1)].check_game_status()
+    if profile:
+      profile.lap("check_game_ongoing")
+      profile.count("moves_generated", 0 if isinstance(result_current_player, str) else len(result_current_player))
 
-    if isinstance(result_current_player, str) or isinstance(result_opponent, str):
+    if isinstance(result_current_player, str) or result_opponent is not None:
       # get winner and print winner
       # winner = self._players[(self._turn_index + (result == "lose")) % 2]
       if result_current_player == "win" or result_opponent == "lose":
         winner = self._players[actual_turn_index]
       else:  # current player lose or result opponent == win
         winner = self._players[abs(actual_turn_index-1)]  # the opponent's index
+      if profile:
+        self._instrumentation.end_turn(self._turn_index, self._players[actual_turn_index])
+      self.close()  # the players' process pools aren't needed anymore
       return winner
     else:  # game not ended yet!
       # Execute a round of decision and movement for this player
-      self._players[actual_turn_index].make_decision(result_current_player)  
+      recording = self._history is not None or self._recorder is not None
+      if recording:
+        locations_before = dict(self._worker_locations)
+      if profile:
+        evaluator, evaluations_before = self._evaluator, self._evaluator.evaluations
+      opponent = self._players[abs(actual_turn_index-1)]
+      pondering = self._pondering and self._players[actual_turn_index].waits_for_input
+      if pondering:
+        opponent.start_pondering()
+      try:
+        self._players[actual_turn_index].make_decision(result_current_player)
+      finally:
+        if pondering:
+          opponent.stop_pondering()
+      if profile:
+        profile.lap("make_decision")
+        profile.count("evaluations", self._evaluator.evaluations - evaluations_before if self._evaluator is evaluator else 0)
+        profile.count("search_nodes", search_work(self._players[actual_turn_index]))
       self._next_turn()  # iterator
+      if recording:  # only the moved worker, its two squares and the built square get recorded
+        worker_id = next(id for id, location in self._worker_locations.items() if location != locations_before[id])
+        delta = TurnDelta(worker_id, locations_before[worker_id], self._worker_locations[worker_id], self._last_build_location)
+        if self._history is not None:
+          self._history.record(self, delta)
+        if self._recorder is not None:
+          self._recorder.record(self._turn_index - 1, delta)
+      if profile:
+        profile.lap("record")
+        self._instrumentation.end_turn(self._turn_index - 1, self._players[actual_turn_index])
       # return None  # happens by default
+
+  def get_winner(self):
+    '''
+      The winner of the current position, decided exactly like run_one_step does it but without listing legal moves
+      Output:
+        Player - the winner, or None if the game is still on
+    '''
+    actual_turn_index = self._turn_index % 2
+    result_current_player = self._players[actual_turn_index].check_game_status()
+    result_opponent = self._players[abs(actual_turn_index-1)].check_game_status()
+    if result_current_player == "win" or result_opponent == "lose":
+      return self._players[actual_turn_index]
+    if result_current_player == "lose" or result_opponent == "win":
+      return self._players[abs(actual_turn_index-1)]
+    return None
+
+  def close(self):
+    '''
+      Let the players release what they hold between turns (MCTS process pools). Called once the game is decided,
+      and by whoever abandons a game before that; a closed game can still be played, the pools start again on demand.
+    '''
+    for player in self._players:
+      player.close()
+
+  def get_current_player(self):
+    '''The player whose turn it is'''
+    return self._players[self._turn_index % 2]
+
+  def copy(self):
+    '''
+      An independent, headless copy of the current position, for search to play moves on.
+      The copy's players are placeholders: only the board, the workers and the turn matter.
+    '''
+    game = Game("random", "random", self._enable_score, verbose=False, shared=False)
+    game.restore(self.save())
+    return game
+
+  def play_to_end(self):
+    '''
+      Run steps until the game is decided. Meant for headless (AI vs AI) games, there's no CLI in between steps.
+      Output:
+        Player - the winner
+    '''
+    winner = None
+    while not winner:
+      winner = self.run_one_step()
+    return winner
   
   def get_worker_location(self, worker_id):
     '''
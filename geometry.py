@@ -0,0 +1,64 @@
+'''
+  The fixed geometry of the 5x5 board, precomputed once at import and shared by Game, Board, Worker and Player.
+  Squares are indexed 0-24 as row * 5 + col. Hot paths index into these tables instead of doing coordinate math.
+'''
+
+BOARD_SIZE = 5
+NUM_SQUARES = BOARD_SIZE * BOARD_SIZE
+
+# key: direction, value: (deltaRow, deltaCol). The order here is the order legal moves get enumerated in.
+DIRECTION_DELTAS = {'n': (-1, 0),
+                    'ne': (-1, 1),
+                    'e': (0, 1),
+                    'se': (1, 1),
+                    's': (1, 0),
+                    'sw': (1, -1),
+                    'w': (0, -1),
+                    'nw': (-1, -1)}
+DIRECTIONS = tuple(DIRECTION_DELTAS)
+DIRECTION_INDICES = {direction: index for index, direction in enumerate(DIRECTIONS)}
+OPPOSITE_DIRECTION = tuple((index + 4) % len(DIRECTIONS) for index in range(len(DIRECTIONS)))  # n <-> s, ne <-> sw, ...
+
+SQUARE_LOCATIONS = tuple(divmod(square, BOARD_SIZE) for square in range(NUM_SQUARES))  # square -> (row, col)
+
+
+def square_index(location):
+  '''Convert a (row, col) location into its square index 0-24'''
+  return location[0] * BOARD_SIZE + location[1]
+
+def square_location(square):
+  '''Convert a square index 0-24 back into its (row, col) location'''
+  return SQUARE_LOCATIONS[square]
+
+def _neighbor(square, delta):
+  '''The square one step away from square along delta, or -1 if that's off the board'''
+  row, col = SQUARE_LOCATIONS[square][0] + delta[0], SQUARE_LOCATIONS[square][1] + delta[1]
+  return row * BOARD_SIZE + col if 0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE else -1
+
+def _center_weight(row, col):
+  '''2 for the center space, 1 for the middle ring around it, 0 on the edge'''
+  if (row, col) == (2, 2):
+    return 2
+  return 1 if abs(row - 2) <= 1 and abs(col - 2) <= 1 else 0
+
+# NEIGHBOR_SQUARES[square][direction_index]: the neighboring square in that direction, or -1 if off the board
+NEIGHBOR_SQUARES = tuple(tuple(_neighbor(square, delta) for delta in DIRECTION_DELTAS.values()) for square in range(NUM_SQUARES))
+NEIGHBOR_MASKS = tuple(sum(1 << n for n in neighbors if n >= 0) for neighbors in NEIGHBOR_SQUARES)  # as bitmasks
+CENTER_WEIGHTS = tuple(_center_weight(row, col) for row, col in SQUARE_LOCATIONS)
+# Since we can move diagonally, the minimum distance between two squares is the maximum of dx and dy (Chebyshev)
+DISTANCES = tuple(tuple(max(abs(row_a - row_b), abs(col_a - col_b)) for row_b, col_b in SQUARE_LOCATIONS)
+                  for row_a, col_a in SQUARE_LOCATIONS)  # DISTANCES[square_a][square_b]
+
+# Legal moves as small ints: bit i of a "direction set" is DIRECTIONS[i]. DIRECTION_BITS[square] maps a bitmask of
+# neighbors of square (e.g. from Board.legal_move_mask) to its direction set, DIRECTION_SETS[bits] names the
+# directions of a set as one shared tuple, so listing legal directions allocates nothing.
+DIRECTION_BITS = tuple({sum(1 << NEIGHBOR_SQUARES[square][i] for i in range(len(DIRECTIONS)) if bits >> i & 1): bits
+                        for bits in range(1 << len(DIRECTIONS))
+                        if all(NEIGHBOR_SQUARES[square][i] >= 0 for i in range(len(DIRECTIONS)) if bits >> i & 1)}
+                       for square in range(NUM_SQUARES))
+DIRECTION_SETS = tuple(tuple(DIRECTIONS[i] for i in range(len(DIRECTIONS)) if bits >> i & 1) for bits in range(1 << len(DIRECTIONS)))
+
+
+def direction_between(from_square, to_square):
+  '''The direction string that leads from a square into its neighboring to_square'''
+  return DIRECTIONS[NEIGHBOR_SQUARES[from_square].index(to_square)]
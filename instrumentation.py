@@ -0,0 +1,175 @@
+'''
+  Opt-in per-turn instrumentation of Game.run_one_step: how long each phase of a turn took and how much work it did.
+  Attach an Instrumentation to a game (Game.attach_instrumentation) with one or more sinks; every turn then produces
+  one event:
+    {"turn": 12, "player": "white", "total_us": 812.4,
+     "phases": {"check_game_ongoing": 31.0, "make_decision": 640.2, "report": 120.9, "record": 20.3},
+     "counters": {"moves_generated": 14, "evaluations": 7, "search_nodes": 0, "saves": 0}}
+  Phases: check_game_ongoing (win checks, the mover's move generation and the opponent's any-move check),
+  make_decision (the player's choice, minus its printing), report (printing the decision), record (history/recorder
+  bookkeeping), and print_board when the CLI measures its board printing. A game without instrumentation pays one None
+  check per phase.
+'''
+import json
+import time
+from abc import ABC, abstractmethod
+
+COUNTERS = ("moves_generated", "evaluations", "search_nodes", "saves")
+
+
+def search_work(player):
+  '''The nodes (alpha-beta) or playouts (MCTS) behind the player's latest decision, 0 for players that don't search'''
+  stats = getattr(player, "last_search_stats", None)
+  if stats is None:
+    return 0
+  return stats.nodes if hasattr(stats, "nodes") else stats.playouts
+
+
+class Sink(ABC):
+  '''Where the per-turn events go'''
+
+  @abstractmethod
+  def record(self, event):
+    pass
+
+  def close(self):
+    pass
+
+
+class HistogramSink(Sink):
+  '''
+    Keeps per-phase timing histograms in memory (power-of-two microsecond buckets, so memory stays constant however
+    many turns get played) plus the counter totals.
+  '''
+
+  def __init__(self):
+    self._phases = {}  # phase -> [count, total_us, max_us, {bucket: count}]
+    self._counters = dict.fromkeys(COUNTERS, 0)
+    self.turns = 0
+
+  def _add(self, phase, microseconds):
+    stats = self._phases.setdefault(phase, [0, 0.0, 0.0, {}])
+    stats[0] += 1
+    stats[1] += microseconds
+    stats[2] = max(stats[2], microseconds)
+    bucket = max(0, int(microseconds)).bit_length()  # bucket b holds [2**(b-1), 2**b) us
+    stats[3][bucket] = stats[3].get(bucket, 0) + 1
+
+  def record(self, event):
+    self.turns += 1
+    self._add("total", event["total_us"])
+    for phase, microseconds in event["phases"].items():
+      self._add(phase, microseconds)
+    for counter, value in event["counters"].items():
+      self._counters[counter] = self._counters.get(counter, 0) + value
+
+  def summary(self):
+    '''
+      Output:
+        dict - {"turns", "phases": {phase: {"count", "total_us", "mean_us", "max_us", "histogram": {upper bound us: count}}},
+                "counters": {counter: total}}
+    '''
+    phases = {}
+    for phase, (count, total, maximum, buckets) in self._phases.items():
+      phases[phase] = {"count": count, "total_us": total, "mean_us": total / count, "max_us": maximum,
+                       "histogram": {1 << bucket: buckets[bucket] for bucket in sorted(buckets)}}
+    return {"turns": self.turns, "phases": phases, "counters": dict(self._counters)}
+
+  def format_report(self):
+    '''One line per phase: its share of the total turn time, mean and max, then the counters per turn'''
+    summary = self.summary()
+    total = summary["phases"].get("total", {}).get("total_us", 0.0)
+    lines = [f"{summary['turns']} turns"]
+    for phase, stats in summary["phases"].items():
+      share = stats["total_us"] / total if total else 0.0
+      lines.append(f"{phase:20s} {share:6.1%}  mean {stats['mean_us']:10.1f}us  max {stats['max_us']:10.1f}us  ({stats['count']} samples)")
+    turns = summary["turns"] or 1
+    lines.append("  ".join(f"{counter} {value / turns:.1f}/turn" for counter, value in summary["counters"].items()))
+    return "\n".join(lines)
+
+
+class JsonLinesSink(Sink):
+  '''Writes every event as one JSON object per line, for offline analysis'''
+
+  def __init__(self, path, flush_each_turn=False):
+    self._file = open(path, "a")
+    self._flush_each_turn = flush_each_turn
+
+  def record(self, event):
+    self._file.write(json.dumps(event) + "\n")
+    if self._flush_each_turn:
+      self._file.flush()
+
+  def close(self):
+    self._file.close()
+
+
+class TurnProfile:
+  '''The timings and counters of the turn in progress. Game calls lap() at each phase boundary.'''
+  __slots__ = ("_phases", "_counters", "_start", "_last")
+
+  def __init__(self, phases):
+    self._phases = phases
+    self._counters = dict.fromkeys(COUNTERS, 0)
+    self._start = self._last = time.perf_counter()
+
+  def lap(self, phase):
+    '''Charge the time since the previous lap to phase'''
+    now = time.perf_counter()
+    self._phases[phase] = self._phases.get(phase, 0.0) + (now - self._last) * 1e6
+    self._last = now
+
+  def count(self, counter, value=1):
+    self._counters[counter] += value
+
+  def event(self, turn_index, player):
+    return {"turn": turn_index, "player": str(player), "total_us": (time.perf_counter() - self._start) * 1e6 + self._phases.get("print_board", 0.0),
+            "phases": self._phases, "counters": self._counters}
+
+
+class Instrumentation:
+  '''Turns the phase laps of each run_one_step into events for the sinks'''
+
+  def __init__(self, *sinks):
+    self._sinks = list(sinks)
+    self._pending = {}  # phase time measured between two turns (print_board), charged to the next turn
+    self._profile = None
+
+  def _get_turn_profile(self):
+    '''The TurnProfile of the turn in progress, None between turns'''
+    return self._profile
+  turn_profile = property(_get_turn_profile)
+
+  def begin_turn(self):
+    self._profile = TurnProfile(self._pending)
+    self._pending = {}
+    return self._profile
+
+  def end_turn(self, turn_index, player):
+    event = self._profile.event(turn_index, player)
+    self._profile = None
+    for sink in self._sinks:
+      sink.record(event)
+
+  def measure(self, phase):
+    '''Context manager timing a phase outside run_one_step (e.g. the CLI printing the board), charged to the next turn'''
+    return _PendingPhase(self, phase)
+
+  def close(self):
+    for sink in self._sinks:
+      sink.close()
+
+
+class _PendingPhase:
+  __slots__ = ("_instrumentation", "_phase", "_start")
+
+  def __init__(self, instrumentation, phase):
+    self._instrumentation = instrumentation
+    self._phase = phase
+
+  def __enter__(self):
+    self._start = time.perf_counter()
+
+  def __exit__(self, *exc_info):
+    pending = self._instrumentation._pending
+    pending[self._phase] = pending.get(self._phase, 0.0) + (time.perf_counter() - self._start) * 1e6
@@ -1,4 +1,9 @@
 from game import Game
+from save import GameHistory
+from record import GameRecordWriter
+from instrumentation import Instrumentation, HistogramSink, JsonLinesSink
+from evaluation import parse_weights
+from mcts import parse_options as parse_mcts_options
 import sys
 from abc import ABC, abstractmethod
 
@@ -55,20 +60,6 @@ class SaveDecorator(Decorator):
   # so it's technically operating within the conceptual bound of GameCLI, which has a direct
   # access to _game.
 
-  def _push_pop_switch(self, push_list, pop_list):
-    # Likely so
-    '''An _undo ADAPTED to perform both undo or redo functionality'''
-    if not len(pop_list):
-      return  # nothing to restore to
-
-    push_list.append(self._cli._game.save())  # Save the current state into push list
-    game_save = pop_list.pop()  # a memento
-    self._cli._game.restore(game_save)
-    # try:  # no concern regarding failed restoration check for now.
-    #     self._originator.restore(memento)
-    # except Exception:
-    #     self.undo()
-
   def pregame_statements(self):
     '''Includes undo/redo query functionality'''
     super().pregame_statements()
@@ -77,15 +68,16 @@ class SaveDecorator(Decorator):
     # NOTE: my interpretation based on the example: the list for UNDO is ongoing. But REDO's list only exists within
     # this current scope of undo_redo. Once NEXT is called, REDO is resetted.
     # Also this isn't in the example, but I assume we can undo into a redo into undo.
+    # The history holds one small delta per turn rather than a full memento; the game records into it after
+    # every turn (which also drops the redo branch), undo/redo revert or reapply a single delta.
     if choice == "undo":
-      self._push_pop_switch(self._redo_saves, self._game_saves)
+      self._history.undo(self._cli._game)
       return True  # indicates continue
     elif choice == "redo":
-      self._push_pop_switch(self._game_saves, self._redo_saves)
+      self._history.redo(self._cli._game)
       return True
     elif choice == "next":  # indicates continue
-      self._game_saves.append(self._cli._game.save())  # save the previous state
-      self._redo_saves = []
+      pass  # the upcoming step gets recorded by the game itself
     else:
       print("INVALID INPUT")
       return True
@@ -94,8 +86,8 @@ class SaveDecorator(Decorator):
     '''Includes undo/redo state functionality'''
     super().reset_game()
 
-    self._game_saves = []  # ._mementos
-    self._redo_saves = []
+    self._history = GameHistory()  # the deltas and the undo/redo cursor
+    self._cli._game.attach_history(self._history)
 
   def run(self):
     '''Starts the CLI application with modified undo/redo parts'''
@@ -120,53 +112,165 @@ class GameCLI(CLI):
     works with all mementos via the base Memento interface.
   """
 
-  def __init__(self, player1, player2, enable_score):  # Have the game initialize the originator during run based on CLI args
+  def __init__(self, player1, player2, enable_score, record_path=None, profile_path=None, ponder=False):  # Have the game initialize the originator during run based on CLI args
     self._player1 = player1
     self._player2 = player2
     self._enable_score = enable_score
+    self._ponder = ponder  # AI players search while a human player types (see Game.enable_pondering)
+    self._game = None
+    # every game gets streamed, turn by turn, into a binary record file (see record.py) if a path is given
+    self._recorder = GameRecordWriter(record_path, append=True, flush_each_turn=True) if record_path else None
+    # every turn's phase timings go to a JSON-lines file, and a summary gets printed at the end, if a path is given
+    self._histogram = HistogramSink() if profile_path else None
+    self._instrumentation = Instrumentation(JsonLinesSink(profile_path, flush_each_turn=True), self._histogram) if profile_path else None
 
   def reset_game(self):
     '''Reset the gameboard'''
     self._game = Game(self._player1, self._player2, self._enable_score)  # should trigger the __new__ to overwrite the old game
+    if self._ponder:
+      self._game.enable_pondering()
+    if self._recorder:
+      self._recorder.start_game(self._player1, self._player2)
+      self._game.attach_recorder(self._recorder)
+    if self._instrumentation:
+      self._game.attach_instrumentation(self._instrumentation)
 
   def pregame_statements(self):
     '''Print the current boardstate and gamestate'''
-    print(self._game)
+    if self._instrumentation:
+      with self._instrumentation.measure("print_board"):
+        print(self._game)
+    else:
+      print(self._game)
 
   def run(self, pregame_func=None, reset_func=None):  # using first-order injection.
     '''Starts the CLI application'''
     
     # start the game cycle.
-    want_to_play = "yes"
-    while want_to_play == "yes":
-      # the Originator set-up
-      (reset_func() if reset_func else self.reset_game())
-
-      # Let CLI manage the game session. (Alternative: let Game manage it, and use try-except to break out)
-      while True: # while game is not over, players move
-        # pre-choice print statements:
-        if (pregame_func() if pregame_func else self.pregame_statements()):  # either returns True or None
-          continue
-
-        # Play one step of the game.
-        winner = self._game.run_one_step()
-        if winner:  # game has ended!
-          print("{} has won".format(winner))
-          break
-        # else:  # game is on going. Use this window to ask.
-        #   # add post-choice print statements here.
-        #   pass
-
-      want_to_play = input("Play again?\n")
-
+    try:  # Ctrl-C or the end of input still closes the record (marking the game unfinished) and the profile
+      want_to_play = "yes"
+      while want_to_play == "yes":
+        # the Originator set-up
+        (reset_func() if reset_func else self.reset_game())
+
+        # Let CLI manage the game session. (Alternative: let Game manage it, and use try-except to break out)
+        while True: # while game is not over, players move
+          # pre-choice print statements:
+          if (pregame_func() if pregame_func else self.pregame_statements()):  # either returns True or None
+            continue
+
+          # Play one step of the game.
+          winner = self._game.run_one_step()
+          if winner:  # game has ended!
+            print("{} has won".format(winner))
+            if self._recorder:
+              self._recorder.finish(self._game.turn_index, str(winner))
+            break
+          # else:  # game is on going. Use this window to ask.
+          #   # add post-choice print statements here.
+          #   pass
+
+        want_to_play = input("Play again?\n")
+    finally:
+      if self._game is not None:
+        self._game.close()  # an abandoned game's players too
+      if self._recorder:
+        self._recorder.close()
+      if self._instrumentation:
+        self._instrumentation.close()
+        print(self._histogram.format_report(), file=sys.stderr)  # stderr, so stdout stays the plain game transcript
+
+
+def valid_player_type(spec, player_types):
+  '''
+    Whether spec names one of player_types. The search players take a time budget in ms as an option, as in minimax:200,
+    or for minimax a fixed search depth, as in minimax:d3. MCTS takes an iteration budget instead, a parallel mode with
+    its workers and a playout policy too, as in mcts:500,root,4,heuristic or mcts:i2000 (see mcts.parse_options).
+    The heuristic player takes its weights, as in heuristic:4,2,0.5, and the value player an evaluator other than the
+    network, as in value:linear
+  '''
+  type, _, option = spec.partition(":")
+  return type in player_types and (not option or (type == "minimax" and option.isdigit())
+                                   or (type == "minimax" and option[:1] == "d" and option[1:].isdigit())
+                                   or (type == "mcts" and parse_mcts_options(option) is not None)
+                                   or (type == "heuristic" and parse_weights(option) is not None)
+                                   or (type == "value" and option == "linear"))
+
+def simulate_main(args):
+  '''`python main.py simulate p1 p2 [num_games] [--workers N] [--seed S] [--batch] [--record PATH]`: headless batch self-play'''
+  import argparse
+  from simulate import simulate, simulate_batched, format_report, AI_PLAYER_TYPES
+  parser = argparse.ArgumentParser(prog="main.py simulate", description="Play headless AI vs AI games in parallel.")
+  parser.add_argument("player1", help=f"one of {AI_PLAYER_TYPES}")
+  parser.add_argument("player2", help=f"one of {AI_PLAYER_TYPES}")
+  parser.add_argument("num_games", type=int, nargs="?", default=1000)
+  parser.add_argument("--workers", type=int, default=None, help="process pool size (default: cpu count)")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--batch", action="store_true", help="step all games at once in the vectorized NumPy engine")
+  parser.add_argument("--record", help="archive every game into this binary record file")
+  options = parser.parse_args(args)
+  if not valid_player_type(options.player1, AI_PLAYER_TYPES) or not valid_player_type(options.player2, AI_PLAYER_TYPES):
+    parser.error(f"player types must be one of {AI_PLAYER_TYPES}")
+  if options.batch:
+    report = simulate_batched(options.player1, options.player2, options.num_games, options.seed)
+  else:
+    report = simulate(options.player1, options.player2, options.num_games, options.workers, options.seed,
+                      record_path=options.record)
+  print(format_report(report))
+
+def tournament_main(args):
+  '''`python main.py tournament AGENT AGENT [...] [--swiss ROUNDS] [--games N] [--workers N] [--seed S] [--checkpoint PATH]`'''
+  import argparse
+  from simulate import AI_PLAYER_TYPES
+  from tournament import run_tournament, format_standings, CheckpointMismatchError
+  parser = argparse.ArgumentParser(prog="main.py tournament", description="Rate AI agents against each other.")
+  parser.add_argument("agents", nargs="+", help=f"player specs, types one of {AI_PLAYER_TYPES} (e.g. minimax:d3, mcts:500,root,4)")
+  parser.add_argument("--swiss", type=int, metavar="ROUNDS", help="play Swiss rounds instead of a round-robin")
+  parser.add_argument("--games", type=int, default=2, help="games per pairing, colors alternating")
+  parser.add_argument("--workers", type=int, default=None, help="process pool size (default: cpu count)")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--checkpoint", help="append finished games to this file, and resume from it")
+  options = parser.parse_args(args)
+  if len(options.agents) < 2 or len(set(options.agents)) != len(options.agents):
+    parser.error("a tournament needs at least two distinct agents")
+  if not all(valid_player_type(agent, AI_PLAYER_TYPES) for agent in options.agents):
+    parser.error(f"player types must be one of {AI_PLAYER_TYPES}")
+  try:
+    report = run_tournament(options.agents, options.swiss, options.games, options.workers, options.seed, options.checkpoint)
+  except CheckpointMismatchError as error:
+    parser.error(str(error))
+  print(format_standings(report["ratings"]))
+  print(f"{report['games']} games ({report['games_played']} played now), {report['elapsed_sec']:.2f}s")
 
 
 if __name__=='__main__':
   # Entry point of the program
+  if sys.argv[1:2] == ["simulate"]:  # headless subcommand, the rest of the args belong to it
+    simulate_main(sys.argv[2:])
+    sys.exit(0)
+  if sys.argv[1:2] == ["tournament"]:
+    tournament_main(sys.argv[2:])
+    sys.exit(0)
+
   # library of values
-  player_type = ["human", "heuristic", "random"]
+  player_type = ["human", "heuristic", "random", "minimax", "mcts", "value"]  # minimax and mcts also take a time budget, e.g. mcts:200 (ms per move), see valid_player_type
   commands = ["on", "off"]
   args = sys.argv[1:]
+  # optional, anywhere on the line: --record PATH streams every game into a binary record file,
+  # --profile PATH writes per-turn phase timings as JSON lines (see instrumentation.py),
+  # --ponder lets minimax players search while a human player types
+  ponder = "--ponder" in args
+  args = [arg for arg in args if arg != "--ponder"]
+  option_paths = {"--record": None, "--profile": None}
+  for option in option_paths:
+    if option in args:
+      option_index = args.index(option)
+      if option_index + 1 >= len(args):
+        print("Command line error")
+        sys.exit(1)
+      option_paths[option] = args[option_index + 1]
+      args = args[:option_index] + args[option_index + 2:]
+  record_path, profile_path = option_paths["--record"], option_paths["--profile"]
   # Set default values
   player1, player2, undo_redo, enable_score = "human", "human", "off", "off"
   
@@ -181,7 +285,7 @@ if __name__=='__main__':
     enable_score = args[3]
   
   # check if command line args are valid:
-  if player1 not in player_type or player2 not in player_type or undo_redo not in commands or enable_score not in commands:
+  if not valid_player_type(player1, player_type) or not valid_player_type(player2, player_type) or undo_redo not in commands or enable_score not in commands:
     print("Command line error")
     sys.exit(1)
   
@@ -189,7 +293,7 @@ if __name__=='__main__':
   enable_score = False if enable_score == "off" else True
   
   # Construct the base game cli.
-  gameCLI = GameCLI(player1, player2, enable_score)
+  gameCLI = GameCLI(player1, player2, enable_score, record_path, profile_path, ponder)
 
   # If the undo_redo option is enabled. Decorate!
   if undo_redo == "on":
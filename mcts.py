@@ -0,0 +1,365 @@
+'''
+  Monte Carlo Tree Search (UCT) over full turns (move + build), used by MCTSPlayer.
+  Playouts run on a PlayoutBoard, a bare copy of the Board bitmasks plus the four worker squares, so a playout
+  never touches Game, Player or Worker objects. The rollout policy is "random" (RandomPlayer's) or "heuristic"
+  (HeuristicPlayer's move score, with its default or tuned weights, random builds).
+
+  Parallel modes, over a process pool:
+    root - every worker process grows its own tree from the root and the root statistics get summed
+    leaf - one tree, each selected leaf gets one batch of playouts per worker process
+'''
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from evaluation import DEFAULT_WEIGHTS
+from geometry import CENTER_WEIGHTS, DISTANCES, NEIGHBOR_SQUARES, square_index, square_location
+from position import Position, decide_winner
+from save import TurnDelta, WORKER_IDS
+from symmetry import distinct_actions, stabilizer
+
+PLAYOUT_POLICIES = ("random", "heuristic")
+PARALLEL_MODES = (None, "root", "leaf")
+DEFAULT_EXPLORATION = math.sqrt(2)
+
+
+def parse_options(option):
+  '''
+    The MCTSPlayer keyword arguments of a player spec option, or None if it isn't one:
+    [BUDGET][,root|leaf,WORKERS][,random|heuristic], the budget being ms per move (500) or iterations per move (i2000),
+    e.g. mcts:500,root,4,heuristic
+  '''
+  options = {}
+  fields = option.split(",") if option else []
+  if fields and fields[0].isdigit():
+    options["time_budget_ms"] = int(fields.pop(0))
+  elif fields and fields[0][:1] == "i" and fields[0][1:].isdigit() and int(fields[0][1:]) > 0:
+    options["iterations"] = int(fields.pop(0)[1:])
+  if fields and fields[0] in ("root", "leaf"):
+    if len(fields) < 2 or not fields[1].isdigit() or int(fields[1]) < 1:
+      return None
+    options["parallel"], options["workers"] = fields[0], int(fields[1])
+    del fields[:2]
+  if fields and fields[0] in PLAYOUT_POLICIES:
+    options["policy"] = fields.pop(0)
+  return options if not fields else None
+
+
+def _pack_action(worker_index, to_square, build_square):
+  return worker_index << 10 | to_square << 5 | build_square
+
+
+class PlayoutBoard:
+  '''
+    The smallest position playouts can run on: a Board (bitmasks), the squares of workers A, B, Y, Z and the side to move.
+    Copying one is a few list copies.
+  '''
+  __slots__ = ("board", "squares", "side")
+
+  def __init__(self, board, squares, side):
+    self.board = board
+    self.squares = squares  # [A, B, Y, Z] squares
+    self.side = side  # 0 white, 1 blue
+
+  @classmethod
+  def from_game(cls, game):
+    return cls(game.board.copy(), [square_index(game.get_worker_location(worker_id)) for worker_id in WORKER_IDS],
+               game.turn_index % 2)
+
+  def copy(self):
+    return PlayoutBoard(self.board.copy(), self.squares[:], self.side)
+
+  def _can_move(self, side):
+    board = self.board
+    return any(board.legal_move_mask(square) for square in self.squares[2 * side:2 * side + 2])
+
+  def _on_level_3(self, side):
+    board = self.board
+    return any(board.height(square) == 3 for square in self.squares[2 * side:2 * side + 2])
+
+  def winner(self):
+    '''The winning side (0/1) or None'''
+    return decide_winner(self.side, self._on_level_3, self._can_move)
+
+  def legal_actions(self):
+    '''Every legal turn of the side to move, as packed ints (worker index, destination square, build square)'''
+    board = self.board
+    actions = []
+    for worker_index in (2 * self.side, 2 * self.side + 1):
+      from_square = self.squares[worker_index]
+      move_mask = board.legal_move_mask(from_square)
+      for to_square in NEIGHBOR_SQUARES[from_square]:
+        if to_square >= 0 and move_mask >> to_square & 1:
+          build_mask = board.legal_build_mask_after_move(from_square, to_square)
+          for build_square in NEIGHBOR_SQUARES[to_square]:
+            if build_square >= 0 and build_mask >> build_square & 1:
+              actions.append(_pack_action(worker_index, to_square, build_square))
+    return actions
+
+  def _move(self, worker_index, to_square):
+    self.board.remove_worker(self.squares[worker_index])
+    self.board.place_worker(to_square)
+    self.squares[worker_index] = to_square
+
+  def apply(self, action):
+    '''Play a packed turn and pass the turn'''
+    self._move(action >> 10, action >> 5 & 31)
+    self.board.build(action & 31)
+    self.side = 1 - self.side
+
+  def to_turn_delta(self, action):
+    '''The TurnDelta of a packed turn played from this position'''
+    worker_index = action >> 10
+    return TurnDelta(WORKER_IDS[worker_index], square_location(self.squares[worker_index]),
+                     square_location(action >> 5 & 31), square_location(action & 31))
+
+  def _move_score(self, worker_index, to_square, weights):
+    '''HeuristicPlayer's move score of moving the worker to to_square, with the (height, center, distance) weights'''
+    board, squares = self.board, self.squares
+    partner = squares[worker_index ^ 1]
+    opponents = squares[2:] if worker_index < 2 else squares[:2]
+    height = board.height(to_square) + board.height(partner)
+    center = CENTER_WEIGHTS[to_square] + CENTER_WEIGHTS[partner]
+    distance = 8 - sum(min(DISTANCES[opponent][to_square], DISTANCES[opponent][partner]) for opponent in opponents)
+    return weights[0] * height + weights[1] * center + weights[2] * distance
+
+  def playout(self, policy, rng, weights=DEFAULT_WEIGHTS):
+    '''
+      Play the position out in place with the rollout policy (every game ends: each turn builds, and domes cap the board)
+      Input:
+        weights - the (height, center, distance) weights of the heuristic policy's move score
+      Output:
+        int - the winning side
+    '''
+    board = self.board
+    while True:
+      winner = self.winner()
+      if winner is not None:
+        return winner
+      moves = []
+      for worker_index in (2 * self.side, 2 * self.side + 1):
+        from_square = self.squares[worker_index]
+        move_mask = board.legal_move_mask(from_square)
+        moves += [(worker_index, to_square) for to_square in NEIGHBOR_SQUARES[from_square]
+                  if to_square >= 0 and move_mask >> to_square & 1]
+      if policy == "heuristic":
+        scores = [self._move_score(worker_index, to_square, weights) for worker_index, to_square in moves]
+        best_score = max(scores)
+        moves = [move for move, score in zip(moves, scores) if score == best_score]
+      worker_index, to_square = rng.choice(moves)
+      self._move(worker_index, to_square)
+      build_mask = board.legal_build_mask(to_square)
+      board.build(rng.choice([square for square in NEIGHBOR_SQUARES[to_square] if square >= 0 and build_mask >> square & 1]))
+      self.side = 1 - self.side
+
+
+class Node:
+  '''A node of the search tree: statistics are from the point of view of the side that played into it'''
+  __slots__ = ("parent", "action", "mover", "children", "untried", "visits", "wins")
+
+  def __init__(self, parent, action, mover, untried):
+    self.parent = parent
+    self.action = action  # packed turn that leads here from the parent, None at the root
+    self.mover = mover  # the side that played action
+    self.children = []
+    self.untried = untried  # packed turns not expanded yet (empty once the position is decided)
+    self.visits = 0
+    self.wins = 0.0
+
+  def select_child(self, exploration):
+    '''The child with the best UCT value'''
+    log_visits = math.log(self.visits)
+    return max(self.children, key=lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits))
+
+
+class MCTSStats:
+  '''What one search did: iterations (tree descents), playouts and how fast they ran'''
+
+  def __init__(self):
+    self.iterations = 0
+    self.playouts = 0
+    self.elapsed = 0.0  # seconds
+    self.visits = 0  # visits of the chosen turn
+    self.win_rate = 0.0  # of the chosen turn, for the side to move
+
+  def _get_playouts_per_sec(self):
+    return self.playouts / self.elapsed if self.elapsed > 0 else 0.0
+  playouts_per_sec = property(_get_playouts_per_sec)
+
+  def __str__(self):
+    return (f"{self.iterations} iterations, {self.playouts} playouts in {self.elapsed * 1000:.0f}ms "
+            f"({self.playouts_per_sec:.0f} playouts/sec), chosen turn {self.visits} visits, win rate {self.win_rate:.0%}")
+
+
+def _new_node(parent, action, mover, position):
+  return Node(parent, action, mover, [] if position.winner() is not None else position.legal_actions())
+
+def grow_tree(root_position, iterations=None, time_budget=None, policy="random", exploration=DEFAULT_EXPLORATION,
+              rng=None, leaf_playouts=None, root_actions=None, weights=DEFAULT_WEIGHTS):
+  '''
+    Run UCT iterations from root_position until the iteration count or the time budget (seconds) runs out
+    Input:
+      leaf_playouts - function(position, rng) -> list of winners, to run each leaf's playouts elsewhere (leaf
+                      parallelism); None runs one playout per iteration in-process
+      root_actions - the packed turns the root expands into, all the legal ones if None
+      weights - the heuristic policy's move-score weights
+    Output:
+      tuple(Node, int, int) - the root, the number of iterations and the number of playouts
+  '''
+  rng = rng or random.Random()
+  deadline = time.perf_counter() + time_budget if time_budget is not None else None
+  root = _new_node(None, None, 1 - root_position.side, root_position) if root_actions is None \
+    else Node(None, None, 1 - root_position.side, list(root_actions))
+  done_iterations = playouts = 0
+  while (iterations is None or done_iterations < iterations) and (deadline is None or time.perf_counter() < deadline):
+    node, position = root, root_position.copy()
+    while not node.untried and node.children:  # selection
+      node = node.select_child(exploration)
+      position.apply(node.action)
+    if node.untried:  # expansion
+      action = node.untried.pop(rng.randrange(len(node.untried)))
+      mover = position.side
+      position.apply(action)
+      child = _new_node(node, action, mover, position)
+      node.children.append(child)
+      node = child
+    winners = leaf_playouts(position, rng) if leaf_playouts else [position.playout(policy, rng, weights)]  # simulation
+    while node is not None:  # backpropagation
+      node.visits += len(winners)
+      node.wins += sum(1 for winner in winners if winner == node.mover)
+      node = node.parent
+    done_iterations += 1
+    playouts += len(winners)
+  return root, done_iterations, playouts
+
+def _grow_tree_task(task):
+  '''Worker-process entry point of root parallelism: grow one tree, return the root statistics'''
+  root_position, iterations, time_budget, policy, exploration, seed, root_actions, weights = task
+  root, done_iterations, playouts = grow_tree(root_position, iterations, time_budget, policy, exploration, random.Random(seed),
+                                              root_actions=root_actions, weights=weights)
+  return {child.action: (child.visits, child.wins) for child in root.children}, done_iterations, playouts
+
+def distinct_root_actions(game, position):
+  '''
+    The packed legal turns of the game's position (as the PlayoutBoard position), leaving out mirror images of
+    earlier ones when the position is symmetric, as the starting position is (see symmetry.py)
+  '''
+  keys = Position.from_game(game).symmetric_hashes
+  actions = position.legal_actions()
+  if not stabilizer(keys):  # the usual case past the opening
+    return actions
+  distinct = {delta.pack() for delta in distinct_actions(keys, [position.to_turn_delta(action) for action in actions])}
+  return [action for action in actions if position.to_turn_delta(action).pack() in distinct]
+
+def _playout_task(task):
+  '''Worker-process entry point of leaf parallelism: a batch of playouts from one position'''
+  position, policy, count, seed, weights = task
+  rng = random.Random(seed)
+  return [position.copy().playout(policy, rng, weights) for _ in range(count)]
+
+
+class MonteCarloTreeSearch:
+  '''
+    UCT with a per-move iteration count or time budget (whichever is given, iterations win if both are).
+    With workers > 1 and a parallel mode, the playouts spread over a process pool that lives as long as this object.
+    weights are the heuristic policy's (height, center, distance) move-score weights, e.g. tuned ones (see tune.py).
+  '''
+
+  def __init__(self, iterations=None, time_budget_ms=500, policy="random", exploration=DEFAULT_EXPLORATION,
+               parallel=None, workers=None, leaf_batch=4, weights=DEFAULT_WEIGHTS):
+    if policy not in PLAYOUT_POLICIES:
+      raise ValueError(f"the playout policy must be one of {PLAYOUT_POLICIES}")
+    if parallel not in PARALLEL_MODES:
+      raise ValueError(f"the parallel mode must be one of {PARALLEL_MODES}")
+    self._iterations = iterations
+    self._time_budget = None if iterations else time_budget_ms / 1000
+    self._policy = policy
+    self._weights = tuple(weights)
+    self._exploration = exploration
+    self._parallel = parallel
+    self._workers = workers or 1
+    self._leaf_batch = leaf_batch  # playouts per worker process per leaf, in leaf mode
+    self._executor = None
+
+  def _get_executor(self):
+    if self._executor is None:
+      self._executor = ProcessPoolExecutor(max_workers=self._workers)
+    return self._executor
+
+  def _get_time_budget(self):
+    '''The time budget of one search in seconds, None when it runs a fixed number of iterations'''
+    return self._time_budget
+  time_budget = property(_get_time_budget)
+
+  def close(self):
+    '''Shut the process pool down, if one got started'''
+    if self._executor is not None:
+      self._executor.shutdown()
+      self._executor = None
+
+  def search(self, game, deadline=None):
+    '''
+      Find the best turn for the player to move in game (the most visited root child)
+      Input:
+        game - Game, the live game (only its board and worker squares get copied)
+        deadline - float, the time.perf_counter() to stop at instead of the time budget from now (iterations ignore it)
+      Output:
+        tuple(TurnDelta, MCTSStats)
+    '''
+    position = PlayoutBoard.from_game(game)
+    root_actions = distinct_root_actions(game, position)  # mirror images of a turn would split its visits
+    rng = random.Random(random.getrandbits(64))  # follows the global seed, so seeded games stay reproducible
+    stats = MCTSStats()
+    start = time.perf_counter()
+    time_budget = max(0.0, deadline - start) if deadline is not None and self._time_budget is not None else self._time_budget
+    if self._parallel == "root" and self._workers > 1:
+      iterations = -(-self._iterations // self._workers) if self._iterations else None
+      tasks = [(position, iterations, time_budget, self._policy, self._exploration, rng.getrandbits(64), root_actions,
+                self._weights) for _ in range(self._workers)]
+      root_stats = {}
+      for children, done_iterations, playouts in self._get_executor().map(_grow_tree_task, tasks):
+        for action, (visits, wins) in children.items():
+          total_visits, total_wins = root_stats.get(action, (0, 0.0))
+          root_stats[action] = (total_visits + visits, total_wins + wins)
+        stats.iterations += done_iterations
+        stats.playouts += playouts
+    else:
+      leaf_playouts = self._leaf_playouts if self._parallel == "leaf" and self._workers > 1 else None
+      root, stats.iterations, stats.playouts = grow_tree(position, self._iterations, time_budget, self._policy,
+                                                          self._exploration, rng, leaf_playouts, root_actions, self._weights)
+      root_stats = {child.action: (child.visits, child.wins) for child in root.children}
+    stats.elapsed = time.perf_counter() - start
+
+    if not root_stats:  # no time for even one iteration: any legal turn
+      action = position.legal_actions()[0]
+    else:
+      action = max(root_stats, key=lambda action: root_stats[action][0])
+      stats.visits = root_stats[action][0]
+      stats.win_rate = root_stats[action][1] / stats.visits
+    return position.to_turn_delta(action), stats
+
+  def _leaf_playouts(self, position, rng):
+    tasks = [(position, self._policy, self._leaf_batch, rng.getrandbits(64), self._weights) for _ in range(self._workers)]
+    return [winner for winners in self._get_executor().map(_playout_task, tasks) for winner in winners]
+
+
+if __name__ == '__main__':
+  import argparse
+  from evaluation import parse_weights
+  from game import Game
+  parser = argparse.ArgumentParser(description="Measure MCTS playout throughput from the starting position.")
+  parser.add_argument("--time-budget", type=int, default=1000, help="ms per search")
+  parser.add_argument("--policy", choices=PLAYOUT_POLICIES, default="random")
+  parser.add_argument("--weights", help="the heuristic policy's weights, e.g. 4,2,0.5 (default: HeuristicPlayer's)")
+  parser.add_argument("--parallel", choices=["root", "leaf"])
+  parser.add_argument("--workers", type=int, default=1)
+  options = parser.parse_args()
+  weights = parse_weights(options.weights) if options.weights else DEFAULT_WEIGHTS
+  if weights is None:
+    parser.error("--weights takes three numbers, e.g. 4,2,0.5")
+
+  mcts = MonteCarloTreeSearch(time_budget_ms=options.time_budget, policy=options.policy, parallel=options.parallel,
+                              workers=options.workers, weights=weights)
+  action, stats = mcts.search(Game("random", "random", False, verbose=False, shared=False))
+  mcts.close()
+  print(f"{action}: {stats}")
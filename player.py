@@ -1,7 +1,13 @@
 import abc
 from game import Game 
 from worker import Worker
+from search import AlphaBetaSearch, Ponderer
+from mcts import MonteCarloTreeSearch
+from position import Position
+from evaluation import DEFAULT_WEIGHTS
+from geometry import NEIGHBOR_SQUARES, DIRECTION_INDICES, direction_between, square_index
 import random
+import time
 
 class Player(metaclass=abc.ABCMeta):  
   '''
@@ -11,9 +17,13 @@ class Player(metaclass=abc.ABCMeta):
     NOTE: an abstract class isn't necessary in Python, but this is good for bookkeeping.
     NOTE: can have state variables and concrete functions in the abstract class
   '''
+  __slots__ = ("_color", "_side", "_game", "_workers")
+  waits_for_input = False  # True for a player that blocks on a person at the keyboard
 
-  def __init__(self, color):
+  def __init__(self, color, game=None):
     self._color = color
+    self._side = 0 if color == "white" else 1  # index of the player in the game
+    self._game = game if game is not None else Game.get_instance()  # the game this player plays in (defaults to the singleton)
   
   def __str__(self):
     return self._color
@@ -22,90 +32,118 @@ class Player(metaclass=abc.ABCMeta):
     '''Reset the worker objects to their default positions through reinitialization'''
     # Too insignificant of a check to insert a new pattern.
     if self._color == 'white':
-      self._workers = {'A': Worker('A', (3, 1)), 'B': Worker('B', (1, 3))}
+      self._workers = {'A': Worker('A', (3, 1), self._game), 'B': Worker('B', (1, 3), self._game)}
     elif self._color == 'blue':
-      self._workers = {'Y': Worker('Y', (1, 1)), 'Z': Worker('Z', (3, 3))}
+      self._workers = {'Y': Worker('Y', (1, 1), self._game), 'Z': Worker('Z', (3, 3), self._game)}
       
+  def _get_worker_ids(self):
+    '''The getter method that returns the ids of this player's workers'''
+    return self._workers.keys()
+  worker_ids = property(_get_worker_ids)
+
+  def get_worker(self, worker_id):
+    '''The Worker object with the given id, or None if it isn't one of this player's workers'''
+    return self._workers.get(worker_id)
+
   def check_game_ongoing(self):
     '''
       Checks if this player has win/lost the game
       Output:
         string "win" if win or "lose" if lose
         OR
-        a list of legal moves
+        a tuple of legal (worker_id, direction) moves
     '''
-    for worker in self._workers.values():
+    workers = self._workers.values()
+    for worker in workers:
       if worker.on_winning_position():
         return "win"
-    moves = []
-    for id, worker in self._workers.items():
-      moves += [(id, move) for move in worker.find_legal_moves("move")]  # attach with worker id identifier.
-    if len(moves) == 0:  # no legal moves available
+    moves = ()
+    for worker in workers:
+      moves += worker.legal_move_pairs()  # shared per-worker tuples, attached with the worker id identifier already
+    if not moves:  # no legal moves available
       return "lose"
     return moves
   
+  def check_game_status(self):
+    '''
+      The same verdict as check_game_ongoing, without building the list of legal moves
+      Output:
+        string "win" if win or "lose" if lose, None if the game is still on for this player
+    '''
+    for worker in self._workers.values():
+      if worker.on_winning_position():
+        return "win"
+    for worker in self._workers.values():
+      if worker.has_legal_move():
+        return None
+    return "lose"
+
   def calculate_move_score_components(self):
     '''
       Calculates then returns the (height_score, center_score, and distance_score) of the current player
     '''
     # NOTE (important):
     # Does the distance refer to 2D distance, or does height count as well?
-
     # height score: the sum of the heights of the buildings a player's workers stand on.
-    height_score = 0
     # center_score: how close the worker is from the center ring
-    center_score = 0
-
-    for worker_id in self._workers.keys():
-      worker_location = Game.get_instance().get_worker_location(worker_id)
-
-      # height score
-      level = Game.get_instance().game_state[worker_location[0]][worker_location[1]]
-      height_score += level
-      # height_score += 99999 if level == 3 else level  # level == 3 is win!!! big reward; nvm not needed by autograder
-
-      # center score
-      if worker_location == (2, 2): # center space
-        center_score += 2
-      elif abs(worker_location[0] - 2) <= 1 and abs(worker_location[1] - 2) <= 1:  # middle ring
-        center_score += 1
-
-    # distance_score: the sum of the minimum distance to the opponent's workers
-    distance_score = 0
-    opponent_workers = ['Y', 'Z'] if (self._color == "white") else ['A', 'B']
-
-    for opponent_worker_id in opponent_workers:
-      opponent_worker_location = Game.get_instance().get_worker_location(opponent_worker_id)
-
-      # Going to use L1 distance as the distance metric.
-      # List comprehension of formula. Ex. # Ex. for blue, it would be min(distance from Z to A, distance from Y to A) + min(distance from Z to B, distance from Y to B)
-      # Since we can move diagonally, the minimum distance between two points is just the maximum of dx and dy!
-      distance_score += min( [ max(abs(opponent_worker_location[0]-worker_location[0]), abs(opponent_worker_location[1]-worker_location[1]))
-          for worker_location in [Game.get_instance().get_worker_location(worker_id) for worker_id in self._workers.keys()] ] )
-      
-    distance_score = 8 - distance_score  # no clue why this works wtf
+    # distance_score: 8 - the sum of the minimum distance to the opponent's workers
+    # The game's evaluator keeps all three up to date as the workers move (see evaluation.py).
+    return self._game.evaluator.components(self._side)
+
+  def _play_action(self, action):
+    '''Carry out a turn chosen by a search (a TurnDelta): move the worker, build, and report it'''
+    from_square, to_square = square_index(action.from_location), square_index(action.to_location)
+    direction = direction_between(from_square, to_square)
+    build_direction = direction_between(to_square, square_index(action.build_location))
+
+    self._workers[action.worker_id].move(direction)
+    self._workers[action.worker_id].build(build_direction)
 
-    return height_score, center_score, distance_score
+    self._report_decision(action.worker_id, direction, build_direction)  # print the outcome of User's choice!
 
   def _generate_print_string(self, worker_id, direction, build_direction):
     string_to_print = f"{worker_id},{direction},{build_direction}"
-    string_to_print += (" " + str(self.calculate_move_score_components())) if Game.get_instance().enable_score else ""
+    string_to_print += (" " + str(self.calculate_move_score_components())) if self._game.enable_score else ""
     return string_to_print
+
+  def _report_decision(self, worker_id, direction, build_direction):
+    '''Print the outcome of this turn's choice, unless the game is running headless'''
+    if self._game.verbose:
+      profile = self._game.turn_profile
+      if profile:  # the decision ends here, the printing gets timed on its own
+        profile.lap("make_decision")
+      self._game.output(self._generate_print_string(worker_id, direction, build_direction))
+      if profile:
+        profile.lap("report")
       
   @abc.abstractmethod
   def make_decision(self, legal_moves):
     '''
       Make a decision on which worker to move to where and build where for this step, then carry it out.
       Input:
-        legal_moves - a non-empty set of (str, str), each representing a unique legal (worker_id, move)
+        legal_moves - a non-empty tuple of (str, str), each representing a unique legal (worker_id, move)
       Output:
         None
     '''
     pass
 
+  def start_pondering(self):
+    '''Think on the opponent's turn, for the players that can (see MinimaxPlayer). The game calls it while a human decides.'''
+    pass
+
+  def stop_pondering(self):
+    '''Stop thinking on the opponent's turn, before the game goes on'''
+    pass
+
+  def close(self):
+    '''Release what the player holds on to between turns (see MCTSPlayer). The game calls it once it's over.'''
+    pass
+
 
 class HumanPlayer(Player):
   '''Implement the interactive human Player using the Player interface.'''
+  __slots__ = ()
+  waits_for_input = True  # the opponent may ponder while this player types
 
   def make_decision(self, legal_moves):
     # select worker
@@ -148,10 +186,11 @@ class HumanPlayer(Player):
     
     worker.build(build)
 
-    print(self._generate_print_string(worker_id, direction, build))  # print the outcome of User's choice!
+    self._report_decision(worker_id, direction, build)  # print the outcome of User's choice!
 
 class RandomPlayer(Player):
   '''Implement the automated random AI Player using the Player interface.'''
+  __slots__ = ()
   
   def make_decision(self, legal_moves):
     '''Randomly choose a move from the set of allowed moves'''
@@ -160,10 +199,47 @@ class RandomPlayer(Player):
     build_direction = random.choice(self._workers[worker_id].find_legal_moves("build"))  # at least 1 exists
     self._workers[worker_id].build(build_direction)  # build a level there
 
-    print(self._generate_print_string(worker_id, direction, build_direction))  # print the outcome of User's choice!
+    self._report_decision(worker_id, direction, build_direction)  # print the outcome of User's choice!
+
+class RemotePlayer(Player):
+  '''
+    Implement a human playing over a connection (see server.py) using the Player interface.
+    The session checks the turn the human sent and queues it, then runs the game step, which plays it here.
+  '''
+  __slots__ = ("_pending",)
+
+  def __init__(self, color, game=None):
+    super().__init__(color, game)
+    self._pending = None  # the queued (worker_id, direction, build_direction)
+
+  def queue_decision(self, worker_id, direction, build_direction):
+    '''Set the (already validated) turn the next make_decision plays'''
+    self._pending = (worker_id, direction, build_direction)
+
+  def make_decision(self, legal_moves):
+    '''Play the queued turn'''
+    worker_id, direction, build_direction = self._pending
+    self._pending = None
+    self._workers[worker_id].move(direction)
+    self._workers[worker_id].build(build_direction)
+
+    self._report_decision(worker_id, direction, build_direction)  # print the outcome of User's choice!
 
 class HeuristicPlayer(Player):
-  '''Implement the automated heuristic AI Player using the Player interface.'''
+  '''
+    Implement the automated heuristic AI Player using the Player interface.
+    The move score weighs the (height, center, distance) components with weights, (3, 2, 1) unless tuned (see tune.py).
+  '''
+  __slots__ = ("_weights",)
+
+  def __init__(self, color, game=None, weights=DEFAULT_WEIGHTS):
+    super().__init__(color, game)
+    self._weights = tuple(weights)
+
+  def _get_weights(self):
+    '''The getter method that returns the (height, center, distance) weights of the move score'''
+    return self._weights
+  weights = property(_get_weights)
   
   def make_decision(self, legal_moves):
     # look at each available move, calculates a move_score, and pick the highest one, breaking any ties randomly.
@@ -171,18 +247,15 @@ class HeuristicPlayer(Player):
 
     max_move_score_moves = []  # the cache during the calculation
     max_move_score = None  # the running max
+    c1, c2, c3 = self._weights  # parameter weights
 
-    for worker_id, direction in legal_moves:
-      # cache the old location, move to new location
-      original_location = self._workers[worker_id].move(direction)
+    for move in legal_moves:
+      worker_id, direction = move
+      # where the worker would end up. The evaluator scores it from there, nothing actually gets moved.
+      new_square = NEIGHBOR_SQUARES[self._workers[worker_id].square][DIRECTION_INDICES[direction]]
 
       # calculate the components
-      height_score, center_score, distance_score = self.calculate_move_score_components()
-
-      # parameter weights
-      c1 = 3
-      c2 = 2
-      c3 = 1
+      height_score, center_score, distance_score = self._game.evaluator.components_after_move(worker_id, new_square)
 
       # calculuate the total move score
       move_score = c1 * height_score + c2 * center_score + c3 * distance_score
@@ -190,16 +263,13 @@ class HeuristicPlayer(Player):
       # append the result to the cache, if it's a max
       if not max_move_score:  # first value, the initial baseline
         max_move_score = move_score
-        max_move_score_moves.append((worker_id, direction))
+        max_move_score_moves.append(move)
       else:
         if move_score > max_move_score:
           max_move_score = move_score
-          max_move_score_moves = [(worker_id, direction)]  # resets the cache
+          max_move_score_moves = [move]  # resets the cache
         elif move_score == max_move_score:
-          max_move_score_moves.append((worker_id, direction))  # a valid option
-      
-      # restore to old location
-      self._workers[worker_id].move(original_location)
+          max_move_score_moves.append(move)  # a valid option
 
     # Pick the move that has the maximum move_score (break tie randomly)
     worker_id, direction = random.choice(max_move_score_moves)
@@ -211,4 +281,115 @@ class HeuristicPlayer(Player):
     build_direction = random.choice(self._workers[worker_id].find_legal_moves("build"))  # at least 1 exists
     self._workers[worker_id].build(build_direction)  # build a level there
 
-    print(self._generate_print_string(worker_id, direction, build_direction))  # print the outcome of User's choice!
\ No newline at end of file
+    self._report_decision(worker_id, direction, build_direction)  # print the outcome of User's choice!
+
+class MinimaxPlayer(Player):
+  '''
+    Implement the automated search AI Player using the Player interface: alpha-beta over full (move, build) turns.
+    While the position is in the opening book (see book.py), the book turn is played without searching, and a win
+    the endgame solver proves (see endgame.py) is played the same way. The solver gets at most half of the time budget
+    and the search whatever the solver left.
+    Pondering searches the opponent's position on a background thread while a human opponent thinks, into the
+    transposition table the next search starts from.
+  '''
+  __slots__ = ("_search", "_book", "_endgame", "_ponderer", "last_search_stats")
+
+  def __init__(self, color, game=None, time_budget_ms=500, max_depth=8, book=None, endgame=None):
+    super().__init__(color, game)
+    self._search = AlphaBetaSearch(max_depth=max_depth, time_budget_ms=time_budget_ms)
+    self._book = book  # an OpeningBook, or None to always search
+    self._endgame = endgame  # an EndgameSolver, or None
+    self._ponderer = Ponderer(self._search)
+    self.last_search_stats = None  # the SearchStats of the latest decision (None if it came from the book or the solver), for tuning depth against latency
+
+  def start_pondering(self):
+    '''Search the opponent's position in the background until stop_pondering'''
+    self._ponderer.start(Position.from_game(self._game))
+
+  def stop_pondering(self):
+    stats = self._ponderer.stop()
+    if stats and self._game.verbose and self._game.enable_score:  # for debugging, same switch as the scores
+      self._game.output(f"ponder: {stats}")
+
+  def make_decision(self, legal_moves):
+    '''Play the book turn or a proven win if there is one, else search as deep as the time budget allows and play the best turn found'''
+    start = time.perf_counter()
+    book_entry = self._book.lookup(self._game) if self._book else None
+    winning_action = self._endgame.winning_turn(self._game, start + self._search.time_budget / 2) \
+      if self._endgame and not book_entry else None
+    if book_entry:
+      action, self.last_search_stats = book_entry[0], None
+    elif winning_action:
+      action, self.last_search_stats = winning_action, None
+    else:
+      action, self.last_search_stats = self._search.search(self._game, start + self._search.time_budget)
+    self._play_action(action)
+    if self._game.verbose and self._game.enable_score:  # for debugging, same switch as the scores
+      self._game.output(f"search: {self.last_search_stats}" if self.last_search_stats
+                        else f"book: score {book_entry[1]}" if book_entry else "endgame: proven win")
+
+
+class MCTSPlayer(Player):
+  '''
+    Implement the Monte Carlo Tree Search AI Player using the Player interface: UCT over full turns with random/heuristic playouts
+    (the heuristic ones score moves with weights, like HeuristicPlayer).
+    While the position is in the opening book (see book.py), the book turn is played without searching, and a win the
+    endgame solver proves (see endgame.py) is played the same way. With a time budget, the solver gets at most half of it
+    and the search whatever the solver left.
+  '''
+  __slots__ = ("_search", "_book", "_endgame", "last_search_stats")
+
+  def __init__(self, color, game=None, time_budget_ms=500, iterations=None, policy="random", parallel=None, workers=None, book=None,
+               endgame=None, weights=DEFAULT_WEIGHTS):
+    super().__init__(color, game)
+    self._search = MonteCarloTreeSearch(iterations, time_budget_ms, policy, parallel=parallel, workers=workers, weights=weights)
+    self._book = book  # an OpeningBook, or None to always search
+    self._endgame = endgame  # an EndgameSolver, or None
+    self.last_search_stats = None  # the MCTSStats of the latest decision (None if it came from the book or the solver), playouts/sec included
+
+  def make_decision(self, legal_moves):
+    '''Play the book turn or a proven win if there is one, else grow the search tree for the time (or iteration) budget, then play the most visited turn'''
+    start, time_budget = time.perf_counter(), self._search.time_budget
+    solver_deadline, deadline = (start + time_budget / 2, start + time_budget) if time_budget is not None else (None, None)
+    book_entry = self._book.lookup(self._game) if self._book else None
+    winning_action = self._endgame.winning_turn(self._game, solver_deadline) if self._endgame and not book_entry else None
+    if book_entry:
+      action, self.last_search_stats = book_entry[0], None
+    elif winning_action:
+      action, self.last_search_stats = winning_action, None
+    else:
+      action, self.last_search_stats = self._search.search(self._game, deadline)
+    self._play_action(action)
+    if self._game.verbose and self._game.enable_score:  # for debugging, same switch as the scores
+      self._game.output(f"mcts: {self.last_search_stats}" if self.last_search_stats
+                        else f"book: score {book_entry[1]}" if book_entry else "endgame: proven win")
+
+  def close(self):
+    '''Shut down the parallel modes' process pool (a later search would start a new one)'''
+    self._search.close()
+
+
+class ValuePlayer(Player):
+  '''
+    Implement an AI Player that scores all of its legal turns in one batched call to an evaluator (see valuenet.py)
+    and plays the best one, breaking ties randomly. While the position is in the opening book (see book.py), the book
+    turn is played instead.
+  '''
+  __slots__ = ("_evaluator", "_book")
+
+  def __init__(self, color, game=None, evaluator=None, book=None):
+    super().__init__(color, game)
+    self._evaluator = evaluator  # a valuenet.BatchEvaluator
+    self._book = book  # an OpeningBook, or None to always evaluate
+
+  def make_decision(self, legal_moves):
+    '''Play the book turn if there is one, else encode the position after every legal turn, score them all at once and play the best'''
+    book_entry = self._book.lookup(self._game) if self._book else None
+    if book_entry:
+      self._play_action(book_entry[0])
+      return
+    position = Position.from_game(self._game)
+    actions = position.legal_actions()
+    scores = self._evaluator.score_actions(position, actions).tolist()
+    best_score = max(scores)
+    self._play_action(random.choice([action for action, score in zip(actions, scores) if score == best_score]))
@@ -0,0 +1,222 @@
+'''
+  An immutable snapshot of a game position for search and what-if evaluation.
+  A Position is a value: applying a turn returns a new Position and the old one stays valid, so search trees,
+  caches and other processes can hold on to positions without ever touching (or copying) a live Game.
+'''
+from board import DOME_LEVEL, FULL_MASK
+from geometry import CENTER_WEIGHTS, DISTANCES, NEIGHBOR_MASKS, NEIGHBOR_SQUARES, square_index, square_location
+from save import GameSave, TurnDelta, WORKER_IDS
+from symmetry import SYMMETRIC_MOVE_KEYS, SYMMETRIC_BUILD_KEYS, symmetric_hashes, canonical, canonical_code, action_from_code
+from zobrist import HEIGHT_KEYS, WORKER_KEYS, SIDE_KEY, compute_hash
+
+
+def decide_winner(side, on_level_3, can_move):
+  '''
+    The rule of Game.run_one_step, shared by every position representation: the winning side (0/1), or None while
+    the game is on. The side to move wins standing on level 3, or when the opponent is stuck without standing on it.
+    Input:
+      side - int, the side to move
+      on_level_3, can_move - function(side) -> bool, asked only as far as the rule needs
+  '''
+  if on_level_3(side) or (not on_level_3(1 - side) and not can_move(1 - side)):
+    return side
+  if not can_move(side) or on_level_3(1 - side):
+    return 1 - side
+  return None
+
+
+class Position:
+  '''
+    The 25 heights, the squares of workers A, B, Y, Z and the turn index, plus the bitmasks and the Zobrist hash
+    derived from them (kept up to date incrementally by apply), along with the label-free hashes of its 8 mirror
+    images (see symmetry.py) that caches key on. Hashable and comparable: two positions are equal when the board,
+    the workers and the side to move are.
+  '''
+  __slots__ = ("_heights", "_squares", "_turn_index", "_level_masks", "_worker_mask", "_key", "_symmetric_keys")
+
+  def __init__(self, heights, squares, turn_index):
+    '''
+      Input:
+        heights - the 25 square heights
+        squares - the squares of workers A, B, Y, Z, in that order
+        turn_index - int, the number of turns played (its parity is the side to move)
+    '''
+    self._heights = bytes(heights)
+    self._squares = tuple(squares)
+    self._turn_index = turn_index
+    level_masks = [FULL_MASK] + [0] * DOME_LEVEL  # level_masks[k]: the squares at least k high, as in Board
+    for square, height in enumerate(self._heights):
+      for level in range(1, height + 1):
+        level_masks[level] |= 1 << square
+    self._level_masks = tuple(level_masks)
+    self._worker_mask = sum(1 << square for square in self._squares)
+    self._key = compute_hash(self._heights, {worker_id: square_location(square) for worker_id, square in zip(WORKER_IDS, self._squares)},
+                             turn_index)
+    self._symmetric_keys = symmetric_hashes(self._heights, self._squares, turn_index)
+
+  @classmethod
+  def from_game(cls, game):
+    '''The current position of a Game'''
+    return cls(game.board.heights, [square_index(game.get_worker_location(worker_id)) for worker_id in WORKER_IDS], game.turn_index)
+
+  def to_save(self):
+    '''The position as a GameSave, so a Game can restore() it'''
+    return GameSave(self._heights, {worker_id: square_location(square) for worker_id, square in zip(WORKER_IDS, self._squares)},
+                    self._turn_index)
+
+  def _get_heights(self):
+    return self._heights
+  heights = property(_get_heights)
+
+  def _get_squares(self):
+    return self._squares
+  squares = property(_get_squares)
+
+  def _get_turn_index(self):
+    return self._turn_index
+  turn_index = property(_get_turn_index)
+
+  def _get_side(self):
+    '''The side to move, 0 (white) or 1 (blue)'''
+    return self._turn_index % 2
+  side = property(_get_side)
+
+  def _get_zobrist_hash(self):
+    return self._key
+  zobrist_hash = property(_get_zobrist_hash)
+
+  def _get_symmetric_hashes(self):
+    '''The label-free hashes of the position's 8 images, one per transform in symmetry.TRANSFORMS'''
+    return self._symmetric_keys
+  symmetric_hashes = property(_get_symmetric_hashes)
+
+  def _get_canonical_hash(self):
+    '''The key shared by the position, its mirror images and its worker-label swaps'''
+    return min(self._symmetric_keys)
+  canonical_hash = property(_get_canonical_hash)
+
+  def _get_canonical_transform(self):
+    '''
+      The transform (an index into symmetry.TRANSFORMS) that takes this position to its canonical orientation;
+      its inverse maps turns and Worker.WORKER_MOVES directions back (see symmetry.transform_direction)
+    '''
+    return canonical(self._symmetric_keys)[1]
+  canonical_transform = property(_get_canonical_transform)
+
+  def canonical_code(self, action):
+    '''A legal turn as its 11-bit code in the canonical orientation, for storing next to canonical_hash'''
+    return canonical_code(action, self.canonical_transform)
+
+  def action_from_canonical(self, code):
+    '''The inverse of canonical_code: the TurnDelta on this board, or None if the code can't be a turn here'''
+    return action_from_code(code, self.canonical_transform, self._squares)
+
+  def __hash__(self):
+    return self._key
+
+  def __eq__(self, other):
+    return isinstance(other, Position) and self._key == other._key and self._heights == other._heights \
+      and self._squares == other._squares and self._turn_index % 2 == other._turn_index % 2
+
+  def __repr__(self):
+    return f"Position({self._heights.hex()}, {self._squares}, {self._turn_index})"
+
+  def legal_move_mask(self, square):
+    '''The squares a worker on square can move into: free and at most one level up (the rules of Board.legal_move_mask)'''
+    blocked = self._worker_mask
+    climb_limit = self._heights[square] + 2
+    if climb_limit <= DOME_LEVEL:
+      blocked |= self._level_masks[climb_limit]
+    return NEIGHBOR_MASKS[square] & ~blocked
+
+  def legal_build_mask_after_move(self, from_square, to_square):
+    '''The squares a worker could build on after moving from from_square to to_square'''
+    occupied = (self._worker_mask & ~(1 << from_square)) | 1 << to_square
+    return NEIGHBOR_MASKS[to_square] & ~(occupied | self._level_masks[DOME_LEVEL])
+
+  def _on_level_3(self, side):
+    return self._heights[self._squares[2 * side]] == 3 or self._heights[self._squares[2 * side + 1]] == 3
+
+  def _can_move(self, side):
+    return bool(self.legal_move_mask(self._squares[2 * side]) or self.legal_move_mask(self._squares[2 * side + 1]))
+
+  def has_winning_move(self):
+    '''Whether the side to move can step a worker onto level 3 this turn, which wins on the spot'''
+    side = self._turn_index % 2
+    return bool(self.legal_move_mask(self._squares[2 * side]) & self._level_masks[3]
+                or self.legal_move_mask(self._squares[2 * side + 1]) & self._level_masks[3])
+
+  def is_endgame(self):
+    '''Whether some worker stands next to a level 2 or 3 square, the positions where a win can be a few plies away'''
+    near = 0
+    for square in self._squares:
+      near |= NEIGHBOR_MASKS[square]
+    return bool(near & self._level_masks[2] & ~self._level_masks[DOME_LEVEL])
+
+  def winner(self):
+    '''The winning side (0/1), or None while the game is on'''
+    return decide_winner(self._turn_index % 2, self._on_level_3, self._can_move)
+
+  def legal_actions(self):
+    '''Every legal turn (move + build) of the side to move, as TurnDeltas, in worker then WORKER_MOVES order'''
+    actions = []
+    side = self._turn_index % 2
+    for worker_index in (2 * side, 2 * side + 1):
+      from_square = self._squares[worker_index]
+      from_location = square_location(from_square)
+      move_mask = self.legal_move_mask(from_square)
+      for to_square in NEIGHBOR_SQUARES[from_square]:
+        if to_square < 0 or not move_mask >> to_square & 1:
+          continue
+        to_location = square_location(to_square)
+        build_mask = self.legal_build_mask_after_move(from_square, to_square)
+        for build_square in NEIGHBOR_SQUARES[to_square]:
+          if build_square >= 0 and build_mask >> build_square & 1:
+            actions.append(TurnDelta(WORKER_IDS[worker_index], from_location, to_location, square_location(build_square)))
+    return actions
+
+  def apply(self, action):
+    '''
+      The position after a turn
+      Input:
+        action - TurnDelta, a legal turn of the side to move
+      Output:
+        Position - a new position, this one is unchanged
+    '''
+    worker_id = action.worker_id
+    worker_index = WORKER_IDS.index(worker_id)
+    from_square, to_square = self._squares[worker_index], square_index(action.to_location)
+    build_square = square_index(action.build_location)
+    level = self._heights[build_square] + 1
+
+    position = Position.__new__(Position)
+    heights = bytearray(self._heights)
+    heights[build_square] = level
+    position._heights = bytes(heights)
+    squares = list(self._squares)
+    squares[worker_index] = to_square
+    position._squares = tuple(squares)
+    position._turn_index = self._turn_index + 1
+    level_masks = list(self._level_masks)
+    level_masks[level] |= 1 << build_square
+    position._level_masks = tuple(level_masks)
+    position._worker_mask = self._worker_mask ^ (1 << from_square) ^ (1 << to_square)
+    worker_keys = WORKER_KEYS[worker_id]
+    position._key = self._key ^ worker_keys[from_square] ^ worker_keys[to_square] \
+      ^ HEIGHT_KEYS[build_square][level - 1] ^ HEIGHT_KEYS[build_square][level] ^ SIDE_KEY
+    position._symmetric_keys = tuple(key ^ moved ^ built for key, moved, built in zip(
+      self._symmetric_keys, SYMMETRIC_MOVE_KEYS[worker_index // 2][from_square][to_square], SYMMETRIC_BUILD_KEYS[build_square][level]))
+    return position
+
+  def components(self, side):
+    '''
+      The (height, center, distance) move-score components of a side, as the IncrementalEvaluator computes them
+      Output:
+        tuple(int, int, int)
+    '''
+    own = self._squares[2 * side:2 * side + 2]
+    opponents = self._squares[2 - 2 * side:4 - 2 * side]
+    height = self._heights[own[0]] + self._heights[own[1]]
+    center = CENTER_WEIGHTS[own[0]] + CENTER_WEIGHTS[own[1]]
+    distance = 8 - sum(min(DISTANCES[opponent][own[0]], DISTANCES[opponent][own[1]]) for opponent in opponents)
+    return height, center, distance
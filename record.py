@@ -0,0 +1,205 @@
+'''
+  A compact binary game-record format, written as the game is played and replayed by applying the deltas.
+
+  A record file is a stream of game records, one after the other, so files can simply be concatenated:
+    header - 10 bytes: magic b"SGR1", version, winner (0 unfinished, 1 white, 2 blue), number of turns
+             (0xFFFF while the game is still being written), the byte lengths of the white and blue player specs,
+             then the two specs themselves (at most 64 bytes each, "heuristic" vs "random" takes 15)
+    turns  - 2 bytes per turn, a packed TurnDelta (worker, destination square, move direction, build direction)
+  Every game starts from the fixed initial position, so the header plus the turns are the whole game.
+'''
+import os
+import struct
+from game import Game
+from save import TurnDelta
+
+MAGIC = b"SGR1"
+VERSION = 3  # 1 had 16-byte player types, too short for tuned specs like heuristic:3.14159,2.71828,1.41421, 2 had 64-byte ones
+PLAYER_TYPE_SIZE = 64  # the longest player spec a record (or an archive) takes, in bytes
+HEADER = struct.Struct("<4sBBHBB")  # followed by the two player specs
+TURN = struct.Struct("<H")
+UNFINISHED = 0xFFFF  # the number of turns while the record is still open
+WINNER_CODES = {None: 0, "white": 1, "blue": 2}
+WINNER_COLORS = {code: color for color, code in WINNER_CODES.items()}
+
+
+class RecordFormatError(Exception):
+  '''Raised when a file isn't (or is no longer) a valid game-record stream'''
+  pass
+
+
+def encode_player_type(spec):
+  '''A player spec as the bytes stored after a header, ValueError if it's too long'''
+  encoded = spec.encode()
+  if len(encoded) > PLAYER_TYPE_SIZE:
+    raise ValueError(f"player spec {spec!r} is longer than the {PLAYER_TYPE_SIZE} bytes a record can hold")
+  return encoded
+
+def unpack_header(data, offset=0):
+  '''
+    The header of the record starting at offset in data (bytes-like)
+    Output:
+      tuple(int, int, str, str, int) - the winner code, the number of turns, the white and blue player specs, and the
+                                       offset of the turns (the end of the header)
+  '''
+  if len(data) - offset < HEADER.size:
+    raise RecordFormatError(f"truncated header at byte {offset}")
+  magic, version, winner, num_turns, p1_size, p2_size = HEADER.unpack_from(data, offset)
+  if magic != MAGIC or version != VERSION:
+    raise RecordFormatError(f"not a version {VERSION} game record at byte {offset}")
+  p1_start = offset + HEADER.size
+  p2_start = p1_start + p1_size
+  turns_start = p2_start + p2_size
+  if len(data) < turns_start:
+    raise RecordFormatError(f"truncated header at byte {offset}")
+  return winner, num_turns, bytes(data[p1_start:p2_start]).decode(), bytes(data[p2_start:turns_start]).decode(), turns_start
+
+
+class GameRecordWriter:
+  '''
+    Streams game records into a file. Game calls record() after every turn once the writer is attached
+    (Game.attach_recorder). Writing turn t again (after an undo) overwrites it and drops everything after it.
+  '''
+
+  def __init__(self, path, append=False, flush_each_turn=False):
+    # not "ab": an append-mode file ignores seeks for writing, and undone turns get overwritten in place
+    self._file = open(path, "r+b" if append and os.path.exists(path) else "wb")
+    self._flush_each_turn = flush_each_turn
+    self._game_start = None  # file offset of the open record's header
+    self._turns_start = None  # file offset of its first turn
+    self._turns_written = 0
+    if append:
+      self._close_dangling_record()
+
+  def _close_dangling_record(self):
+    '''
+      Close a record a killed writer left open at the end of the file (it would swallow every record appended after
+      it): keep its whole turns, drop a half-written turn or header
+    '''
+    self._file.seek(0, 2)
+    size = self._file.tell()
+    offset = 0
+    while offset < size:
+      self._file.seek(offset)
+      data = self._file.read(HEADER.size + 2 * PLAYER_TYPE_SIZE)  # the longest header there can be
+      if len(data) < HEADER.size or len(data) < HEADER.size + sum(HEADER.unpack_from(data)[4:]):
+        self._file.truncate(offset)  # the writer died writing the header
+        break
+      _, num_turns, _, _, turns_start = unpack_header(data)
+      turns_start += offset
+      if num_turns == UNFINISHED:
+        num_turns = min((size - turns_start) // TURN.size, UNFINISHED - 1)
+        self._file.truncate(turns_start + num_turns * TURN.size)
+        self._file.seek(offset + 5)  # the winner and turn count fields, as in finish()
+        self._file.write(struct.pack("<BH", WINNER_CODES[None], num_turns))
+        break
+      offset = turns_start + num_turns * TURN.size
+    self._file.seek(0, 2)
+
+  def start_game(self, p1_type, p2_type):
+    '''Open a new record at the end of the file, closing any record left open'''
+    p1_spec, p2_spec = encode_player_type(p1_type), encode_player_type(p2_type)
+    header = HEADER.pack(MAGIC, VERSION, 0, UNFINISHED, len(p1_spec), len(p2_spec)) + p1_spec + p2_spec
+    if self._game_start is not None:
+      self.finish(self._turns_written, None)
+    self._file.seek(0, 2)
+    self._game_start = self._file.tell()
+    self._turns_start = self._game_start + len(header)
+    self._file.write(header)
+    self._turns_written = 0
+
+  def record(self, turn_index, delta):
+    '''
+      Write the delta of the turn played at turn_index (turns count from 0 at the start of this record)
+      Input:
+        turn_index - int, <= the number of turns written so far
+        delta - TurnDelta
+    '''
+    if turn_index != self._turns_written:  # an undo happened: rewrite from this turn on
+      self._file.seek(self._turns_start + turn_index * TURN.size)
+      self._file.truncate()
+    self._file.write(TURN.pack(delta.pack()))
+    self._turns_written = turn_index + 1
+    if self._flush_each_turn:
+      self._file.flush()
+
+  def finish(self, num_turns, winner_color):
+    '''Close the open record: keep its first num_turns turns and fill in the header'''
+    if num_turns != self._turns_written:
+      self._file.seek(self._turns_start + num_turns * TURN.size)
+      self._file.truncate()
+    self._file.seek(self._game_start + 5)  # the winner and turn count fields, right after the magic and version
+    self._file.write(struct.pack("<BH", WINNER_CODES[winner_color], num_turns))
+    self._file.seek(0, 2)
+    self._file.flush()
+    self._game_start = None
+
+  def close(self):
+    if self._game_start is not None:
+      self.finish(self._turns_written, None)
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+class GameRecord:
+  '''One game of a record file: the header fields and the packed turns, decoded lazily'''
+
+  def __init__(self, p1_type, p2_type, winner, turns):
+    self.p1_type = p1_type
+    self.p2_type = p2_type
+    self.winner = winner  # "white", "blue", or None if the record was never finished
+    self._turns = turns  # bytes, 2 per turn
+
+  def __len__(self):
+    '''The number of turns recorded'''
+    return len(self._turns) // TURN.size
+
+  def delta(self, turn_index):
+    '''The TurnDelta of the turn played at turn_index'''
+    return TurnDelta.unpack(TURN.unpack_from(self._turns, turn_index * TURN.size)[0])
+
+  def deltas(self):
+    for (code,) in TURN.iter_unpack(self._turns):
+      yield TurnDelta.unpack(code)
+
+  def position_at(self, turn_index):
+    '''
+      Rebuild the position at the start of turn_index by replaying the deltas from the initial position
+      Output:
+        Game - a new headless game, with turn_index turns played
+    '''
+    if not 0 <= turn_index <= len(self):
+      raise IndexError(f"turn {turn_index} is not in this {len(self)}-turn record")
+    game = Game("random", "random", False, verbose=False, shared=False)
+    for index in range(turn_index):
+      game.apply_delta(self.delta(index))
+    return game
+
+
+def parse_records(data):
+  '''
+    Split a record stream (bytes-like) into GameRecords. An unfinished record runs to the end of the data.
+    Output:
+      list[GameRecord]
+  '''
+  records = []
+  offset = 0
+  while offset < len(data):
+    winner, num_turns, p1_type, p2_type, offset = unpack_header(data, offset)
+    if num_turns == UNFINISHED:  # runs to the end of the data (minus a half-written turn, if the writer died mid-write)
+      end = offset + (len(data) - offset) // TURN.size * TURN.size
+    else:
+      end = offset + num_turns * TURN.size
+    records.append(GameRecord(p1_type, p2_type, WINNER_COLORS[winner], bytes(data[offset:end])))
+    offset = len(data) if num_turns == UNFINISHED else end
+  return records
+
+def read_records(path):
+  '''All the GameRecords in a record file'''
+  with open(path, "rb") as file:
+    return parse_records(file.read())
@@ -1,13 +1,15 @@
 from abc import ABC, abstractmethod
-from copy import deepcopy
+from array import array
+from geometry import NEIGHBOR_SQUARES, OPPOSITE_DIRECTION, square_index, square_location
 
 class Save(ABC):
   '''
-    The Memento interface provides a way to retrieve the memento's metadata, such as creation date or name. 
+    The Memento interface provides a way to retrieve the memento's metadata, such as creation date or name.
     However, it doesn't expose the Originator's state.
     The "Abstract Memento" of the Memento Design Pattern.
   '''
-  
+  __slots__ = ()
+
   @abstractmethod
   def get_overall_game_state(self):
     pass
@@ -15,19 +17,123 @@ class Save(ABC):
 class GameSave(Save):
   '''
     The "Concrete Memento" of the Memento Design Pattern.
+    A full snapshot, but a compact one: the 25 heights, the 4 worker locations and the turn index.
+    No Player/Worker objects are copied, restoring moves the game's existing workers back into place.
   '''
-  def __init__(self, game_state: list, worker_locations: dict, players: list, enable_score: bool, turn_index: int):
-    # Create deep copies of the mutable objects; else they'll be saved by reference!
-    # RIP memory.
-    self._game_state = deepcopy(game_state)  # a list of list of int
-    self._worker_locations = deepcopy(worker_locations)  # a dictionary of tuples
-    self._players = deepcopy(players)  # a list of Player objects (deepcopy does recursive copying so Workers are copied too)
-    self._enable_score = enable_score
+  __slots__ = ("_heights", "_worker_locations", "_turn_index")
+
+  def __init__(self, heights, worker_locations: dict, turn_index: int):
+    self._heights = bytes(heights)  # 25 levels, one byte each
+    self._worker_locations = tuple(worker_locations.items())  # ((worker_id, (row, col)), ...), immutable so no copy needed later
     self._turn_index = turn_index  # an int
 
   def get_overall_game_state(self):
     """
       The Originator Game uses this method when restoring its state.
     """
-    return self._game_state, self._worker_locations, self._players, self._enable_score, self._turn_index
-    
+    return self._heights, self._worker_locations, self._turn_index
+
+
+WORKER_IDS = "ABYZ"  # worker id <-> 2-bit index in a packed delta
+
+class TurnDelta:
+  '''
+    Everything one turn changed: which worker moved from where to where, and which square it built on.
+    Applying or reverting it is O(1). Packs into a 13-bit int (worker, destination square, move direction, build direction),
+    which is what GameHistory actually stores.
+  '''
+  __slots__ = ("worker_id", "from_location", "to_location", "build_location")
+
+  def __init__(self, worker_id, from_location, to_location, build_location):
+    self.worker_id = worker_id
+    self.from_location = from_location  # tuple(int, int)
+    self.to_location = to_location  # tuple(int, int)
+    self.build_location = build_location  # tuple(int, int)
+
+  def pack(self):
+    '''Encode the delta as an int < 2**13: worker (2 bits) | to square (5 bits) | move direction (3 bits) | build direction (3 bits)'''
+    from_square, to_square = square_index(self.from_location), square_index(self.to_location)
+    move_direction = NEIGHBOR_SQUARES[from_square].index(to_square)
+    build_direction = NEIGHBOR_SQUARES[to_square].index(square_index(self.build_location))
+    return WORKER_IDS.index(self.worker_id) << 11 | to_square << 6 | move_direction << 3 | build_direction
+
+  @classmethod
+  def unpack(cls, code):
+    '''The inverse of pack'''
+    to_square = code >> 6 & 31
+    # the move direction points from the old square to the new one, so step back along it
+    from_square = NEIGHBOR_SQUARES[to_square][OPPOSITE_DIRECTION[code >> 3 & 7]]
+    build_square = NEIGHBOR_SQUARES[to_square][code & 7]
+    return cls(WORKER_IDS[code >> 11], square_location(from_square), square_location(to_square), square_location(build_square))
+
+  def __repr__(self):
+    return f"TurnDelta({self.worker_id}, {self.from_location}->{self.to_location}, build {self.build_location})"
+
+
+class GameHistory:
+  '''
+    The undo/redo history of one game, as a list of packed TurnDeltas plus a cursor.
+    The game records a delta after every turn (dropping any redo branch); undo/redo revert or reapply one delta.
+    Every snapshot_interval turns a full GameSave is kept too, so seek() can jump to any turn without replaying from the start.
+  '''
+
+  def __init__(self, start_turn=0, snapshot_interval=None):
+    self._deltas = array('H')  # packed TurnDeltas, 2 bytes per turn
+    self._cursor = 0  # number of deltas currently applied, deltas[cursor:] are the redo branch
+    self._start_turn = start_turn  # the game's turn index when recording started
+    self._snapshot_interval = snapshot_interval
+    self._snapshots = {}  # number of applied deltas -> GameSave
+
+  def record(self, game, delta):
+    '''Append the delta of the turn the game just played, discarding the redo branch'''
+    if self._cursor < len(self._deltas):
+      del self._deltas[self._cursor:]
+      self._snapshots = {count: snapshot for count, snapshot in self._snapshots.items() if count <= self._cursor}
+    self._deltas.append(delta.pack())
+    self._cursor += 1
+    if self._snapshot_interval and self._cursor % self._snapshot_interval == 0:
+      self._snapshots[self._cursor] = game.save()
+
+  def can_undo(self):
+    return self._cursor > 0
+
+  def can_redo(self):
+    return self._cursor < len(self._deltas)
+
+  def deltas(self):
+    '''The TurnDeltas of the turns currently applied, oldest first (the redo branch left out)'''
+    return [TurnDelta.unpack(code) for code in self._deltas[:self._cursor]]
+
+  def undo(self, game):
+    '''Revert the last applied turn. Does nothing if there is none.'''
+    if self.can_undo():
+      self._cursor -= 1
+      game.revert_delta(TurnDelta.unpack(self._deltas[self._cursor]))
+
+  def redo(self, game):
+    '''Reapply the last undone turn. Does nothing if there is none.'''
+    if self.can_redo():
+      game.apply_delta(TurnDelta.unpack(self._deltas[self._cursor]))
+      self._cursor += 1
+
+  def seek(self, game, turn_index):
+    '''
+      Bring the game to the state at the start of turn_index, anywhere in the recorded history (redo branch included)
+      Input:
+        turn_index - int, between the start turn and the start turn + number of recorded deltas
+    '''
+    target = turn_index - self._start_turn
+    if not 0 <= target <= len(self._deltas):
+      raise IndexError(f"turn {turn_index} is not in the recorded history")
+    # jump to the closest snapshot at or before the target if that beats walking from the current cursor
+    keyframe = max((count for count in self._snapshots if count <= target), default=None)
+    if keyframe is not None and abs(target - self._cursor) > target - keyframe:
+      game.restore(self._snapshots[keyframe])
+      self._cursor = keyframe
+    while self._cursor > target:
+      self.undo(game)
+    while self._cursor < target:
+      self.redo(game)
+
+  def __len__(self):
+    return len(self._deltas)
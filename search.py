@@ -0,0 +1,251 @@
+'''
+  Alpha-beta search over full turns (move + build), used by MinimaxPlayer.
+  The search runs on immutable Positions (see position.py): every child is a new Position, so the live game is never touched.
+  Leaves are scored with the players' move-score components, from the point of view of the player to move (negamax).
+  Results are cached in a TranspositionTable keyed by the position's canonical hash (see symmetry.py), so mirror images
+  share their entries, and the table survives from one move to the next.
+  A Ponderer fills that table on a background thread while the opponent (a human) thinks.
+'''
+import threading
+import time
+from board import DOME_LEVEL
+from evaluation import DEFAULT_WEIGHTS
+from geometry import square_index
+from position import Position
+from symmetry import CODE_MASK, CODE_TRANSFORMS, INVERSE_TRANSFORMS, canonical, distinct_actions
+from zobrist import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+WIN_SCORE = 100000  # a decided game, minus the ply it got decided at so quicker wins score higher
+DECIDED_SCORE = WIN_SCORE - 1000  # anything beyond this is a win/loss score, stored relative to the node in the table
+
+
+class SearchTimeout(Exception):
+  '''Raised inside the search when the time budget runs out, unwinds back to the iterative deepening loop'''
+  pass
+
+
+class SearchStats:
+  '''What one search did: depth reached, node count, speed and how well the moves were ordered'''
+
+  def __init__(self):
+    self.depth = 0  # deepest fully searched depth, in plies
+    self.nodes = 0
+    self.elapsed = 0.0  # seconds
+    self.score = 0
+    self.cutoffs = 0  # beta cutoffs
+    self.first_move_cutoffs = 0  # beta cutoffs caused by the first move tried, i.e. the move ordering got it right
+    self.tt_probes = 0
+    self.tt_hits = 0
+
+  def _get_nodes_per_sec(self):
+    return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+  nodes_per_sec = property(_get_nodes_per_sec)
+
+  def _get_ordering_quality(self):
+    '''Fraction of cutoffs found on the first move tried, 1.0 is perfect ordering'''
+    return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 1.0
+  ordering_quality = property(_get_ordering_quality)
+
+  def _get_tt_hit_rate(self):
+    return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+  tt_hit_rate = property(_get_tt_hit_rate)
+
+  def __str__(self):
+    return (f"depth {self.depth}, score {self.score}, {self.nodes} nodes in {self.elapsed * 1000:.0f}ms "
+            f"({self.nodes_per_sec:.0f} nodes/sec), first-move cutoffs {self.ordering_quality:.0%}, "
+            f"tt hit rate {self.tt_hit_rate:.0%}")
+
+
+class AlphaBetaSearch:
+  '''
+    Negamax with alpha-beta pruning and iterative deepening under a per-move time budget.
+    Move ordering: the transposition table's move (or the previous iteration's best at the root) first,
+    then moves that climb higher.
+  '''
+
+  def __init__(self, weights=DEFAULT_WEIGHTS, max_depth=8, time_budget_ms=500, check_every=256, transposition_table=None):
+    self._weights = weights
+    self._max_depth = max_depth
+    self._time_budget = time_budget_ms / 1000
+    self._check_every = check_every  # nodes between two clock reads
+    self._table = transposition_table if transposition_table is not None else TranspositionTable()
+    self._stopped = False
+
+  def _get_transposition_table(self):
+    '''The getter method that returns the TranspositionTable, shared by every search this object runs'''
+    return self._table
+  transposition_table = property(_get_transposition_table)
+
+  def _get_time_budget(self):
+    '''The getter method that returns the time budget of one search, in seconds'''
+    return self._time_budget
+  time_budget = property(_get_time_budget)
+
+  def stop(self):
+    '''Make the running search (or the next one, if none is running) return its result so far, from any thread'''
+    self._stopped = True
+
+  def pondering_search(self):
+    '''A search with this one's settings and transposition table but no time limit, for a Ponderer'''
+    return AlphaBetaSearch(self._weights, self._max_depth, float("inf"), self._check_every, self._table)
+
+  def search(self, game, deadline=None):
+    '''
+      Find the best turn for the player to move in game
+      Input:
+        game - Game (only read, to take its Position) or Position
+        deadline - float, the time.perf_counter() to stop at instead of the time budget from now
+      Output:
+        tuple(TurnDelta, SearchStats) - the chosen turn and what the search did to find it
+    '''
+    position = game if isinstance(game, Position) else Position.from_game(game)
+    self._stats = SearchStats()
+    self._deadline = deadline if deadline is not None else time.perf_counter() + self._time_budget
+    self._table.new_search()
+    probes, hits = self._table.probes, self._table.hits
+    start = time.perf_counter()
+
+    root_actions = distinct_actions(position.symmetric_hashes, self._ordered_actions(position))  # one of each mirror image
+    best_action = root_actions[0]
+    try:
+      for depth in range(1, self._max_depth + 1):
+        score, action = self._search_root(position, root_actions, depth)
+        best_action = action
+        self._stats.depth, self._stats.score = depth, score
+        root_actions.remove(action)
+        root_actions.insert(0, action)  # principal variation first in the next iteration
+        if abs(score) >= WIN_SCORE - self._max_depth:  # the game is decided, deeper won't change it
+          break
+    except SearchTimeout:
+      pass  # keep the result of the last fully searched depth
+    self._stats.elapsed = time.perf_counter() - start
+    self._stats.tt_probes, self._stats.tt_hits = self._table.probes - probes, self._table.hits - hits
+    return best_action, self._stats
+
+  def _search_root(self, position, actions, depth):
+    '''Search every root action to depth, return (best score, best action)'''
+    alpha, beta = -WIN_SCORE - 1, WIN_SCORE + 1
+    best_action = actions[0]
+    for action in actions:
+      score = -self._negamax(position.apply(action), depth - 1, -beta, -alpha, 1)
+      if score > alpha:
+        alpha, best_action = score, action
+    key, transform = canonical(position.symmetric_hashes)
+    self._table.store(key, depth, alpha, EXACT, CODE_TRANSFORMS[transform][best_action.pack() & CODE_MASK])
+    return alpha, best_action
+
+  def _negamax(self, position, depth, alpha, beta, ply):
+    '''The value of the position for the player to move'''
+    stats = self._stats
+    stats.nodes += 1
+    if stats.nodes % self._check_every == 0 and (self._stopped or time.perf_counter() > self._deadline):
+      raise SearchTimeout()
+
+    winner = position.winner()
+    if winner is not None:
+      return WIN_SCORE - ply if winner == position.side else -(WIN_SCORE - ply)
+    if depth == 0:
+      return self.evaluate(position)
+
+    key, transform = canonical(position.symmetric_hashes)
+    entry = self._table.probe(key)
+    table_move = None
+    if entry:
+      entry_depth, score, flag, table_move = entry
+      if entry_depth >= depth:
+        score = _score_from_table(score, ply)
+        if flag == EXACT or (flag == LOWER_BOUND and score >= beta) or (flag == UPPER_BOUND and score <= alpha):
+          return score
+      table_move = CODE_TRANSFORMS[INVERSE_TRANSFORMS[transform]][table_move]  # stored in the canonical orientation
+
+    original_alpha = alpha
+    best_score, best_action = -WIN_SCORE - 1, None
+    for index, action in enumerate(self._ordered_actions(position, table_move)):
+      score = -self._negamax(position.apply(action), depth - 1, -beta, -alpha, ply + 1)
+      if score > best_score:
+        best_score, best_action = score, action
+      if score >= beta:
+        stats.cutoffs += 1
+        stats.first_move_cutoffs += index == 0
+        break
+      if score > alpha:
+        alpha = score
+
+    flag = UPPER_BOUND if best_score <= original_alpha else LOWER_BOUND if best_score >= beta else EXACT
+    self._table.store(key, depth, _score_to_table(best_score, ply), flag, CODE_TRANSFORMS[transform][best_action.pack() & CODE_MASK])
+    return best_score
+
+  def evaluate(self, position):
+    '''The weighted move score of the player to move, minus the opponent's'''
+    side = position.side
+    own = sum(weight * component for weight, component in zip(self._weights, position.components(side)))
+    opponent = sum(weight * component for weight, component in zip(self._weights, position.components(1 - side)))
+    return own - opponent
+
+  def _ordered_actions(self, position, first_move=None):
+    '''
+      Every legal turn of the player to move, as TurnDeltas, highest destination first
+      (climbing is what wins, so those moves tend to cause the cutoffs)
+      Input:
+        first_move - int, the code of a turn (TurnDelta.pack without the worker bits, from the transposition table)
+                     to put in front, if it's legal
+    '''
+    heights = position.heights
+    scored_actions = []
+    for action in position.legal_actions():
+      priority = DOME_LEVEL + 1 if first_move is not None and action.pack() & CODE_MASK == first_move \
+        else heights[square_index(action.to_location)]
+      scored_actions.append((priority, action))
+    scored_actions.sort(key=lambda scored_action: -scored_action[0])  # stable, so ties keep the generation order
+    return [action for _, action in scored_actions]
+
+
+class Ponderer:
+  '''
+    Searches a position on a background thread until stopped. Pondering on the opponent's turn leaves the positions
+    after each of its replies in the transposition table shared with the player's own search, which then starts its
+    next turn from them instead of from nothing.
+    Input:
+      search - AlphaBetaSearch, the player's search (its settings and table get used)
+  '''
+
+  def __init__(self, search):
+    self._search = search
+    self._pondering = None  # the AlphaBetaSearch running on the thread
+    self._thread = None
+    self.last_stats = None  # the SearchStats of the latest pondering, once stopped
+
+  def start(self, position):
+    '''Start searching position (the opponent to move) in the background'''
+    self.stop()
+    self._pondering = self._search.pondering_search()
+    self._thread = threading.Thread(target=self._run, args=(self._pondering, position), daemon=True)
+    self._thread.start()
+
+  def _run(self, search, position):
+    self.last_stats = search.search(position)[1]
+
+  def stop(self):
+    '''Stop the search and wait for the thread to finish (a few hundred nodes at most), so the table is free again'''
+    if self._thread is not None:
+      self._pondering.stop()
+      self._thread.join()
+      self._thread = self._pondering = None
+    return self.last_stats
+
+
+def _score_to_table(score, ply):
+  '''Win/loss scores count plies from the root; the table stores them counted from the node, so they stay valid anywhere'''
+  if score > DECIDED_SCORE:
+    return score + ply
+  if score < -DECIDED_SCORE:
+    return score - ply
+  return score
+
+def _score_from_table(score, ply):
+  '''The inverse of _score_to_table'''
+  if score > DECIDED_SCORE:
+    return score - ply
+  if score < -DECIDED_SCORE:
+    return score + ply
+  return score
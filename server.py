@@ -0,0 +1,207 @@
+'''
+  An asyncio server hosting many game sessions at once over a line protocol, on TCP or a Unix socket.
+  Every connection gets its own independent game (not the singleton) with the usual rules, the CLI's undo/redo,
+  and AI turns played in a thread pool so a slow search doesn't hold up the other sessions.
+
+  The server talks in text lines, the same transcript the CLI prints, and ends every reply with a prompt line
+  starting with "> " that says what it waits for:
+    > new             new WHITE BLUE [UNDO_REDO [SCORE]], with the command line's player types and on/off switches
+                      ("human" is the player on this connection), or quit
+    > move COLOR (..) a human's turn: WORKER DIRECTION BUILD_DIRECTION, e.g. "A n s" (plus undo / redo with undo_redo on)
+    > next            undo_redo is on: undo, redo or next, asked before every turn like the CLI does
+  board shows the board again and history lists the turns played so far, at any point of a game and of the last one
+  until the next new. Errors come back as a line starting with "! ", followed by the prompt again.
+
+  python server.py [--host 127.0.0.1] [--port 8765 | --unix PATH] [--threads N]
+  then e.g. `nc 127.0.0.1 8765` or `nc -U PATH`
+'''
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import main
+from game import Game
+from geometry import DIRECTION_INDICES, NEIGHBOR_SQUARES
+from save import GameHistory
+
+PLAYER_TYPES = ["human", "heuristic", "random", "minimax", "mcts", "value"]
+SWITCHES = ["on", "off"]
+
+
+def valid_player_type(spec):
+  '''Whether spec is a player type the server can host, options as on the command line (mcts:200, minimax:d3)'''
+  return main.valid_player_type(spec, PLAYER_TYPES)
+
+def check_turn(game, worker_id, direction, build_direction):
+  '''
+    Check a human's turn against the rules before playing it, with the messages HumanPlayer prints
+    Output:
+      str - what's wrong with it, or None if it's legal
+  '''
+  player = game.get_current_player()
+  if worker_id not in "ABYZ" or len(worker_id) != 1:
+    return "Not a valid worker"
+  if worker_id not in player.worker_ids:
+    return "That is not your worker"
+  worker = player.get_worker(worker_id)
+  if direction not in DIRECTION_INDICES:
+    return "Not a valid direction"
+  if direction not in worker.find_legal_moves("move"):
+    return f"Cannot move {direction}"
+  if build_direction not in DIRECTION_INDICES:
+    return "Not a valid direction"
+  from_square = worker.square
+  to_square = NEIGHBOR_SQUARES[from_square][DIRECTION_INDICES[direction]]
+  build_square = NEIGHBOR_SQUARES[to_square][DIRECTION_INDICES[build_direction]]
+  if build_square < 0 or not game.board.legal_build_mask_after_move(from_square, to_square) >> build_square & 1:
+    return f"Cannot build {build_direction}"
+  return None
+
+
+class Session:
+  '''One connection: a loop of games, each driven by the commands read from the connection'''
+
+  def __init__(self, reader, writer, executor):
+    self._reader = reader
+    self._writer = writer
+    self._executor = executor
+    self._game = None
+    self._history = None  # the GameHistory of the turns played, kept for the history command even with undo_redo off
+    self._undo_redo = False
+    self._human_colors = set()
+    self._lines = []  # transcript lines waiting to be sent, the game's output goes here too (from the AI threads as well)
+
+  def _send(self, *lines):
+    self._lines.extend(lines)
+
+  async def _flush(self, prompt):
+    self._lines.append("> " + prompt)
+    self._writer.write(("\n".join(self._lines) + "\n").encode())
+    self._lines.clear()  # in place, the game's output holds on to this list
+    await self._writer.drain()
+
+  async def run(self):
+    '''Serve the connection until it closes or says quit'''
+    self._send("Santorini server. Start a game with: new WHITE BLUE [UNDO_REDO [SCORE]]")
+    prompt = "new"
+    try:
+      while True:
+        await self._flush(prompt)
+        line = await self._reader.readline()
+        if not line:
+          break
+        words = line.decode(errors="replace").split()
+        if words == ["quit"]:
+          break
+        prompt = await self._handle(prompt, words)
+    except ConnectionError:
+      pass
+    finally:
+      if self._game is not None:
+        self._game.close()
+      self._writer.close()
+
+  async def _handle(self, prompt, words):
+    '''Act on one command line in the state the prompt describes, return the next prompt'''
+    command = words[0] if words else ""
+    if command == "new":
+      return await self._new_game(words[1:])
+    if self._game is None:
+      self._send("! start a game first: new WHITE BLUE [UNDO_REDO [SCORE]]")
+      return "new"
+    if command == "board":  # read-only, so the last game can still be looked at once it's over
+      self._send(str(self._game))
+      return prompt
+    if command == "history":
+      self._send(*(f"{turn_index + 1}. {self._game.players[turn_index % 2]} {delta}"
+                   for turn_index, delta in enumerate(self._history.deltas())))
+      return prompt
+    if prompt == "new":
+      self._send("! the game is over, start a new one: new WHITE BLUE [UNDO_REDO [SCORE]]")
+      return "new"
+    if command in ("undo", "redo") and self._undo_redo:
+      (self._history.undo if command == "undo" else self._history.redo)(self._game)
+      return await self._advance()
+    if prompt == "next" and command == "next":
+      return await self._advance(confirmed=True)
+    if prompt.startswith("move") and len(words) == 3:
+      error = check_turn(self._game, *words)
+      if error:
+        self._send("! " + error)
+        return prompt
+      self._game.get_current_player().queue_decision(*words)
+      return "new" if await self._step() else await self._advance()
+    self._send("! expected " + ("undo, redo or next" if prompt == "next" else "WORKER DIRECTION BUILD_DIRECTION"))
+    return prompt
+
+  async def _new_game(self, arguments):
+    if not 2 <= len(arguments) <= 4 or not all(valid_player_type(spec) for spec in arguments[:2]) \
+        or not all(switch in SWITCHES for switch in arguments[2:]):
+      self._send(f"! usage: new WHITE BLUE [UNDO_REDO [SCORE]], players one of {PLAYER_TYPES}, switches on/off")
+      return "new"
+    white, blue = ("remote" if spec == "human" else spec for spec in arguments[:2])
+    undo_redo, enable_score = (arguments[2:] + ["off", "off"])[:2]
+    if self._game is not None:  # a game given up for this one
+      self._game.close()
+    self._game = Game(white, blue, enable_score == "on", verbose=True, shared=False)
+    self._game.attach_output(self._lines.append)
+    self._human_colors = {color for color, spec in zip(("white", "blue"), arguments[:2]) if spec == "human"}
+    self._history = GameHistory()
+    self._undo_redo = undo_redo == "on"
+    self._game.attach_history(self._history)
+    return await self._advance()
+
+  async def _advance(self, confirmed=False):
+    '''
+      Play the game on from the start of a turn (showing the board first, unless the turn was already confirmed
+      with next) until it needs the connection again
+      Output:
+        str - the next prompt: next, a human's move, or new once the game is over
+    '''
+    while True:
+      if not confirmed:
+        self._send(str(self._game))
+        if self._undo_redo:
+          return "next"
+      confirmed = False
+      player = self._game.get_current_player()
+      if str(player) in self._human_colors and not self._game.get_winner():
+        return f"move {player} ({''.join(player.worker_ids)})"
+      if await self._step():
+        return "new"
+
+  async def _step(self):
+    '''Run one step of the game off the event loop, announce the winner if there is one and return it'''
+    loop = asyncio.get_running_loop()
+    winner = await loop.run_in_executor(self._executor, self._game.run_one_step)
+    if winner:  # the game stays for board and history until the next new
+      self._send(f"{winner} has won")
+    return winner
+
+
+async def serve(host="127.0.0.1", port=8765, unix_path=None, threads=None):
+  '''Run the server until cancelled'''
+  executor = ThreadPoolExecutor(max_workers=threads)  # AI turns; searches hold the GIL, but the loop keeps getting its slices
+
+  async def handle_connection(reader, writer):
+    await Session(reader, writer, executor).run()
+
+  if unix_path:
+    server = await asyncio.start_unix_server(handle_connection, path=unix_path)
+  else:
+    server = await asyncio.start_server(handle_connection, host, port)
+  async with server:
+    print(f"serving on {unix_path or f'{host}:{port}'}")
+    await server.serve_forever()
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Host many Santorini sessions over a line protocol.")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8765)
+  parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+  parser.add_argument("--threads", type=int, default=None, help="thread pool size for AI turns")
+  options = parser.parse_args()
+  try:
+    asyncio.run(serve(options.host, options.port, options.unix, options.threads))
+  except KeyboardInterrupt:
+    pass
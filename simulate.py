@@ -0,0 +1,145 @@
+'''
+  Headless batch self-play. Plays many AI vs AI games with no I/O, spread over a process pool.
+  Each game is seeded from "seed-game index", so a run is reproducible no matter how many
+  workers there are or how the pool schedules the chunks.
+'''
+import os
+import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from evaluation import DEFAULT_WEIGHTS, parse_weights
+from game import Game
+from record import GameRecordWriter
+
+AI_PLAYER_TYPES = ["heuristic", "random", "minimax", "mcts", "value"]  # the player types that can play without a human at the keyboard
+
+
+def play_headless_game(p1_type, p2_type, recorder=None):
+  '''
+    Play one full game without printing anything
+    Input:
+      p1_type, p2_type - str, the player types of white and blue
+      recorder - GameRecordWriter, to append the game's record to (optional)
+    Output:
+      tuple(str, int) - the winner's color and the number of turns the game took
+  '''
+  game = Game(p1_type, p2_type, False, verbose=False, shared=False)  # an independent game, not the singleton
+  if recorder:
+    recorder.start_game(p1_type, p2_type)
+    game.attach_recorder(recorder)
+  winner = game.play_to_end()
+  if recorder:
+    recorder.finish(game.turn_index, str(winner))
+  return str(winner), game.turn_index
+
+def _play_chunk(task):
+  '''
+    Worker-process entry point: play a chunk of seeded games, return a list of (winner color, num turns).
+    With a record path, the chunk's games go into their own part file, which the parent stitches together.
+  '''
+  p1_type, p2_type, game_indices, seed, record_path = task
+  recorder = GameRecordWriter(_part_path(record_path, game_indices)) if record_path else None
+  results = []
+  for game_index in game_indices:
+    random.seed(f"{seed}-{game_index}")
+    results.append(play_headless_game(p1_type, p2_type, recorder))
+  if recorder:
+    recorder.close()
+  return results
+
+def _part_path(record_path, game_indices):
+  return f"{record_path}.part{game_indices.start}"
+
+def _merge_parts(record_path, tasks):
+  '''Concatenate the chunks' part files, in game order, into record_path (record streams concatenate as-is)'''
+  with open(record_path, "wb") as output:
+    for task in tasks:
+      part_path = _part_path(record_path, task[2])
+      with open(part_path, "rb") as part:
+        shutil.copyfileobj(part, output)
+      os.remove(part_path)
+
+def simulate(p1_type, p2_type, num_games, workers=None, seed=0, chunk_size=None, record_path=None):
+  '''
+    Play num_games headless games between p1_type (white) and p2_type (blue)
+    Input:
+      p1_type, p2_type - str, AI player types (see AI_PLAYER_TYPES)
+      num_games - int, number of games to play
+      workers - int, size of the process pool (defaults to the cpu count). 1 plays in-process.
+      seed - int, base seed; game i is seeded with "seed-i"
+      chunk_size - int, games per task (defaults to spreading the games ~4 tasks per worker)
+      record_path - str, archive every game into this record file (see record.py), in game order
+    Output:
+      dict - aggregate win rates, game lengths and throughput
+  '''
+  if p1_type.partition(":")[0] not in AI_PLAYER_TYPES or p2_type.partition(":")[0] not in AI_PLAYER_TYPES:
+    raise ValueError(f"headless games need AI players, got {p1_type} vs {p2_type}")
+  workers = workers or os.cpu_count() or 1
+  chunk_size = chunk_size or max(1, -(-num_games // (workers * 4)))
+  tasks = [(p1_type, p2_type, range(first, min(first + chunk_size, num_games)), seed, record_path)
+           for first in range(0, num_games, chunk_size)]
+
+  start = time.perf_counter()
+  if workers == 1:
+    chunk_results = [_play_chunk(task) for task in tasks]
+  else:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+      chunk_results = list(executor.map(_play_chunk, tasks))
+  if record_path:
+    _merge_parts(record_path, tasks)
+  elapsed = time.perf_counter() - start
+
+  results = [result for chunk in chunk_results for result in chunk]
+  return summarize(p1_type, p2_type, results, elapsed, workers)
+
+def simulate_batched(p1_type, p2_type, num_games, seed=0):
+  '''
+    Like simulate, but steps all the games at once in the vectorized NumPy engine (batch.py), in this process.
+    Only the heuristic and random policies exist there, the heuristic one with its weights if given (heuristic:4,2,0.5).
+  '''
+  from batch import BatchGame, POLICIES  # lazy: NumPy is only needed for this mode
+  policies, weights = [], []
+  for spec in (p1_type, p2_type):
+    policy, _, option = spec.partition(":")
+    policy_weights = parse_weights(option) if option else DEFAULT_WEIGHTS
+    if policy not in POLICIES or (option and policy != "heuristic") or policy_weights is None:
+      raise ValueError(f"the batched engine only plays {POLICIES} (heuristic with weights too), got {p1_type} vs {p2_type}")
+    policies.append(policy)
+    weights.append(policy_weights)
+  start = time.perf_counter()
+  winners, lengths = BatchGame(num_games, seed).play(tuple(policies), weights=tuple(weights))
+  elapsed = time.perf_counter() - start
+  results = [("white" if winner == 0 else "blue", int(length)) for winner, length in zip(winners, lengths)]
+  return summarize(p1_type, p2_type, results, elapsed, 1)
+
+def summarize(p1_type, p2_type, results, elapsed, workers):
+  '''Aggregate a list of (winner color, num turns) into the report returned by simulate'''
+  num_games = len(results)
+  white_wins = sum(1 for winner, _ in results if winner == "white")
+  lengths = sorted(num_turns for _, num_turns in results)
+  return {
+    "white": p1_type,
+    "blue": p2_type,
+    "games": num_games,
+    "workers": workers,
+    "white_wins": white_wins,
+    "blue_wins": num_games - white_wins,
+    "white_win_rate": white_wins / num_games if num_games else 0.0,
+    "blue_win_rate": (num_games - white_wins) / num_games if num_games else 0.0,
+    "mean_length": sum(lengths) / num_games if num_games else 0.0,
+    "min_length": lengths[0] if lengths else 0,
+    "max_length": lengths[-1] if lengths else 0,
+    "median_length": lengths[num_games // 2] if lengths else 0,
+    "elapsed_sec": elapsed,
+    "games_per_sec": num_games / elapsed if elapsed > 0 else float("inf"),
+  }
+
+def format_report(report):
+  '''The human-readable summary printed by `main.py simulate`'''
+  return (f"{report['games']} games, {report['white']} (white) vs {report['blue']} (blue), {report['workers']} worker(s)\n"
+          f"white wins: {report['white_wins']} ({report['white_win_rate']:.1%}), "
+          f"blue wins: {report['blue_wins']} ({report['blue_win_rate']:.1%})\n"
+          f"game length (turns): mean {report['mean_length']:.1f}, median {report['median_length']}, "
+          f"min {report['min_length']}, max {report['max_length']}\n"
+          f"{report['elapsed_sec']:.2f}s, {report['games_per_sec']:.1f} games/sec")
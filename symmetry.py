@@ -0,0 +1,139 @@
+'''
+  The 8 symmetries of the 5x5 board (its rotations and reflections) and the canonical keys built on them.
+  A position and its mirror images play the same game, and so do two positions that only swap the labels of a side's
+  two workers. The canonical key of a position is the smallest of the label-free Zobrist hashes of its 8 images, so
+  every cache (transposition table, opening book, endgame table) stores the whole family once. Turns get stored in
+  the canonical orientation as 11-bit codes (TurnDelta.pack without the worker bits: the move's origin square names
+  the worker) and map back to the actual board through the inverse transform.
+'''
+from geometry import BOARD_SIZE, NUM_SQUARES, DIRECTION_DELTAS, DIRECTIONS, SQUARE_LOCATIONS, NEIGHBOR_SQUARES, OPPOSITE_DIRECTION
+from save import TurnDelta
+from zobrist import HEIGHT_KEYS, SIDE_KEY, SIDE_WORKER_KEYS
+
+_LAST = BOARD_SIZE - 1
+# the (row, col) -> (row, col) map of each transform: identity, the 3 rotations, then the 4 reflections
+_LOCATION_MAPS = (lambda row, col: (row, col),
+                  lambda row, col: (col, _LAST - row),
+                  lambda row, col: (_LAST - row, _LAST - col),
+                  lambda row, col: (_LAST - col, row),
+                  lambda row, col: (_LAST - row, col),
+                  lambda row, col: (row, _LAST - col),
+                  lambda row, col: (col, row),
+                  lambda row, col: (_LAST - col, _LAST - row))
+IDENTITY = 0
+NUM_TRANSFORMS = len(_LOCATION_MAPS)
+
+# TRANSFORMS[t][square]: where transform t takes square
+TRANSFORMS = tuple(tuple(row * BOARD_SIZE + col for row, col in (location_map(*location) for location in SQUARE_LOCATIONS))
+                   for location_map in _LOCATION_MAPS)
+INVERSE_TRANSFORMS = tuple(next(u for u in range(NUM_TRANSFORMS) if all(TRANSFORMS[u][TRANSFORMS[t][square]] == square
+                                                                        for square in range(NUM_SQUARES)))
+                           for t in range(NUM_TRANSFORMS))
+
+def _map_direction(location_map, delta):
+  center = BOARD_SIZE // 2
+  row, col = location_map(center + delta[0], center + delta[1])
+  return DIRECTIONS.index(next(direction for direction, image in DIRECTION_DELTAS.items()
+                               if image == (row - center, col - center)))
+
+# DIRECTION_TRANSFORMS[t][direction index]: the direction a move along it points to once transformed
+DIRECTION_TRANSFORMS = tuple(tuple(_map_direction(location_map, delta) for delta in DIRECTION_DELTAS.values())
+                             for location_map in _LOCATION_MAPS)
+
+# the label-free Zobrist keys of a square's content in each of the 8 images, for hashing all 8 at once:
+# SYMMETRIC_HEIGHT_KEYS[square][level][t] and SYMMETRIC_WORKER_KEYS[side][square][t]
+SYMMETRIC_HEIGHT_KEYS = tuple(tuple(tuple(HEIGHT_KEYS[TRANSFORMS[t][square]][level] for t in range(NUM_TRANSFORMS))
+                                    for level in range(len(HEIGHT_KEYS[square])))
+                              for square in range(NUM_SQUARES))
+SYMMETRIC_WORKER_KEYS = tuple(tuple(tuple(SIDE_WORKER_KEYS[side][TRANSFORMS[t][square]] for t in range(NUM_TRANSFORMS))
+                                    for square in range(NUM_SQUARES))
+                              for side in range(2))
+# the same, combined into what one turn changes: SYMMETRIC_MOVE_KEYS[side][from square][to square] for a worker's
+# move, SYMMETRIC_BUILD_KEYS[square][level] for building up to level, the side to move flipping included
+SYMMETRIC_MOVE_KEYS = tuple(tuple(tuple(tuple(left ^ entered for left, entered in zip(worker_keys[from_square], worker_keys[to_square]))
+                                        for to_square in range(NUM_SQUARES))
+                                  for from_square in range(NUM_SQUARES))
+                            for worker_keys in SYMMETRIC_WORKER_KEYS)
+SYMMETRIC_BUILD_KEYS = tuple(tuple(() if level == 0 else tuple(below ^ built ^ SIDE_KEY for below, built in zip(height_keys[level - 1], height_keys[level]))
+                                   for level in range(len(height_keys)))
+                             for height_keys in SYMMETRIC_HEIGHT_KEYS)
+
+CODE_BITS = 11  # to square (5 bits) | move direction (3 bits) | build direction (3 bits)
+CODE_MASK = (1 << CODE_BITS) - 1
+
+def _transform_code(t, code):
+  to_square, move_direction, build_direction = code >> 6, code >> 3 & 7, code & 7
+  if to_square >= NUM_SQUARES:
+    return 0  # not a turn
+  return TRANSFORMS[t][to_square] << 6 | DIRECTION_TRANSFORMS[t][move_direction] << 3 | DIRECTION_TRANSFORMS[t][build_direction]
+
+# CODE_TRANSFORMS[t][code]: the 11-bit code of a turn once transformed by t
+CODE_TRANSFORMS = tuple(tuple(_transform_code(t, code) for code in range(1 << CODE_BITS)) for t in range(NUM_TRANSFORMS))
+
+
+def symmetric_hashes(heights, squares, turn_index):
+  '''
+    The label-free Zobrist hashes of the 8 images of a position, from scratch (Position keeps them up to date incrementally)
+    Input:
+      heights - the 25 square heights
+      squares - the squares of workers A, B, Y, Z, in that order
+      turn_index - int, the number of turns played (its parity is the side to move)
+    Output:
+      tuple(int) - the hash of the image under each transform
+  '''
+  keys = [SIDE_KEY if turn_index % 2 else 0] * NUM_TRANSFORMS
+  for square, level in enumerate(heights):
+    if level:
+      keys = [key ^ image for key, image in zip(keys, SYMMETRIC_HEIGHT_KEYS[square][level])]
+  for worker_index, square in enumerate(squares):
+    keys = [key ^ image for key, image in zip(keys, SYMMETRIC_WORKER_KEYS[worker_index // 2][square])]
+  return tuple(keys)
+
+def canonical(keys):
+  '''The canonical key among a position's symmetric hashes and the transform that takes the position there'''
+  key = min(keys)
+  return key, keys.index(key)
+
+def stabilizer(keys):
+  '''The transforms other than the identity that leave the position as it is (up to worker labels)'''
+  return [t for t in range(1, NUM_TRANSFORMS) if keys[t] == keys[IDENTITY]]
+
+def transform_direction(direction, t):
+  '''Where transform t takes one of Worker.WORKER_MOVES' directions, e.g. "ne" -> "se" for a quarter turn'''
+  return DIRECTIONS[DIRECTION_TRANSFORMS[t][DIRECTIONS.index(direction)]]
+
+def canonical_code(action, t):
+  '''The code of a TurnDelta in the orientation transform t leads to'''
+  return CODE_TRANSFORMS[t][action.pack() & CODE_MASK]
+
+def action_from_code(code, t, squares):
+  '''
+    The TurnDelta a canonical code stands for on the actual board: the inverse of canonical_code
+    Input:
+      t - int, the transform that took the actual position to the canonical one
+      squares - the actual squares of workers A, B, Y, Z, which name the moving worker
+    Output:
+      TurnDelta, or None if no worker stands where the turn starts, or it builds off the board (a hash collision)
+  '''
+  code = CODE_TRANSFORMS[INVERSE_TRANSFORMS[t]][code & CODE_MASK]
+  from_square = NEIGHBOR_SQUARES[code >> 6][OPPOSITE_DIRECTION[code >> 3 & 7]]
+  if from_square not in squares or NEIGHBOR_SQUARES[code >> 6][code & 7] < 0:
+    return None
+  return TurnDelta.unpack(squares.index(from_square) << CODE_BITS | code)
+
+def distinct_actions(keys, actions):
+  '''
+    The actions with the mirror images of earlier ones left out, for a position whose stabilizer isn't trivial
+    (the starting position, for one): those lead to the same position up to symmetry, so searching one is enough
+  '''
+  transforms = stabilizer(keys)
+  if not transforms:
+    return actions
+  seen, distinct = set(), []
+  for action in actions:
+    code = action.pack() & CODE_MASK
+    if code not in seen:
+      distinct.append(action)
+      seen.update(CODE_TRANSFORMS[t][code] for t in transforms)
+      seen.add(code)
+  return distinct
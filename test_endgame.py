@@ -0,0 +1,147 @@
+'''
+  The endgame solver's proofs against an exhaustive negamax to the same depth, its node, time and memory limits,
+  and the table its results get saved into.
+
+  python -m unittest test_endgame
+'''
+import os
+import random
+import tempfile
+import time
+import unittest
+from endgame import CHECK_EVERY, WIN, LOSS, UNKNOWN, NO_ACTION, EndgameSolver, EndgameTable
+from game import Game
+from position import Position
+
+DEPTH = 3
+
+
+def _negamax(position, depth):
+  '''WIN, LOSS or UNKNOWN for the side to move within depth plies, by looking at every turn'''
+  winner = position.winner()
+  if winner is not None:
+    return WIN if winner == position.side else LOSS
+  if depth == 0:
+    return UNKNOWN
+  results = [_negamax(position.apply(action), depth - 1) for action in position.legal_actions()]
+  if LOSS in results:
+    return WIN
+  return LOSS if all(result == WIN for result in results) else UNKNOWN
+
+def _cramped_positions(count, seed=0):
+  '''Random undecided positions with many domes, so few enough turns that an exhaustive search stays cheap'''
+  rng = random.Random(seed)
+  positions = []
+  while len(positions) < count:
+    heights = [rng.choice((0, 1, 2, 2, 3, 3, 4, 4, 4)) for _ in range(25)]
+    free = [square for square in range(25) if heights[square] < 3]
+    if len(free) < 4:
+      continue
+    position = Position(heights, rng.sample(free, 4), rng.randrange(2))
+    if position.winner() is None and len(position.legal_actions()) <= 24:
+      positions.append(position)
+  return positions
+
+def _game_endgame():
+  '''An endgame position of a seeded heuristic game, with too many turns to solve deeply'''
+  random.seed(1)
+  game = Game("heuristic", "heuristic", False, verbose=False, shared=False)
+  while True:
+    game.run_one_step()
+    position = Position.from_game(game)
+    if position.is_endgame() and position.winner() is None and len(position.legal_actions()) > 40:
+      return position
+
+
+class SolverProofTest(unittest.TestCase):
+
+  def _check_proof(self, position, result, plies, action):
+    '''A WIN or LOSS in plies must be one by exhaustive search too, and the turn given must keep it'''
+    self.assertLessEqual(plies, DEPTH)
+    self.assertEqual(_negamax(position, plies), result)
+    if result == WIN:
+      self.assertEqual(_negamax(position.apply(action), plies - 1), LOSS)
+
+  def test_results_match_exhaustive_search(self):
+    results = set()
+    for position in _cramped_positions(120):
+      result, plies, action = EndgameSolver(max_depth=DEPTH, max_nodes=10 ** 6).solve(position)
+      self.assertEqual(result, _negamax(position, DEPTH))
+      if result != UNKNOWN:
+        self._check_proof(position, result, plies, action)
+      results.add(result)
+    self.assertEqual(results, {WIN, LOSS, UNKNOWN})
+
+  def test_reused_solver_stays_sound(self):
+    solver = EndgameSolver(max_depth=DEPTH, max_nodes=10 ** 6)  # its caches carry over from one solve to the next
+    for position in _cramped_positions(60, seed=1):
+      result, plies, action = solver.solve(position)
+      if result != UNKNOWN:
+        self.assertEqual(_negamax(position, plies), result)
+
+
+class SolverLimitTest(unittest.TestCase):
+
+  def setUp(self):
+    self.position = _game_endgame()
+
+  def test_max_nodes(self):
+    solver = EndgameSolver(max_depth=9, max_nodes=50)
+    self.assertEqual(solver.solve(self.position), (UNKNOWN, 0, None))
+    self.assertLessEqual(solver._nodes, 51)  # the node over the budget is where it stops
+
+  def test_passed_deadline(self):
+    solver = EndgameSolver(max_depth=9, max_nodes=10 ** 9)
+    self.assertEqual(solver.solve(self.position, time.perf_counter()), (UNKNOWN, 0, None))
+    self.assertEqual(solver._nodes, CHECK_EVERY)  # gives up at the first clock read
+
+  def test_deadline(self):
+    solver = EndgameSolver(max_depth=9, max_nodes=10 ** 9)
+    start = time.perf_counter()
+    solver.solve(self.position, start + 0.05)
+    self.assertLess(time.perf_counter() - start, 0.5)
+
+  def test_cache_size(self):
+    cache_size, max_nodes = 100, 300
+    solver = EndgameSolver(max_depth=DEPTH, max_nodes=max_nodes, cache_size=cache_size)
+    sizes = []
+    for position in _cramped_positions(60, seed=2) + [self.position]:
+      solver.solve(position)
+      sizes.append(len(solver._proven) + len(solver._unproven))
+      self.assertLessEqual(sizes[-1], cache_size + max_nodes)
+    self.assertTrue(any(later < earlier for earlier, later in zip(sizes, sizes[1:])))  # it did start over
+
+
+class EndgameTableTest(unittest.TestCase):
+
+  def test_saved_results_read_back(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    path = os.path.join(directory.name, "endgame_table.bin")
+    table = EndgameTable(path)
+    solver = EndgameSolver(table, max_depth=DEPTH)
+    proofs = {}
+    for position in _cramped_positions(40, seed=3):
+      result = solver.solve(position)
+      solver.flush()
+      if result[0] != UNKNOWN:
+        proofs[position] = result
+    table.save(path, DEPTH)
+    table.close()
+
+    table = EndgameTable(path)
+    self.addCleanup(table.close)
+    self.assertEqual(table.depth, DEPTH)
+    for position, (result, plies, action) in proofs.items():
+      entry = table.get(position.canonical_hash)
+      if entry is None:  # a climb onto level 3 isn't stored, finding it again is cheaper
+        self.assertEqual((result, plies), (WIN, 1))
+        continue
+      self.assertEqual(entry[:2], (result, plies))
+      self.assertEqual(position.action_from_canonical(entry[2]).pack() if entry[2] != NO_ACTION else None,
+                       action.pack() if action is not None else None)
+    self.assertFalse(table._new)  # everything came from the file
+
+
+if __name__ == '__main__':
+  unittest.main()
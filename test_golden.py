@@ -0,0 +1,63 @@
+'''
+  Seeded CLI games replayed against golden transcripts recorded with the original implementation, so the speedups
+  (bitboards, the O(1) any-move check, deltas for undo/redo...) can be shown to leave play unchanged turn for turn.
+  Each case runs `python main.py P1 P2 UNDO_REDO SCORE` with the global random seed set and scripted input.
+
+  python -m unittest test_golden
+  python test_golden.py regenerate   # rewrite the transcripts from the current code, after an intended change of play
+'''
+import os
+import random
+import subprocess
+import sys
+import unittest
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIRECTORY = os.path.join(DIRECTORY, "golden")
+RUNNER = "import random, runpy, sys; random.seed(int(sys.argv[1])); sys.argv = ['main.py'] + sys.argv[2:]; " \
+         "runpy.run_path('main.py', run_name='__main__')"
+
+
+def _undo_redo_script(seed):
+  '''A random mix of next/undo/redo commands, enough to finish a game'''
+  rng = random.Random(seed)
+  return [rng.choice(["next", "next", "next", "undo", "redo", "undo"]) for _ in range(400)]
+
+# name -> (seed, main.py arguments, the lines typed in); every case ends with "no" to "Play again?"
+CASES = {}
+for seed in (1, 2, 3):
+  CASES[f"heuristic-heuristic-{seed}"] = (seed, ["heuristic", "heuristic", "off", "on"], [])
+  CASES[f"heuristic-random-undo-{seed}"] = (seed, ["heuristic", "random", "on", "on"], _undo_redo_script(seed))
+for seed in (1, 2):
+  CASES[f"random-heuristic-next-{seed}"] = (seed, ["random", "heuristic", "on", "off"], ["next"] * 200)
+  CASES[f"random-random-{seed}"] = (seed, ["random", "random", "off", "off"], [])
+
+
+def run_case(name):
+  '''The transcript (stdout) of one case'''
+  seed, args, lines = CASES[name]
+  completed = subprocess.run([sys.executable, "-c", RUNNER, str(seed)] + args, cwd=DIRECTORY, capture_output=True,
+                             text=True, input="\n".join(lines + ["no"]) + "\n", timeout=60)
+  return completed.stdout
+
+def _golden_path(name):
+  return os.path.join(GOLDEN_DIRECTORY, name + ".txt")
+
+
+class GoldenTranscriptTest(unittest.TestCase):
+
+  def test_transcripts(self):
+    for name in CASES:
+      with self.subTest(name):
+        with open(_golden_path(name)) as file:
+          self.assertEqual(run_case(name), file.read())
+
+
+if __name__ == '__main__':
+  if sys.argv[1:] == ["regenerate"]:
+    os.makedirs(GOLDEN_DIRECTORY, exist_ok=True)
+    for name in CASES:
+      with open(_golden_path(name), "w") as file:
+        file.write(run_case(name))
+  else:
+    unittest.main()
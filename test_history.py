@@ -0,0 +1,104 @@
+'''
+  Undo/redo and seeking through a GameHistory of packed TurnDeltas, against the states of a fresh seeded replay.
+
+  python -m unittest test_history
+'''
+import contextlib
+import io
+import random
+import unittest
+from unittest import mock
+from game import Game
+from main import GameCLI, SaveDecorator
+from save import GameHistory
+
+SEEDS = (1, 2, 3, 4)
+
+
+def _state(game):
+  '''Everything a turn can change: the heights, the workers, the turn index and the incremental hash'''
+  heights, worker_locations, turn_index = game.save().get_overall_game_state()
+  return bytes(heights), dict(worker_locations), turn_index, game.zobrist_hash
+
+def _replay_states(seed, p1_type, p2_type):
+  '''The state at the start of every turn of a seeded game, played without any history attached'''
+  random.seed(seed)
+  game = Game(p1_type, p2_type, False, verbose=False, shared=False)
+  states = [_state(game)]
+  while not game.run_one_step():
+    states.append(_state(game))
+  return states
+
+def _recorded_game(seed, p1_type, p2_type, snapshot_interval):
+  '''The same seeded game played to the end with a GameHistory recording it'''
+  random.seed(seed)
+  game = Game(p1_type, p2_type, False, verbose=False, shared=False)
+  history = GameHistory(snapshot_interval=snapshot_interval)
+  game.attach_history(history)
+  while not game.run_one_step():
+    pass
+  return game, history
+
+
+class GameHistoryTest(unittest.TestCase):
+
+  def _check(self, p1_type, p2_type, snapshot_interval):
+    for seed in SEEDS:
+      expected = _replay_states(seed, p1_type, p2_type)
+      game, history = _recorded_game(seed, p1_type, p2_type, snapshot_interval)
+      self.assertEqual(len(history), len(expected) - 1)
+      self.assertEqual(_state(game), expected[-1])
+
+      for turn_index in range(len(expected) - 2, -1, -1):  # undo back to the start
+        history.undo(game)
+        self.assertEqual(_state(game), expected[turn_index])
+      self.assertFalse(history.can_undo())
+      for turn_index in range(1, len(expected)):  # and redo to the end
+        history.redo(game)
+        self.assertEqual(_state(game), expected[turn_index])
+      self.assertFalse(history.can_redo())
+
+      rng = random.Random(seed)
+      for _ in range(30):
+        turn_index = rng.randrange(len(expected))
+        history.seek(game, turn_index)
+        self.assertEqual(_state(game), expected[turn_index])
+        self.assertEqual(len(history.deltas()), turn_index)  # the redo branch isn't part of the turns played
+        if turn_index:  # the cursor lands on the turn too
+          history.undo(game)
+          self.assertEqual(_state(game), expected[turn_index - 1])
+          history.redo(game)
+          self.assertEqual(_state(game), expected[turn_index])
+
+  def test_heuristic_games(self):
+    self._check("heuristic", "heuristic", None)
+
+  def test_random_games_with_snapshots(self):
+    self._check("random", "heuristic", 4)
+
+  def test_new_turn_drops_the_redo_branch(self):
+    game, history = _recorded_game(SEEDS[0], "heuristic", "random", 4)
+    num_turns = len(history)
+    history.seek(game, num_turns // 2)
+    game.run_one_step()
+    self.assertEqual(len(history), num_turns // 2 + 1)
+    self.assertFalse(history.can_redo())
+    with self.assertRaises(IndexError):
+      history.seek(game, num_turns // 2 + 2)
+
+
+class SaveDecoratorTest(unittest.TestCase):
+
+  def test_undo_redo_commands(self):
+    expected = _replay_states(SEEDS[0], "heuristic", "random")
+    commands = ["next"] * 10 + ["undo"] * 7 + ["redo"] * 3 + ["undo", "redo", "redo"]
+    random.seed(SEEDS[0])
+    cli = SaveDecorator(GameCLI("heuristic", "random", False))
+    with mock.patch("builtins.input", side_effect=commands), contextlib.redirect_stdout(io.StringIO()):
+      with self.assertRaises(StopIteration):  # out of commands
+        cli.run()
+    self.assertEqual(_state(cli._cli._game), expected[7])  # 10 turns played, 7 undone, 4 redone and 1 undone again
+
+
+if __name__ == '__main__':
+  unittest.main()
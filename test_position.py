@@ -0,0 +1,76 @@
+'''
+  Position, the bare board AlphaBetaSearch, the endgame solver and the opening book play on, against the live Game:
+  the same legal turns, the same winner and the same hashes, turn after turn of seeded games.
+
+  python -m unittest test_position
+'''
+import random
+import unittest
+from game import Game
+from geometry import DIRECTION_DELTAS, square_location
+from position import Position
+from save import TurnDelta, WORKER_IDS
+from zobrist import compute_hash
+
+SEEDS = (1, 2, 3, 4, 5)
+
+
+class _DeltaLog:
+  '''Stands in for a GameRecordWriter, keeps the TurnDelta of every turn played'''
+
+  def __init__(self):
+    self.deltas = []
+
+  def record(self, turn_index, delta):
+    self.deltas.append(delta)
+
+
+def _game_turns(game):
+  '''Every legal turn of the side to move, found by moving and building with the live game's Workers'''
+  legal_moves = game.get_current_player().check_game_ongoing()
+  if isinstance(legal_moves, str):
+    return set()
+  turns = set()
+  for worker_id, direction in legal_moves:
+    copy = game.copy()
+    worker = copy.get_current_player().get_worker(worker_id)
+    from_location = worker.location
+    worker.move(direction)
+    for build_direction in worker.find_legal_moves("build"):
+      build_location = tuple(coordinate + delta for coordinate, delta in zip(worker.location, DIRECTION_DELTAS[build_direction]))
+      turns.add(TurnDelta(worker_id, from_location, worker.location, build_location).pack())
+  return turns
+
+
+class PositionTest(unittest.TestCase):
+
+  def _check(self, p1_type, p2_type):
+    for seed in SEEDS:
+      random.seed(seed)
+      game = Game(p1_type, p2_type, False, verbose=False, shared=False)
+      log = _DeltaLog()
+      game.attach_recorder(log)
+      position = Position.from_game(game)
+      while True:
+        worker_locations = {worker_id: square_location(square) for worker_id, square in zip(WORKER_IDS, position.squares)}
+        self.assertEqual(position.zobrist_hash, game.zobrist_hash)
+        self.assertEqual(position.zobrist_hash, compute_hash(position.heights, worker_locations, position.turn_index))
+        self.assertEqual({action.pack() for action in position.legal_actions()}, _game_turns(game))
+        winner = game.get_winner()
+        self.assertEqual(position.winner(), game.players.index(winner) if winner else None)
+        if game.run_one_step():
+          break
+        next_position = position.apply(log.deltas[-1])  # the turn the game just played, applied to the Position
+        self.assertEqual(next_position, Position.from_game(game))
+        self.assertEqual(next_position.symmetric_hashes, Position.from_game(game).symmetric_hashes)
+        position = next_position
+
+  def test_heuristic_games(self):
+    self._check("heuristic", "heuristic")
+
+  def test_random_games(self):
+    self._check("random", "random")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,95 @@
+'''
+  Round trips of the game-record and archive formats.
+
+  python -m unittest test_record
+'''
+import os
+import random
+import tempfile
+import unittest
+from archive import ArchiveWriter, GameArchive, build_archive
+from game import Game
+from record import GameRecord, GameRecordWriter, read_records, HEADER, PLAYER_TYPE_SIZE, TURN
+
+TUNED_SPEC = "heuristic:3.14159,2.71828,1.41421"  # longer than the 16 bytes version 1 records held
+
+
+class PlayerSpecTest(unittest.TestCase):
+
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = os.path.join(directory.name, "games.sgr")
+
+  def _record_games(self, *player_types):
+    '''Play and record one seeded game per (p1 type, p2 type) pair, all in one file'''
+    games = []
+    with GameRecordWriter(self.path) as recorder:
+      for seed, (p1_type, p2_type) in enumerate(player_types):
+        random.seed(seed)
+        game = Game(p1_type, p2_type, False, verbose=False, shared=False)
+        recorder.start_game(p1_type, p2_type)
+        game.attach_recorder(recorder)
+        winner = game.play_to_end()
+        recorder.finish(game.turn_index, str(winner))
+        games.append(game)
+    return games
+
+  def test_header_holds_only_the_specs(self):
+    (game,) = self._record_games(("heuristic", "random"))
+    num_turns = game.turn_index
+    self.assertEqual(os.path.getsize(self.path), HEADER.size + len("heuristicrandom") + num_turns * TURN.size)
+
+  def test_long_spec_round_trips(self):
+    (game,) = self._record_games((TUNED_SPEC, "random"))
+    num_turns = game.turn_index
+    (record,) = read_records(self.path)
+    self.assertEqual((record.p1_type, record.p2_type, len(record)), (TUNED_SPEC, "random", num_turns))
+
+  def test_long_spec_round_trips_through_archive(self):
+    self._record_games((TUNED_SPEC, "random"))
+    archive_path = self.path + ".sga"
+    build_archive(archive_path, read_records(self.path))
+    archive = GameArchive(archive_path)
+    try:
+      self.assertEqual(archive.info(0)[:2], (TUNED_SPEC, "random"))
+    finally:
+      archive.close()
+
+  def test_archive_seeks_past_blocks_of_different_sizes(self):
+    games = self._record_games((TUNED_SPEC, "random"), ("heuristic", "random"), ("random", "random"))
+    archive_path = self.path + ".sga"
+    build_archive(archive_path, read_records(self.path))
+    archive = GameArchive(archive_path)
+    try:
+      for game_number, game in enumerate(games):
+        self.assertEqual(archive.info(game_number)[1:], ("random", str(game.get_winner()), game.turn_index))
+        self.assertEqual(archive.position(game_number, game.turn_index).zobrist_hash, game.zobrist_hash)
+    finally:
+      archive.close()
+
+  def test_too_long_spec_is_rejected(self):
+    with GameRecordWriter(self.path) as recorder:
+      with self.assertRaises(ValueError):
+        recorder.start_game("heuristic:" + "1" * PLAYER_TYPE_SIZE, "random")
+
+  def test_archive_skips_a_rejected_record(self):
+    (game,) = self._record_games(("heuristic", "random"))
+    (record,) = read_records(self.path)
+    archive_path = self.path + ".sga"
+    with ArchiveWriter(archive_path) as writer:
+      with self.assertRaises(ValueError):
+        turns = b"".join(TURN.pack(delta.pack()) for delta in record.deltas())
+        writer.add(GameRecord("heuristic:" + "1" * PLAYER_TYPE_SIZE, "random", record.winner, turns))
+      writer.add(record)
+      self.assertEqual(len(writer), 1)
+    archive = GameArchive(archive_path)
+    try:
+      self.assertEqual(archive.info(0), ("heuristic", "random", record.winner, game.turn_index))
+      self.assertEqual(archive.position(0, game.turn_index).zobrist_hash, game.zobrist_hash)
+    finally:
+      archive.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
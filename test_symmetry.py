@@ -0,0 +1,101 @@
+'''
+  The symmetry-canonical keys the transposition table, the opening book and the endgame table share: a wrong key
+  or a wrong turn code doesn't crash, it hits the wrong entry, so these check them against from-scratch versions.
+
+  python -m unittest test_symmetry
+'''
+import random
+import unittest
+from game import Game
+from geometry import NUM_SQUARES, square_location
+from position import Position
+from save import WORKER_IDS
+from symmetry import (IDENTITY, NUM_TRANSFORMS, TRANSFORMS, CODE_MASK, CODE_TRANSFORMS, action_from_code, canonical_code,
+                      distinct_actions, stabilizer, symmetric_hashes)
+from zobrist import HEIGHT_KEYS, SIDE_KEY, SIDE_WORKER_KEYS, compute_hash
+
+
+def _start_position():
+  return Position.from_game(Game("random", "random", False, verbose=False, shared=False))
+
+def _playout_positions(seed):
+  '''Every position of one random playout from the start, each reached with Position.apply'''
+  rng = random.Random(seed)
+  position = _start_position()
+  positions = [position]
+  while position.winner() is None:
+    position = position.apply(rng.choice(position.legal_actions()))
+    positions.append(position)
+  return positions
+
+def _image(position, t):
+  '''The heights and worker squares of the position's image under transform t'''
+  heights = [0] * NUM_SQUARES
+  for square, level in enumerate(position.heights):
+    heights[TRANSFORMS[t][square]] = level
+  return heights, [TRANSFORMS[t][square] for square in position.squares]
+
+def _label_free_hash(heights, squares, turn_index):
+  '''compute_hash with a side's two workers sharing their keys'''
+  key = SIDE_KEY if turn_index % 2 else 0
+  for square, level in enumerate(heights):
+    key ^= HEIGHT_KEYS[square][level]
+  for worker_index, square in enumerate(squares):
+    key ^= SIDE_WORKER_KEYS[worker_index // 2][square]
+  return key
+
+
+class SymmetricHashTest(unittest.TestCase):
+
+  def test_incremental_hashes_match_from_scratch(self):
+    for seed in range(10):
+      for position in _playout_positions(seed):
+        worker_locations = {worker_id: square_location(square) for worker_id, square in zip(WORKER_IDS, position.squares)}
+        self.assertEqual(position.zobrist_hash, compute_hash(position.heights, worker_locations, position.turn_index))
+        self.assertEqual(position.symmetric_hashes, symmetric_hashes(position.heights, position.squares, position.turn_index))
+        for t in range(NUM_TRANSFORMS):
+          heights, squares = _image(position, t)
+          self.assertEqual(position.symmetric_hashes[t], _label_free_hash(heights, squares, position.turn_index))
+
+  def test_images_share_the_canonical_hash(self):
+    for position in _playout_positions(0)[::5]:
+      for t in range(NUM_TRANSFORMS):
+        heights, squares = _image(position, t)
+        self.assertEqual(Position(heights, squares, position.turn_index).canonical_hash, position.canonical_hash)
+
+
+class TurnCodeTest(unittest.TestCase):
+
+  def test_codes_round_trip_on_asymmetric_positions(self):
+    checked = 0
+    for seed in range(5):
+      for position in _playout_positions(seed):
+        if stabilizer(position.symmetric_hashes):
+          continue
+        for action in position.legal_actions():
+          for t in range(NUM_TRANSFORMS):
+            self.assertEqual(action_from_code(canonical_code(action, t), t, position.squares).pack(), action.pack())
+          self.assertEqual(position.action_from_canonical(position.canonical_code(action)).pack(), action.pack())
+          checked += 1
+    self.assertGreater(checked, 0)
+
+  def test_distinct_actions_cover_every_legal_action(self):
+    start = _start_position()
+    self.assertTrue(stabilizer(start.symmetric_hashes))  # the starting position is symmetric
+    heights = [0] * NUM_SQUARES
+    heights[12] = 2  # the center, which every transform keeps in place
+    for position in (start, Position(heights, start.squares, 0), Position(heights, start.squares, 1)):
+      keys = position.symmetric_hashes
+      actions = position.legal_actions()
+      distinct = distinct_actions(keys, actions)
+      self.assertLess(len(distinct), len(actions))
+      transforms = [IDENTITY] + stabilizer(keys)
+      covered = {CODE_TRANSFORMS[t][action.pack() & CODE_MASK] for action in distinct for t in transforms}
+      self.assertEqual({action.pack() & CODE_MASK for action in actions} - covered, set())
+      # and a turn and its stand-in lead to the same position up to symmetry
+      results = {position.apply(action).canonical_hash for action in distinct}
+      self.assertEqual({position.apply(action).canonical_hash for action in actions}, results)
+
+
+if __name__ == '__main__':
+  unittest.main()
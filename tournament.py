@@ -0,0 +1,297 @@
+'''
+  Tournaments between AI agents: round-robin or Swiss pairings, the games spread over a process pool, Elo ratings
+  with bootstrap confidence intervals at the end.
+  An agent is a player spec as on the command line (heuristic, heuristic:4,1.3,0.5, random, minimax:200, minimax:d3, mcts:100, ...).
+  A pairing plays games_per_pair games with the colors alternating, game k of a pairing seeded with
+  "seed-round-white-blue-k" as in simulate.py, so the schedule and the random players' games are reproducible.
+
+  With a checkpoint path, every finished game is appended to it as one JSON line (the first line describes the
+  tournament). Running the same tournament again with the same checkpoint skips the games already in it, so a long
+  run picks up where it was interrupted; a Swiss run re-derives its earlier rounds' pairings from the stored results.
+'''
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from simulate import AI_PLAYER_TYPES, play_headless_game
+
+INITIAL_RATING = 1500  # the ratings get shifted so their mean is this
+BOOTSTRAP_SAMPLES = 200
+
+
+class CheckpointMismatchError(Exception):
+  '''Raised when a checkpoint file belongs to a different tournament than the one being run'''
+  pass
+
+
+def _play_pairing_game(task):
+  '''Worker-process entry point: play one seeded game, return its result record'''
+  round_index, white, blue, game_index, seed = task
+  random.seed(f"{seed}-{round_index}-{white}-{blue}-{game_index}")
+  winner, num_turns = play_headless_game(white, blue)
+  return {"round": round_index, "white": white, "blue": blue, "index": game_index, "winner": winner, "turns": num_turns}
+
+def _game_key(result):
+  return result["round"], result["white"], result["blue"], result["index"]
+
+def pairing_games(round_index, agent_a, agent_b, games_per_pair):
+  '''The (round, white, blue, game index) of a pairing's games, colors alternating starting with agent_a as white'''
+  return [(round_index,) + ((agent_a, agent_b) if game_index % 2 == 0 else (agent_b, agent_a)) + (game_index,)
+          for game_index in range(games_per_pair)]
+
+def round_robin_pairings(agents):
+  '''Every agent against every other agent once, in a fixed order'''
+  return [(agents[i], agents[j]) for i in range(len(agents)) for j in range(i + 1, len(agents))]
+
+def swiss_pairings(agents, points, met, byes):
+  '''
+    One Swiss round: agents ranked by points (ties by their order in agents), each paired with the best-ranked agent
+    below it that it hasn't met yet (or the next one down if it has met them all). With an odd number of agents the
+    lowest-ranked agent that hasn't had a bye yet sits the round out.
+    Input:
+      points - dict, agent -> games won so far (byes included)
+      met - set of frozenset pairs of agents that already played
+      byes - set of agents that already had a bye
+    Output:
+      tuple(list of (agent, agent), str) - the pairings and the agent with the bye (None for an even number)
+  '''
+  ranked = sorted(agents, key=lambda agent: (-points[agent], agents.index(agent)))
+  bye = None
+  if len(ranked) % 2:
+    bye = next((agent for agent in reversed(ranked) if agent not in byes), ranked[-1])
+    ranked.remove(bye)
+  pairings = []
+  while ranked:
+    agent = ranked.pop(0)
+    opponent = next((other for other in ranked if frozenset((agent, other)) not in met), ranked[0])
+    ranked.remove(opponent)
+    pairings.append((agent, opponent))
+  return pairings, bye
+
+
+class Tournament:
+  '''
+    Schedules the games of a tournament over a process pool and keeps the results (and the checkpoint file).
+    Input:
+      agents - list(str), distinct AI player specs
+      swiss_rounds - int, play this many Swiss rounds instead of a round-robin
+      games_per_pair - int, games per pairing, the colors alternate
+      workers - int, size of the process pool (defaults to the cpu count). 1 plays in-process.
+      seed - int, base seed of the games
+      checkpoint_path - str, the JSON-lines file finished games get appended to and resumed from
+  '''
+
+  def __init__(self, agents, swiss_rounds=None, games_per_pair=2, workers=None, seed=0, checkpoint_path=None):
+    if len(set(agents)) != len(agents) or len(agents) < 2:
+      raise ValueError(f"a tournament needs at least two distinct agents, got {agents}")
+    for agent in agents:
+      if agent.partition(":")[0] not in AI_PLAYER_TYPES:
+        raise ValueError(f"tournament games need AI players, got {agent}")
+    self._agents = list(agents)
+    self._swiss_rounds = swiss_rounds
+    self._games_per_pair = games_per_pair
+    self._workers = workers or os.cpu_count() or 1
+    self._seed = seed
+    self._checkpoint_path = checkpoint_path
+    self._results = {}  # game key -> result record
+    self._checkpoint = None
+    self.games_played = 0  # by this run, not counting the ones resumed from the checkpoint
+
+  def _get_results(self):
+    '''The result records of all finished games, in schedule order'''
+    return [self._results[key] for key in sorted(self._results)]
+  results = property(_get_results)
+
+  def _description(self):
+    return {"agents": self._agents, "swiss_rounds": self._swiss_rounds, "games_per_pair": self._games_per_pair, "seed": self._seed}
+
+  def _open_checkpoint(self):
+    '''Load the games already in the checkpoint file (checking it's this tournament's), and open it for appending'''
+    if os.path.exists(self._checkpoint_path) and os.path.getsize(self._checkpoint_path):
+      with open(self._checkpoint_path, "r+") as file:
+        lines = file.readlines()
+        if json.loads(lines[0]) != self._description():
+          raise CheckpointMismatchError(f"{self._checkpoint_path} holds a different tournament")
+        if not lines[-1].endswith("\n"):  # a line cut short by the interruption, that game gets played again
+          file.truncate(sum(len(line.encode()) for line in lines[:-1]))
+          lines.pop()
+      for line in lines[1:]:
+        result = json.loads(line)
+        self._results[_game_key(result)] = result
+      self._checkpoint = open(self._checkpoint_path, "a")
+    else:
+      self._checkpoint = open(self._checkpoint_path, "w")
+      self._checkpoint.write(json.dumps(self._description()) + "\n")
+      self._checkpoint.flush()
+
+  def _finish_game(self, result):
+    self._results[_game_key(result)] = result
+    self.games_played += 1
+    if self._checkpoint:
+      self._checkpoint.write(json.dumps(result) + "\n")
+      self._checkpoint.flush()
+
+  def _play(self, executor, games):
+    '''Play the games not finished yet, as they complete in the pool'''
+    tasks = [game + (self._seed,) for game in games if game not in self._results]
+    if executor is None:
+      for task in tasks:
+        self._finish_game(_play_pairing_game(task))
+    else:
+      for future in as_completed([executor.submit(_play_pairing_game, task) for task in tasks]):
+        self._finish_game(future.result())
+
+  def run(self):
+    '''
+      Play the whole tournament (what's left of it, with a checkpoint)
+      Output:
+        list(dict) - the result records of all its games: round, white, blue, index, winner (a color), turns
+    '''
+    if self._checkpoint_path:
+      self._open_checkpoint()
+    executor = ProcessPoolExecutor(max_workers=self._workers) if self._workers > 1 else None
+    try:
+      if self._swiss_rounds is None:
+        self._play(executor, [game for agent_a, agent_b in round_robin_pairings(self._agents)
+                              for game in pairing_games(0, agent_a, agent_b, self._games_per_pair)])
+      else:
+        self._play_swiss(executor)
+    finally:
+      if executor is not None:
+        executor.shutdown(cancel_futures=True)
+      if self._checkpoint:
+        self._checkpoint.close()
+        self._checkpoint = None
+    return self.results
+
+  def _play_swiss(self, executor):
+    points = dict.fromkeys(self._agents, 0)
+    met, byes = set(), set()
+    for round_index in range(self._swiss_rounds):
+      pairings, bye = swiss_pairings(self._agents, points, met, byes)
+      if bye is not None:
+        byes.add(bye)
+        points[bye] += self._games_per_pair  # a bye counts as winning the pairing
+      games = [game for agent_a, agent_b in pairings for game in pairing_games(round_index, agent_a, agent_b, self._games_per_pair)]
+      self._play(executor, games)
+      for game in games:
+        result = self._results[game]
+        points[result[result["winner"]]] += 1
+      met.update(frozenset(pairing) for pairing in pairings)
+
+
+def _solve(matrix, vector):
+  '''Solve the linear system matrix x = vector by Gaussian elimination with partial pivoting (a handful of agents)'''
+  size = len(vector)
+  rows = [matrix[i][:] + [vector[i]] for i in range(size)]
+  for column in range(size):
+    pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+    rows[column], rows[pivot] = rows[pivot], rows[column]
+    for row in range(column + 1, size):
+      factor = rows[row][column] / rows[column][column]
+      for k in range(column, size + 1):
+        rows[row][k] -= factor * rows[column][k]
+  solution = [0.0] * size
+  for row in reversed(range(size)):
+    solution[row] = (rows[row][size] - sum(rows[row][k] * solution[k] for k in range(row + 1, size))) / rows[row][row]
+  return solution
+
+def _fit_ratings(agents, wins, prior=0.5):
+  '''
+    The maximum likelihood Elo ratings (Bradley-Terry strengths) of the agents from their head-to-head wins, found
+    with Newton's method on the log strengths. Every agent also gets prior virtual wins and losses against a fixed
+    average opponent, so an agent that never (or always) won still has a finite rating (and the problem stays concave).
+    Input:
+      wins - dict, (agent, opponent) -> number of games agent won against opponent
+    Output:
+      dict - agent -> rating, shifted so the mean is INITIAL_RATING
+  '''
+  index = {agent: i for i, agent in enumerate(agents)}
+  size = len(agents)
+  total_wins = [prior] * size
+  games = [[0] * size for _ in range(size)]
+  for (agent, opponent), count in wins.items():
+    i, j = index[agent], index[opponent]
+    total_wins[i] += count
+    games[i][j] += count
+    games[j][i] += count
+  strengths = [0.0] * size  # natural log of the Bradley-Terry strength, the virtual opponent sits at 0
+  for _ in range(100):
+    gradient = [total_wins[i] - 2 * prior / (1 + math.exp(-strengths[i])) for i in range(size)]
+    hessian = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+      expected = 1 / (1 + math.exp(-strengths[i]))
+      hessian[i][i] = -2 * prior * expected * (1 - expected)
+      for j in range(size):
+        if games[i][j]:
+          expected = 1 / (1 + math.exp(strengths[j] - strengths[i]))
+          gradient[i] -= games[i][j] * expected
+          hessian[i][i] -= games[i][j] * expected * (1 - expected)
+          hessian[i][j] += games[i][j] * expected * (1 - expected)
+    step = _solve(hessian, [-value for value in gradient])
+    largest = max(abs(value) for value in step)
+    if largest > 2:  # damped, far from the optimum the quadratic model overshoots
+      step = [value * 2 / largest for value in step]
+    strengths = [strength + value for strength, value in zip(strengths, step)]
+    if largest < 1e-9:
+      break
+  ratings = [400 * strength / math.log(10) for strength in strengths]
+  shift = INITIAL_RATING - sum(ratings) / size
+  return {agent: ratings[index[agent]] + shift for agent in agents}
+
+def _count_wins(results):
+  wins = {}
+  for result in results:
+    winner = result[result["winner"]]
+    loser = result["blue" if result["winner"] == "white" else "white"]
+    wins[winner, loser] = wins.get((winner, loser), 0) + 1
+  return wins
+
+def elo_ratings(agents, results, samples=BOOTSTRAP_SAMPLES, confidence=0.95, seed=0):
+  '''
+    Elo ratings of the agents with confidence intervals, from bootstrap resamples of the games
+    Input:
+      results - list(dict), result records as returned by Tournament.run
+    Output:
+      dict - agent -> {"rating", "low", "high", "games", "wins"}
+  '''
+  ratings = _fit_ratings(agents, _count_wins(results))
+  rng = random.Random(seed)
+  resampled = {agent: [] for agent in agents}
+  for _ in range(samples if results else 0):
+    sample_ratings = _fit_ratings(agents, _count_wins(rng.choices(results, k=len(results))))
+    for agent in agents:
+      resampled[agent].append(sample_ratings[agent])
+  tail = (1 - confidence) / 2
+  report = {}
+  for agent in agents:
+    sample = sorted(resampled[agent]) or [ratings[agent]]
+    games = [result for result in results if agent in (result["white"], result["blue"])]
+    report[agent] = {"rating": ratings[agent],
+                     "low": sample[int(tail * (len(sample) - 1))], "high": sample[math.ceil((1 - tail) * (len(sample) - 1))],
+                     "games": len(games), "wins": sum(1 for result in games if result[result["winner"]] == agent)}
+  return report
+
+def format_standings(ratings, confidence=0.95):
+  '''The standings printed by `main.py tournament`, best rating first'''
+  width = max(len("agent"), *(len(agent) for agent in ratings))
+  lines = [f"{'agent':{width}s} {'games':>6s} {'wins':>6s} {'score':>7s} {'elo':>6s}  {confidence:.0%} interval"]
+  for agent, stats in sorted(ratings.items(), key=lambda item: -item[1]["rating"]):
+    score = stats["wins"] / stats["games"] if stats["games"] else 0.0
+    lines.append(f"{agent:{width}s} {stats['games']:6d} {stats['wins']:6d} {score:7.1%} {stats['rating']:6.0f}  "
+                 f"[{stats['low']:.0f}, {stats['high']:.0f}]")
+  return "\n".join(lines)
+
+def run_tournament(agents, swiss_rounds=None, games_per_pair=2, workers=None, seed=0, checkpoint_path=None):
+  '''
+    Play a tournament and rate the agents
+    Output:
+      dict - {"ratings": agent -> rating stats (see elo_ratings), "games", "games_played" (by this run), "elapsed_sec"}
+  '''
+  start = time.perf_counter()
+  tournament = Tournament(agents, swiss_rounds, games_per_pair, workers, seed, checkpoint_path)
+  results = tournament.run()
+  return {"ratings": elo_ratings(agents, results, seed=seed), "games": len(results),
+          "games_played": tournament.games_played, "elapsed_sec": time.perf_counter() - start}
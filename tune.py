@@ -0,0 +1,150 @@
+'''
+  Tunes HeuristicPlayer's (height, center, distance) weights by self-play with SPSA (simultaneous perturbation
+  stochastic approximation). Every iteration perturbs all three weights at once by a random +-c_k, plays the two
+  perturbed weight sets against each other for a batch of headless games (a process pool, no printing), and steps
+  the weights toward whichever side won more, scaled by a_k. Each game is played twice with the same seed and the
+  colors swapped, so luck mostly cancels out between the two sides.
+  The move score only ranks moves, so scaling all weights by a positive factor changes nothing: the weights are
+  kept at the same total magnitude as the defaults (3 + 2 + 1) after every step.
+
+  The result is the average of the second half of the iterates, validated against the default weights over a
+  separate set of games, with a 95% Wilson interval on the win rate.
+
+  python tune.py [--iterations 100] [--games 100] [--validation-games 2000] [--workers N] [--seed 0] [--output weights.json]
+'''
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from evaluation import DEFAULT_WEIGHTS, format_weights
+from simulate import play_headless_game
+
+
+def _play_games(task):
+  '''Worker-process entry point: play a chunk of seeded games, return how many white won'''
+  white, blue, game_seeds = task
+  white_wins = 0
+  for game_seed in game_seeds:
+    random.seed(game_seed)
+    white_wins += play_headless_game(white, blue)[0] == "white"
+  return white_wins
+
+def _normalize(weights):
+  '''Rescale to the total magnitude of the default weights, which doesn't change the move HeuristicPlayer picks'''
+  scale = sum(abs(weight) for weight in DEFAULT_WEIGHTS) / (sum(abs(weight) for weight in weights) or 1.0)
+  return tuple(weight * scale for weight in weights)
+
+def wilson_interval(wins, games, z=1.96):
+  '''The 95% (for the default z) Wilson score interval of a win rate'''
+  if not games:
+    return 0.0, 1.0
+  rate = wins / games
+  center = (rate + z * z / (2 * games)) / (1 + z * z / games)
+  margin = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+  return center - margin, center + margin
+
+
+class WeightTuner:
+  '''
+    SPSA over the heuristic weights, the games spread over a process pool
+    Input:
+      games - int, games per iteration, half with each weight set as white
+      workers - int, size of the process pool (defaults to the cpu count). 1 plays in-process.
+      seed - int, base seed of the perturbations and the games
+      step, perturbation - the a and c of the SPSA gain sequences a / (k + 1 + A)^0.602 and c / (k + 1)^0.101
+  '''
+
+  def __init__(self, games=100, workers=None, seed=0, step=4.0, perturbation=0.5):
+    self._games = games
+    self._workers = workers or os.cpu_count() or 1
+    self._seed = seed
+    self._step = step
+    self._perturbation = perturbation
+    self._executor = None
+    self.games_played = 0
+
+  def _win_rate(self, weights, opponent, label):
+    '''
+      The win rate of heuristic with weights against opponent (a weight set) over self._games games: each game seed
+      of the iteration gets played twice, once with each color
+    '''
+    player, rival = f"heuristic:{format_weights(weights)}", f"heuristic:{format_weights(opponent)}"
+    return self._match(player, rival, [f"{self._seed}-{label}-{game_index}" for game_index in range(self._games // 2)])
+
+  def _match(self, player, rival, game_seeds):
+    chunk_size = max(1, -(-len(game_seeds) // (self._workers * 2)))
+    chunks = [game_seeds[first:first + chunk_size] for first in range(0, len(game_seeds), chunk_size)]
+    tasks = [(player, rival, chunk) for chunk in chunks] + [(rival, player, chunk) for chunk in chunks]
+    if self._executor is None:
+      white_wins = [_play_games(task) for task in tasks]
+    else:
+      white_wins = list(self._executor.map(_play_games, tasks))
+    games = 2 * len(game_seeds)
+    self.games_played += games
+    return (sum(white_wins[:len(chunks)]) + len(game_seeds) - sum(white_wins[len(chunks):])) / games
+
+  def tune(self, iterations=100, weights=DEFAULT_WEIGHTS, validation_games=2000, verbose=False):
+    '''
+      Run SPSA from weights, then validate the result against the default weights
+      Output:
+        dict - {"weights", "spec", "validation": {"opponent", "games", "wins", "win_rate", "low", "high"},
+                "history": per-iteration {"weights", "win_rate" (the + side against the - side)}, "games_played", "elapsed_sec"}
+    '''
+    start = time.perf_counter()
+    rng = random.Random(f"{self._seed}-perturbations")
+    weights = _normalize(tuple(float(weight) for weight in weights))
+    history = []
+    self._executor = ProcessPoolExecutor(max_workers=self._workers) if self._workers > 1 else None
+    try:
+      for k in range(iterations):
+        step = self._step / (k + 1 + iterations / 10) ** 0.602
+        perturbation = self._perturbation / (k + 1) ** 0.101
+        signs = [rng.choice((-1, 1)) for _ in weights]
+        plus = tuple(weight + perturbation * sign for weight, sign in zip(weights, signs))
+        minus = tuple(weight - perturbation * sign for weight, sign in zip(weights, signs))
+        win_rate = self._win_rate(plus, minus, k)  # the - side's win rate is 1 - win_rate
+        weights = _normalize(tuple(weight + step * (2 * win_rate - 1) / (2 * perturbation * sign)
+                                   for weight, sign in zip(weights, signs)))
+        history.append({"weights": weights, "win_rate": win_rate})
+        if verbose:
+          print(f"iteration {k}: +{format_weights(plus)} scored {win_rate:.1%} against -{format_weights(minus)}, "
+                f"now {format_weights(weights)}")
+      tail = history[len(history) // 2:] or [{"weights": weights}]
+      best = _normalize(tuple(sum(entry["weights"][i] for entry in tail) / len(tail) for i in range(len(weights))))
+      best = tuple(round(weight, 3) for weight in best)
+      spec = f"heuristic:{format_weights(best)}"
+      opponent = f"heuristic:{format_weights(DEFAULT_WEIGHTS)}"
+      win_rate = self._match(spec, opponent, [f"{self._seed}-validation-{game_index}" for game_index in range(validation_games // 2)])
+    finally:
+      if self._executor is not None:
+        self._executor.shutdown()
+        self._executor = None
+    games = validation_games // 2 * 2
+    wins = round(win_rate * games)
+    low, high = wilson_interval(wins, games)
+    return {"weights": best, "spec": spec,
+            "validation": {"opponent": opponent, "games": games, "wins": wins, "win_rate": win_rate, "low": low, "high": high},
+            "history": history, "games_played": self.games_played, "elapsed_sec": time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Tune the heuristic weights by self-play (SPSA).")
+  parser.add_argument("--iterations", type=int, default=100)
+  parser.add_argument("--games", type=int, default=100, help="games per iteration, both colors")
+  parser.add_argument("--validation-games", type=int, default=2000, help="games of the result against the default weights")
+  parser.add_argument("--workers", type=int, default=None, help="process pool size (default: cpu count)")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--output", help="write the result, with its evidence and the iterates, to this JSON file")
+  options = parser.parse_args()
+
+  report = WeightTuner(options.games, options.workers, options.seed).tune(options.iterations, validation_games=options.validation_games, verbose=True)
+  validation = report["validation"]
+  print(f"best weights {report['spec']}: {validation['wins']}/{validation['games']} wins ({validation['win_rate']:.1%}, "
+        f"95% interval {validation['low']:.1%}-{validation['high']:.1%}) against {validation['opponent']}")
+  print(f"{report['games_played']} games in {report['elapsed_sec']:.0f}s")
+  if options.output:
+    with open(options.output, "w") as file:
+      json.dump(report, file, indent=2)
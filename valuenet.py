@@ -0,0 +1,257 @@
+'''
+  Batched evaluators: score every candidate turn of a position in one call, on one encoded (N, NUM_FEATURES) array.
+  ValuePlayer asks an evaluator for the scores of all its legal turns at once and plays the best one, so the Python
+  overhead is paid once per turn instead of once per candidate.
+
+  Each candidate is encoded as the position after the turn, from the point of view of the side that just moved:
+    [0:3]     own (height, center, distance) move-score components, as HeuristicPlayer computes them
+    [3:6]     the opponent's components
+    [6]       1 if one of the own workers stands on level 3 (the turn wins)
+    [7:132]   the 25 heights one-hot, 5 levels per square
+    [132:157] the squares of the own workers, [157:182] the squares of the opponent's workers
+  Two evaluators ship: LinearEvaluator (the heuristic's weighted components, one matrix-vector product) and
+  MLPEvaluator, a one-hidden-layer NumPy network predicting the mover's chance to win, trained offline from self-play
+  records. The trained weights live in value_net.npz next to this module.
+
+  python main.py simulate heuristic heuristic 5000 --record selfplay.sgr
+  python valuenet.py train selfplay.sgr [more.sgr ...] [--output value_net.npz] [--hidden 64] [--epochs 30]
+'''
+import argparse
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+from evaluation import DEFAULT_WEIGHTS
+from game import Game
+from geometry import NUM_SQUARES, CENTER_WEIGHTS, DISTANCES, square_index
+from position import Position
+from record import read_records
+from save import WORKER_IDS
+
+NUM_LEVELS = 5  # heights 0-3 and the dome
+COMPONENTS = slice(0, 3)
+OPPONENT_COMPONENTS = slice(3, 6)
+WINNING = 6
+HEIGHT_PLANES = slice(7, 7 + NUM_SQUARES * NUM_LEVELS)
+OWN_WORKERS = slice(HEIGHT_PLANES.stop, HEIGHT_PLANES.stop + NUM_SQUARES)
+OPPONENT_WORKERS = slice(OWN_WORKERS.stop, OWN_WORKERS.stop + NUM_SQUARES)
+NUM_FEATURES = OPPONENT_WORKERS.stop
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "value_net.npz")
+
+CENTER_ARRAY = np.array(CENTER_WEIGHTS, dtype=np.float32)
+DISTANCE_ARRAY = np.array(DISTANCES, dtype=np.float32)
+WORKER_INDEX = {worker_id: index for index, worker_id in enumerate(WORKER_IDS)}
+
+
+def _components(heights, own, opponents):
+  '''The (N, 3) components of the workers own (N, 2) against opponents (N, 2), heights (N, 25)'''
+  rows = np.arange(len(heights))[:, None]
+  height = heights[rows, own].sum(axis=1)
+  center = CENTER_ARRAY[own].sum(axis=1)
+  nearest = np.minimum(DISTANCE_ARRAY[opponents, own[:, :1]], DISTANCE_ARRAY[opponents, own[:, 1:]])  # (N, 2)
+  return np.stack([height, center, 8 - nearest.sum(axis=1)], axis=1)
+
+def encode_candidates(position, actions):
+  '''
+    Encode the positions after each of the turns, all at once
+    Input:
+      position - Position, the side to move is the one playing the turns
+      actions - list(TurnDelta), legal turns of that side
+    Output:
+      np.ndarray - (len(actions), NUM_FEATURES) float32
+  '''
+  count = len(actions)
+  rows = np.arange(count)
+  moved = np.fromiter((WORKER_INDEX[action.worker_id] for action in actions), dtype=np.intp, count=count)
+  to_squares = np.fromiter((square_index(action.to_location) for action in actions), dtype=np.intp, count=count)
+  build_squares = np.fromiter((square_index(action.build_location) for action in actions), dtype=np.intp, count=count)
+
+  heights = np.tile(np.frombuffer(position.heights, dtype=np.uint8).astype(np.intp), (count, 1))
+  heights[rows, build_squares] += 1
+  squares = np.tile(np.array(position.squares, dtype=np.intp), (count, 1))
+  squares[rows, moved] = to_squares
+  side = position.side
+  own, opponents = squares[:, 2 * side:2 * side + 2], squares[:, 2 - 2 * side:4 - 2 * side]
+
+  features = np.zeros((count, NUM_FEATURES), dtype=np.float32)
+  features[:, COMPONENTS] = _components(heights, own, opponents)
+  features[:, OPPONENT_COMPONENTS] = _components(heights, opponents, own)
+  features[:, WINNING] = (heights[rows[:, None], own] == 3).any(axis=1)
+  features[:, HEIGHT_PLANES] = (heights[:, :, None] == np.arange(NUM_LEVELS)).reshape(count, -1)
+  features[rows[:, None], OWN_WORKERS.start + own] = 1
+  features[rows[:, None], OPPONENT_WORKERS.start + opponents] = 1
+  return features
+
+
+class BatchEvaluator(ABC):
+  '''Scores a whole batch of encoded candidates in one call, higher is better for the side that just moved'''
+
+  @abstractmethod
+  def evaluate(self, features):
+    '''
+      Input:
+        features - np.ndarray, (N, NUM_FEATURES) as built by encode_candidates
+      Output:
+        np.ndarray - (N,) scores
+    '''
+    pass
+
+  def score_actions(self, position, actions):
+    '''The scores of the turns of the side to move, one encode and one evaluate for all of them'''
+    return self.evaluate(encode_candidates(position, actions))
+
+
+class LinearEvaluator(BatchEvaluator):
+  '''A weighted sum of the features, the whole batch in one matrix-vector product'''
+
+  def __init__(self, weights):
+    self._weights = np.asarray(weights, dtype=np.float32)
+
+  @classmethod
+  def from_heuristic(cls, weights=DEFAULT_WEIGHTS):
+    '''HeuristicPlayer's move score: the weighted own components after the turn, nothing else'''
+    vector = np.zeros(NUM_FEATURES, dtype=np.float32)
+    vector[COMPONENTS] = weights
+    return cls(vector)
+
+  def evaluate(self, features):
+    return features @ self._weights
+
+
+class MLPEvaluator(BatchEvaluator):
+  '''
+    A one-hidden-layer ReLU network giving the logit of the mover's chance to win. The inputs are standardized with
+    the training set's mean and standard deviation, folded into the first layer when the model is built.
+  '''
+
+  def __init__(self, hidden_weights, hidden_bias, output_weights, output_bias, mean, std):
+    self._mean = np.asarray(mean, dtype=np.float32)
+    self._std = np.asarray(std, dtype=np.float32)
+    self._hidden_weights = np.asarray(hidden_weights, dtype=np.float32)
+    self._hidden_bias = np.asarray(hidden_bias, dtype=np.float32)
+    self._output_weights = np.asarray(output_weights, dtype=np.float32)
+    self._output_bias = np.float32(output_bias)
+    # (x - mean) / std @ W + b == x @ (W / std) + (b - mean / std @ W): one matrix multiply on the raw features
+    self._folded_weights = self._hidden_weights / self._std[:, None]
+    self._folded_bias = self._hidden_bias - (self._mean / self._std) @ self._hidden_weights
+
+  def evaluate(self, features):
+    hidden = np.maximum(features @ self._folded_weights + self._folded_bias, 0)
+    return hidden @ self._output_weights + self._output_bias
+
+  def win_probability(self, features):
+    return 1 / (1 + np.exp(-self.evaluate(features)))
+
+  def save(self, path):
+    np.savez(path, hidden_weights=self._hidden_weights, hidden_bias=self._hidden_bias, output_weights=self._output_weights,
+             output_bias=self._output_bias, mean=self._mean, std=self._std)
+
+  @classmethod
+  def load(cls, path):
+    with np.load(path, allow_pickle=False) as arrays:
+      if arrays["hidden_weights"].shape[0] != NUM_FEATURES:
+        raise ValueError(f"{path} was trained on {arrays['hidden_weights'].shape[0]} features, not {NUM_FEATURES}")
+      return cls(arrays["hidden_weights"], arrays["hidden_bias"], arrays["output_weights"], arrays["output_bias"],
+                 arrays["mean"], arrays["std"])
+
+
+_default_model = None
+
+def load_default_model():
+  '''The network shipped next to this module (loaded once)'''
+  global _default_model
+  if _default_model is None:
+    _default_model = MLPEvaluator.load(DEFAULT_MODEL_PATH)
+  return _default_model
+
+
+def training_samples(records):
+  '''
+    The encoded position after every turn of the finished records, labeled 1 if the side that played the turn won
+    Output:
+      tuple(np.ndarray (N, NUM_FEATURES), np.ndarray (N,), np.ndarray (N,) the index of the game each sample is from)
+  '''
+  start = Position.from_game(Game("random", "random", False, verbose=False, shared=False))
+  features, labels, games = [], [], []
+  for game_index, record in enumerate(records):
+    if record.winner is None:
+      continue
+    position = start
+    for delta in record.deltas():
+      features.append(encode_candidates(position, [delta]))
+      labels.append(("white", "blue")[position.side] == record.winner)
+      games.append(game_index)
+      position = position.apply(delta)
+  return np.concatenate(features), np.array(labels, dtype=np.float32), np.array(games)
+
+def train_mlp(features, labels, hidden=64, epochs=30, batch_size=256, learning_rate=1e-3, l2=1e-4, seed=0, verbose=False):
+  '''
+    Fit an MLPEvaluator to the samples with Adam on the logistic loss
+    Output:
+      MLPEvaluator
+  '''
+  rng = np.random.default_rng(seed)
+  mean = features.mean(axis=0)
+  std = features.std(axis=0) + 1e-3  # constant features (never-reached heights) stay finite
+  inputs = (features - mean) / std
+  parameters = [rng.normal(0, np.sqrt(2 / NUM_FEATURES), (NUM_FEATURES, hidden)).astype(np.float32),
+                np.zeros(hidden, dtype=np.float32),
+                rng.normal(0, np.sqrt(1 / hidden), hidden).astype(np.float32),
+                np.zeros((), dtype=np.float32)]
+  moments = [np.zeros_like(parameter) for parameter in parameters]
+  velocities = [np.zeros_like(parameter) for parameter in parameters]
+  step = 0
+  for epoch in range(epochs):
+    order = rng.permutation(len(inputs))
+    loss = 0.0
+    for first in range(0, len(order), batch_size):
+      batch = order[first:first + batch_size]
+      x, y = inputs[batch], labels[batch]
+      pre_activation = x @ parameters[0] + parameters[1]
+      activation = np.maximum(pre_activation, 0)
+      logits = activation @ parameters[2] + parameters[3]
+      probabilities = 1 / (1 + np.exp(-logits))
+      loss += float(np.sum(np.logaddexp(0, logits) - y * logits))
+      error = (probabilities - y) / len(batch)  # d loss / d logits
+      hidden_error = np.outer(error, parameters[2]) * (pre_activation > 0)
+      gradients = [x.T @ hidden_error + l2 * parameters[0], hidden_error.sum(axis=0),
+                   activation.T @ error + l2 * parameters[2], error.sum()]
+      step += 1
+      for parameter, gradient, moment, velocity in zip(parameters, gradients, moments, velocities):
+        moment *= 0.9
+        moment += 0.1 * gradient
+        velocity *= 0.999
+        velocity += 0.001 * gradient * gradient
+        parameter -= learning_rate * (moment / (1 - 0.9 ** step)) / (np.sqrt(velocity / (1 - 0.999 ** step)) + 1e-8)
+    if verbose:
+      print(f"epoch {epoch}: loss {loss / len(inputs):.4f}")
+  return MLPEvaluator(parameters[0], parameters[1], parameters[2], parameters[3], mean, std)
+
+def accuracy(evaluator, features, labels):
+  '''The fraction of samples whose winner the evaluator's score sign gets right'''
+  return float(np.mean((evaluator.evaluate(features) > 0) == (labels > 0.5)))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Train the value network from self-play game records.")
+  subcommands = parser.add_subparsers(dest="command", required=True)
+  train_parser = subcommands.add_parser("train", help="fit the network to the finished games of record files")
+  train_parser.add_argument("records", nargs="+")
+  train_parser.add_argument("--output", default=DEFAULT_MODEL_PATH)
+  train_parser.add_argument("--hidden", type=int, default=64)
+  train_parser.add_argument("--epochs", type=int, default=30)
+  train_parser.add_argument("--seed", type=int, default=0)
+  options = parser.parse_args()
+
+  start = time.perf_counter()
+  records = [record for path in options.records for record in read_records(path)]
+  random.Random(options.seed).shuffle(records)
+  features, labels, games = training_samples(records)
+  held_out = games >= len(records) * 0.9  # the last tenth of the games, never trained on
+  print(f"{len(labels)} positions from {len(records)} games, {held_out.sum()} held out")
+  model = train_mlp(features[~held_out], labels[~held_out], options.hidden, options.epochs, seed=options.seed, verbose=True)
+  print(f"held-out accuracy {accuracy(model, features[held_out], labels[held_out]):.1%}, "
+        f"train accuracy {accuracy(model, features[~held_out], labels[~held_out]):.1%}")
+  model.save(options.output)
+  print(f"written to {options.output} in {time.perf_counter() - start:.0f}s")
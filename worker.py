@@ -1,51 +1,76 @@
 from game import Game
+from geometry import DIRECTION_DELTAS, DIRECTION_INDICES, NEIGHBOR_SQUARES, SQUARE_LOCATIONS, DIRECTION_BITS, DIRECTION_SETS, square_index
+
+# LEGAL_MOVE_PAIRS[worker_id][direction set]: the (worker_id, direction) pairs of a direction set (see geometry.py),
+# built once so listing a worker's legal moves hands out a shared tuple instead of building a list every turn.
+LEGAL_MOVE_PAIRS = {worker_id: tuple(tuple((worker_id, direction) for direction in directions) for directions in DIRECTION_SETS)
+                    for worker_id in "ABYZ"}
 
 class Worker():
   '''The worker that the player controls.'''
-  
-  WORKER_MOVES = {'n': (-1, 0),  
-                  'ne': (-1, 1), 
-                  'e': (0, 1), 
-                  'se': (1, 1), 
-                  's': (1, 0), 
-                  'sw': (1, -1), 
-                  'w': (0, -1),    # all available build/move directions.
-                  'nw': (-1, -1)}  # key: direction, value: (deltaRow, deltaCol) s.t. delta means change.
+  __slots__ = ("_id", "_game", "_current_location", "_square", "_move_pairs")
+
+  WORKER_MOVES = DIRECTION_DELTAS  # all available build/move directions. key: direction, value: (deltaRow, deltaCol) s.t. delta means change.
 
-  def __init__(self, worker_id, start_location):
+  def __init__(self, worker_id, start_location, game=None):
     self._id = worker_id
+    self._game = game if game is not None else Game.get_instance()  # the game this worker plays in (defaults to the singleton)
     self._current_location = start_location  # worker's location on the board, a tuple of 2 ints
-    Game.get_instance().update_worker_location(self._id, self._current_location)  # notify the game instance about the change.
+    self._square = square_index(start_location)  # the same location as a square index 0-24, for the table lookups
+    self._move_pairs = LEGAL_MOVE_PAIRS[worker_id]
+    self._game.update_worker_location(self._id, self._current_location)  # notify the game instance about the change.
+
+  def _get_location(self):
+    '''The getter method that returns the worker's current (row, col) location'''
+    return self._current_location
+  location = property(_get_location)
+
+  def _get_square(self):
+    '''The getter method that returns the worker's current location as a square index 0-24'''
+    return self._square
+  square = property(_get_square)
 
-  def _calculate_move(self, location_delta):
+  def _calculate_move(self, direction):
     '''
-      Compute the resulting location from changing the worker's location by location_delta on the board
+      Compute the resulting square from stepping the worker one square in direction, looked up in the geometry tables
       Not actually moving the worker
       Input:
-        location_delta - tuple(int, int), the change in index applied to the current location (row_id, col_id)
+        direction - str, a direction that stays on the board from the current location
       Output:
-        tuple(int, int) - The resulting location from the change.
+        int - The resulting square index (SQUARE_LOCATIONS has its shared (row, col) tuple).
     '''
-    return (self._current_location[0] + location_delta[0], self._current_location[1] + location_delta[1])
-  
+    return NEIGHBOR_SQUARES[self._square][DIRECTION_INDICES[direction]]
+
+  def legal_directions(self, action):
+    '''
+      The legal directions of this worker as a direction set, an 8-bit int (bit i is DIRECTIONS[i])
+      Input:
+        action - str, 'build' for building on and 'move' for moving into
+    '''
+    board = self._game.board
+    legal_mask = board.legal_move_mask(self._square) if action == "move" else board.legal_build_mask(self._square)
+    return DIRECTION_BITS[self._square][legal_mask]
+
   def find_legal_moves(self, action):
     '''
       Enumerate all possible moves of this worker object and find the legal ones
       Input:
         action - str, 'build' for building on and 'move' for moving into
       Output:
-        list[str] - legal movement moves from the current worker's position
+        tuple(str) - legal movement moves from the current worker's position, a shared read-only tuple
       NOTE: if you can move, you can definitely build, since you can at least build on
       the location you just left from, which has to be a valid buildable location.
     '''
-    legal_moves = []
-    for direction, location_delta in Worker.WORKER_MOVES.items():
-      new_location = self._calculate_move(location_delta)
-      if Game.get_instance().check_new_location_validity(self._current_location, new_location, action):
-        legal_moves.append(direction)
-        
-    return legal_moves
-  
+    return DIRECTION_SETS[self.legal_directions(action)]
+
+  def legal_move_pairs(self):
+    '''The legal moves as (worker_id, direction) pairs, a shared read-only tuple'''
+    return self._move_pairs[self.legal_directions("move")]
+
+  def has_legal_move(self):
+    '''Whether the worker can move anywhere at all, without listing the moves'''
+    return self._game.board.legal_move_mask(self._square) != 0
+
   def on_winning_position(self):
     '''
       Check if the worker is on a level 3 building.
@@ -54,8 +79,8 @@ class Worker():
       Output:
         Boolean - whether the worker is on a level 3 building
     '''
-    return Game.get_instance().game_state[self._current_location[0]][self._current_location[1]] == 3
-  
+    return self._game.board.height(self._square) == 3
+
   def move(self, direction):
     '''
       Move the worker in the given direction and update its location
@@ -68,10 +93,12 @@ class Worker():
     '''
     old_location = self._current_location
     if isinstance(direction, str):  # represents direction
-      self._current_location = self._calculate_move(self.WORKER_MOVES[direction])
+      self._square = self._calculate_move(direction)
+      self._current_location = SQUARE_LOCATIONS[self._square]
     else:  # represents new location tuple(int, int)
       self._current_location = direction  # better denoted as new_location
-    Game.get_instance().update_worker_location(self._id, self._current_location)  # notify the game instance about the change.
+      self._square = square_index(direction)
+    self._game.update_worker_location(self._id, self._current_location)  # notify the game instance about the change.
     return old_location
 
   def build(self, direction):
@@ -80,6 +107,6 @@ class Worker():
       Input:
         str - a LEGAL direction for the worker to build on
     '''
-    build_location = self._calculate_move(self.WORKER_MOVES[direction])
-    Game.get_instance().game_state[build_location[0]][build_location[1]] += 1  # build!
-      
+    build_location = SQUARE_LOCATIONS[self._calculate_move(direction)]
+    self._game.add_building_level(build_location)  # build!
+
@@ -0,0 +1,100 @@
+'''
+  Zobrist hashing of game positions, plus a bounded transposition table keyed by those hashes.
+  A position's hash is the XOR of one random 64-bit key per (square, height), per (worker, square), and one more
+  when blue is to move. Game keeps its hash up to date incrementally as workers move and build.
+'''
+import random
+from board import DOME_LEVEL
+from geometry import NUM_SQUARES, square_index
+
+_key_generator = random.Random(0x5A7021)  # fixed seed: hashes are stable across processes and runs, so they can go into files
+HEIGHT_KEYS = tuple(tuple(0 if level == 0 else _key_generator.getrandbits(64) for level in range(DOME_LEVEL + 1))
+                    for _ in range(NUM_SQUARES))  # HEIGHT_KEYS[square][level], level 0 is 0 so the empty board hashes to 0
+WORKER_KEYS = {worker_id: tuple(_key_generator.getrandbits(64) for _ in range(NUM_SQUARES)) for worker_id in "ABYZ"}
+SIDE_KEY = _key_generator.getrandbits(64)  # XORed in when it's blue's turn
+# SIDE_WORKER_KEYS[side][square]: a worker of side on square, whichever of the two it is, for the hashes that ignore
+# worker labels (see symmetry.py); drawn after the keys above so those stay the same
+SIDE_WORKER_KEYS = tuple(tuple(_key_generator.getrandbits(64) for _ in range(NUM_SQUARES)) for _ in range(2))
+
+
+def compute_hash(heights, worker_locations, turn_index):
+  '''
+    Hash a position from scratch (Game maintains it incrementally, this is for restores and checks)
+    Input:
+      heights - the 25 square heights
+      worker_locations - dict, worker id -> (row, col)
+      turn_index - int, the number of turns played (its parity is the side to move)
+  '''
+  key = 0
+  for square, level in enumerate(heights):
+    key ^= HEIGHT_KEYS[square][level]
+  for worker_id, location in worker_locations.items():
+    key ^= WORKER_KEYS[worker_id][square_index(location)]
+  return key ^ SIDE_KEY if turn_index % 2 else key
+
+
+# the kind of score a TranspositionTable entry holds
+EXACT = 0
+LOWER_BOUND = 1  # the search failed high, the true score is at least this
+UPPER_BOUND = 2  # the search failed low, the true score is at most this
+
+class TranspositionTable:
+  '''
+    A fixed-size table of search results, indexed by the low bits of the position hash.
+    Replacement is depth-preferred: a slot is only overwritten by a search at least as deep,
+    unless the stored entry is left over from an older search (generation), which always gets replaced.
+    Entries are tuples (depth, score, flag, move), the move being whatever the caller wants to try first next time.
+  '''
+
+  def __init__(self, size_bits=16):
+    self._mask = (1 << size_bits) - 1
+    self._keys = [None] * (1 << size_bits)
+    self._entries = [None] * (1 << size_bits)
+    self._generations = [0] * (1 << size_bits)
+    self._generation = 0
+    self.probes = 0
+    self.hits = 0
+    self.stores = 0
+    self.overwrites = 0  # stores that evicted a different position
+
+  def new_search(self):
+    '''Age the current entries: they stay usable, but any new result may replace them'''
+    self._generation += 1
+
+  def probe(self, key):
+    '''The (depth, score, flag, move) stored for the position hash key, or None'''
+    self.probes += 1
+    slot = key & self._mask
+    if self._keys[slot] == key:
+      self.hits += 1
+      return self._entries[slot]
+    return None
+
+  def store(self, key, depth, score, flag, move):
+    '''Remember a search result for the position hash key, if the slot's current occupant may be replaced'''
+    slot = key & self._mask
+    stored_key = self._keys[slot]
+    if stored_key is not None and stored_key != key and self._generations[slot] == self._generation \
+        and self._entries[slot][0] > depth:
+      return  # keep the deeper result of this search
+    if stored_key is not None and stored_key != key:
+      self.overwrites += 1
+    self.stores += 1
+    self._keys[slot] = key
+    self._entries[slot] = (depth, score, flag, move)
+    self._generations[slot] = self._generation
+
+  def clear(self):
+    self._keys = [None] * len(self._keys)
+    self._entries = [None] * len(self._entries)
+    self._generations = [0] * len(self._generations)
+
+  def _get_hit_rate(self):
+    return self.hits / self.probes if self.probes else 0.0
+  hit_rate = property(_get_hit_rate)
+
+  def __len__(self):
+    return sum(1 for key in self._keys if key is not None)
+
+  def __str__(self):
+    return f"{len(self)}/{len(self._keys)} entries, {self.probes} probes, hit rate {self.hit_rate:.1%}, {self.overwrites} overwrites"